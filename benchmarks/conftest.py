@@ -0,0 +1,57 @@
+import os
+import tracemalloc
+import pytest
+from synthetic import write_mgf, write_mzmine_table
+
+
+PATH_DATA = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'qe_qtof_coanalysis')
+
+
+def pytest_collection_modifyitems(items):
+    for item in items:
+        item.add_marker(pytest.mark.bench)
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmark a function: time with pytest-benchmark, peak memory (tracemalloc) in extra_info"""
+    def run(function, *args, rounds = 3, **kwargs):
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info['peak_memory_mb'] = round(peak / 2**20, 2)
+        return benchmark.pedantic(function, args=args, kwargs=kwargs, rounds=rounds, iterations=1)
+    return run
+
+@pytest.fixture(scope='session')
+def mgf_factory(tmp_path_factory):
+    """Path to a synthetic .mgf file of n_spectra spectra of n_peaks peaks, generated once per session"""
+    paths = {}
+    def factory(n_spectra, n_peaks):
+        if (n_spectra, n_peaks) not in paths:
+            path = tmp_path_factory.mktemp('mgf') / f"spectra_{n_spectra}_{n_peaks}.mgf"
+            paths[(n_spectra, n_peaks)] = str(write_mgf(path, n_spectra, n_peaks))
+        return paths[(n_spectra, n_peaks)]
+    return factory
+
+@pytest.fixture(scope='session')
+def table_factory(tmp_path_factory):
+    """Path to a synthetic MzMine 2 feature table, generated once per session"""
+    paths = {}
+    def factory(n_samples, n_features):
+        if (n_samples, n_features) not in paths:
+            path = tmp_path_factory.mktemp('tables') / f"table_{n_samples}_{n_features}.csv"
+            paths[(n_samples, n_features)] = str(write_mzmine_table(path, n_samples, n_features))
+        return paths[(n_samples, n_features)]
+    return factory
+
+@pytest.fixture(scope='session')
+def qtof_data():
+    """Spectra and feature table of the bundled qe_qtof_coanalysis data set"""
+    spectra = os.path.join(PATH_DATA, 'qtof_spectra_nogapF.mgf')
+    table = os.path.join(PATH_DATA, 'qtof_quant_nogapF.csv')
+    if not (os.path.exists(spectra) and os.path.exists(table)):
+        pytest.skip("qe_qtof_coanalysis data set not available")
+    return spectra, table
@@ -0,0 +1,68 @@
+"""Generators of synthetic spectra files, feature tables and MEMO matrices for the benchmarks."""
+import numpy as np
+import pandas as pd
+
+
+def write_mgf(path, n_spectra, n_peaks, seed = 0):
+    """Write a .mgf file of random spectra
+
+    Args:
+        path (str): path of the file
+        n_spectra (int): number of spectra, with SCANS 1 to n_spectra
+        n_peaks (int): number of peaks per spectrum
+        seed (int): random seed
+
+    Returns:
+        path (str): path of the file
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, 'w', encoding='utf8') as handle:
+        for scan in range(1, n_spectra + 1):
+            precursor_mz = rng.uniform(150, 1200)
+            mz = np.sort(rng.uniform(50, precursor_mz, n_peaks).round(4))
+            intensities = rng.lognormal(10, 2, n_peaks).round(1)
+            handle.write(f"BEGIN IONS\nSCANS={scan}\nPEPMASS={precursor_mz:.4f}\nCHARGE=1\n")
+            handle.write(''.join(f"{m}\t{i}\n" for m, i in zip(mz, intensities)))
+            handle.write("END IONS\n\n")
+    return path
+
+def write_mzmine_table(path, n_samples, n_features, density = 0.3, seed = 0):
+    """Write a feature table in the MzMine 2 format
+
+    Args:
+        path (str): path of the file
+        n_samples (int): number of samples
+        n_features (int): number of features, with row ID 1 to n_features
+        density (float): proportion of the features detected in each sample
+        seed (int): random seed
+
+    Returns:
+        path (str): path of the file
+    """
+    rng = np.random.default_rng(seed)
+    areas = rng.lognormal(12, 2, (n_features, n_samples)) * (rng.random((n_features, n_samples)) < density)
+    table = pd.DataFrame(areas, columns=[f"sample_{i}.mzML Peak area" for i in range(n_samples)])
+    table.insert(0, 'row m/z', rng.uniform(150, 1200, n_features).round(4))
+    table.insert(0, 'row ID', np.arange(1, n_features + 1))
+    table.to_csv(path, index=False)
+    return path
+
+def memo_matrix(n_samples, n_words, density = 0.05, seed = 0) -> pd.DataFrame:
+    """Random MEMO matrix
+
+    Args:
+        n_samples (int): number of samples
+        n_words (int): number of words
+        density (float): proportion of non-zero counts
+        seed (int): random seed
+
+    Returns:
+        memo_matrix (DataFrame): samples x words counts
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(2, (n_samples, n_words)) * (rng.random((n_samples, n_words)) < density)
+    return pd.DataFrame(
+        counts.astype(float),
+        index=pd.Index([f"sample_{i}" for i in range(n_samples)], name='filename'),
+        columns=[f"peak@{50 + i / 100:.2f}" for i in range(n_words)]
+        )
@@ -0,0 +1,31 @@
+"""Analysis stages: pairwise distances and principal coordinates analysis"""
+import pytest
+import scipy.spatial.distance
+from memo_ms import distances, ordination, sparse
+from synthetic import memo_matrix
+
+pytest.importorskip("pytest_benchmark")
+
+SIZES = [(500, 20000), (1500, 20000)]
+
+
+@pytest.mark.parametrize('n_samples, n_words', SIZES)
+@pytest.mark.parametrize('metric', ['braycurtis', 'jaccard', 'cosine'])
+def test_pdist_sparse(measure, n_samples, n_words, metric):
+    table = sparse.from_dense(memo_matrix(n_samples, n_words))
+    dm = measure(distances.pdist, table, metric)
+    assert dm.size == n_samples * (n_samples - 1) // 2
+
+@pytest.mark.parametrize('n_samples, n_words', SIZES[:1])
+@pytest.mark.parametrize('metric', ['braycurtis', 'jaccard', 'cosine'])
+def test_pdist_scipy(measure, n_samples, n_words, metric):
+    dense = memo_matrix(n_samples, n_words).to_numpy()
+    dm = measure(scipy.spatial.distance.pdist, dense, metric, rounds=1)
+    assert dm.size == n_samples * (n_samples - 1) // 2
+
+@pytest.mark.parametrize('n_samples, n_words', SIZES)
+@pytest.mark.parametrize('method', ordination.METHODS[:3])
+def test_pcoa(measure, n_samples, n_words, method):
+    dm = distances.pdist(memo_matrix(n_samples, n_words))
+    results = measure(ordination.pcoa, dm, n_components=3, method=method)
+    assert results.samples.shape == (n_samples, 3)
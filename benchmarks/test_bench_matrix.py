@@ -0,0 +1,61 @@
+"""MEMO matrix stages: building the matrix from aligned samples, filtering, merging"""
+import numpy as np
+import pytest
+from memo_ms import sparse
+from memo_ms.classes import FeatureTable, MemoMatrix, SpectraDocuments, filter_table, merge_memos
+from synthetic import memo_matrix
+
+pytest.importorskip("pytest_benchmark")
+
+TABLE_SIZES = [(50, 2000), (200, 5000)]
+MATRIX_SIZES = [(200, 20000), (1000, 20000)]
+
+
+@pytest.mark.parametrize('n_samples, n_features', TABLE_SIZES)
+def test_import_feature_table(measure, table_factory, n_samples, n_features):
+    table = measure(FeatureTable, table_factory(n_samples, n_features), software='mzmine')
+    assert table.feature_table.shape == (n_samples, n_features)
+
+@pytest.mark.parametrize('n_samples, n_features', TABLE_SIZES)
+@pytest.mark.parametrize('sparse_matrix', [False, True])
+def test_memo_from_aligned_samples(measure, mgf_factory, table_factory, n_samples, n_features, sparse_matrix):
+    feature_table = FeatureTable(table_factory(n_samples, n_features), software='mzmine')
+    spectra = SpectraDocuments(mgf_factory(n_features, 50), min_peaks_required=1, keep_spectra=False, engine='numpy')
+    def build():
+        matrix = MemoMatrix(sparse=sparse_matrix)
+        matrix.memo_from_aligned_samples(feature_table, spectra)
+        return matrix
+    assert measure(build).memo_matrix.shape[0] == n_samples
+
+@pytest.mark.parametrize('n_samples, n_words', MATRIX_SIZES)
+@pytest.mark.parametrize('sparse_matrix', [False, True])
+def test_filter_table(measure, n_samples, n_words, sparse_matrix):
+    table = memo_matrix(n_samples, n_words)
+    if sparse_matrix:
+        table = sparse.from_dense(table)
+    filtered = measure(
+        filter_table, table, use_samples_pattern=True, samples_pattern='sample_1', max_occurence=2,
+        min_rel_occurence=0.01, max_rel_occurence=0.9
+        )
+    assert filtered.shape[0] < n_samples
+
+@pytest.mark.parametrize('n_samples, n_words', MATRIX_SIZES[:1])
+def test_merge_memo(measure, n_samples, n_words):
+    left, right = MemoMatrix(), MemoMatrix()
+    left.memo_matrix = memo_matrix(n_samples, n_words, seed=1)
+    right.memo_matrix = memo_matrix(n_samples, n_words, seed=2).rename(index=lambda name: name + '_2')
+    merged = measure(left.merge_memo, right)
+    assert merged.memo_matrix.shape[0] == 2 * n_samples
+
+@pytest.mark.parametrize('n_matrices', [5, 20])
+@pytest.mark.parametrize('sparse_matrix', [False, True])
+def test_merge_memos(measure, n_matrices, sparse_matrix):
+    memo_matrices = []
+    for seed in range(n_matrices):
+        table = memo_matrix(100, 5000, seed=seed).rename(index=lambda name, seed=seed: f"{name}_{seed}")
+        table.columns = table.columns[np.random.default_rng(seed).permutation(len(table.columns))]
+        matrix = MemoMatrix(sparse=sparse_matrix)
+        matrix.memo_matrix = sparse.from_dense(table) if sparse_matrix else table
+        memo_matrices.append(matrix)
+    merged = measure(merge_memos, memo_matrices)
+    assert merged.memo_matrix.shape == (100 * n_matrices, 5000)
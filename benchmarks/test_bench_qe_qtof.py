@@ -0,0 +1,44 @@
+"""End to end MEMO pipeline on the bundled qe_qtof_coanalysis data set"""
+import pytest
+from memo_ms import distances, ordination
+from memo_ms.classes import FeatureTable, MemoMatrix, SpectraDocuments
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(scope='module')
+def qtof_memo(qtof_data):
+    spectra, table = qtof_data
+    memo_matrix = MemoMatrix()
+    memo_matrix.memo_from_aligned_samples(FeatureTable(table, software='mzmine'), SpectraDocuments(spectra, engine='numpy'))
+    return memo_matrix
+
+@pytest.mark.parametrize('engine', ['matchms', 'numpy'])
+def test_qtof_spectra_documents(measure, qtof_data, engine):
+    spectra, _ = qtof_data
+    documents = measure(SpectraDocuments, spectra, keep_spectra=False, engine=engine, rounds=1)
+    assert len(documents.document) > 0
+
+def test_qtof_feature_table(measure, qtof_data):
+    _, table = qtof_data
+    assert len(measure(FeatureTable, table, software='mzmine').feature_table) > 0
+
+@pytest.mark.parametrize('sparse_matrix', [False, True])
+def test_qtof_memo_from_aligned_samples(measure, qtof_data, sparse_matrix):
+    spectra, table = qtof_data
+    feature_table = FeatureTable(table, software='mzmine')
+    documents = SpectraDocuments(spectra, keep_spectra=False, engine='numpy')
+    def build():
+        memo_matrix = MemoMatrix(sparse=sparse_matrix)
+        memo_matrix.memo_from_aligned_samples(feature_table, documents)
+        return memo_matrix
+    assert measure(build).memo_matrix.shape[0] > 0
+
+def test_qtof_filter(measure, qtof_memo):
+    filtered = measure(qtof_memo.filter, use_samples_pattern=True, samples_pattern='Blank', max_occurence=0)
+    assert filtered.memo_matrix.shape[1] <= qtof_memo.memo_matrix.shape[1]
+
+def test_qtof_pcoa(measure, qtof_memo):
+    def analysis():
+        return ordination.pcoa(distances.pdist(qtof_memo.memo_matrix), n_components=3, method='eigsh')
+    assert measure(analysis).samples.shape[1] == 3
@@ -0,0 +1,34 @@
+"""Spectra import stages: parsing and filtering the .mgf file, translating spectra into documents"""
+import pytest
+from memo_ms import import_data, mgf
+from memo_ms.classes import SpectraDocuments
+
+pytest.importorskip("pytest_benchmark")
+
+FILTERS = {
+    'min_relative_intensity': 0.01, 'max_relative_intensity': 1, 'loss_mz_from': 10, 'loss_mz_to': 200, 'n_required': 1
+    }
+SIZES = [(1000, 50), (5000, 50), (1000, 500)]
+
+
+@pytest.mark.parametrize('n_spectra, n_peaks', SIZES)
+def test_load_and_filter_matchms(measure, mgf_factory, n_spectra, n_peaks):
+    path = mgf_factory(n_spectra, n_peaks)
+    spectra = measure(import_data.load_and_filter_from_mgf, path, **FILTERS)
+    assert len(spectra) == n_spectra
+
+@pytest.mark.parametrize('n_spectra, n_peaks', SIZES)
+@pytest.mark.parametrize('word_encoding', ['string', 'binned'])
+def test_spectra_words_numpy(measure, mgf_factory, n_spectra, n_peaks, word_encoding):
+    path = mgf_factory(n_spectra, n_peaks)
+    records = measure(
+        lambda: list(mgf.iter_spectra_words(path, n_decimals=2, word_encoding=word_encoding, **FILTERS))
+        )
+    assert len(records) == n_spectra
+
+@pytest.mark.parametrize('n_spectra, n_peaks', SIZES[:2])
+@pytest.mark.parametrize('engine', ['matchms', 'numpy'])
+def test_spectra_documents(measure, mgf_factory, n_spectra, n_peaks, engine):
+    path = mgf_factory(n_spectra, n_peaks)
+    spectra = measure(SpectraDocuments, path, min_peaks_required=1, keep_spectra=False, engine=engine)
+    assert len(spectra.document) == n_spectra
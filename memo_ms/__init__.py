@@ -1,16 +1,50 @@
+import importlib
+from . import cache
+from . import distances
+from . import export_data
 from . import import_data
-from . import visualization
+from . import instrumentation
+from . import mgf
+from . import ondisk
+from . import parallel
+from . import sweep
+from . import words
+from . import sparse
 from .__version__ import __version__
 from .classes import SpectraDocuments
 from .classes import FeatureTable
 from .classes import MemoMatrix
+from .classes import merge_memos
+from .sweep import parameter_sweep
+
+# modules depending on slow to import plotting/statistics packages are imported on first use
+_LAZY_MODULES = ("ordination", "visualization")
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
     "__version__",
+    "cache",
+    "distances",
+    "export_data",
     "import_data",
+    "instrumentation",
+    "mgf",
+    "ondisk",
+    "ordination",
+    "parallel",
+    "sweep",
+    "words",
+    "sparse",
     "visualization",
     "SpectraDocuments",
     "FeatureTable",
-    "MemoMatrix"
+    "MemoMatrix",
+    "merge_memos",
+    "parameter_sweep"
 ]
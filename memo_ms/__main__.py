@@ -0,0 +1,4 @@
+import sys
+from memo_ms.cli import main
+
+sys.exit(main())
@@ -0,0 +1,197 @@
+"""Persistent cache of SpectraDocuments.document tables.
+
+Entries are compressed .npz files named after a key combining the spectra file content hash and the
+parameters used to build the documents, so unchanged inputs are loaded without parsing the spectra again.
+The least recently used entries are removed when the cache directory grows over its maximal size.
+Entries are read without pickle: numeric metadata columns are stored as arrays, the others as JSON.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+from memo_ms import sparse
+
+CACHE_VERSION = 2
+
+
+def file_hash(path, chunksize = 2**20) -> str:
+    """Hash the content of a file
+
+    Args:
+        path (str): path to the file
+        chunksize (int): number of bytes read at once
+
+    Returns:
+        digest (str): hexadecimal blake2b digest of the file content
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunksize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_key(path, parameters) -> str:
+    """Key of a cache entry
+
+    Args:
+        path (str): path to the spectra file (.mgf)
+        parameters (dict): parameters used to build the documents
+
+    Returns:
+        key (str): the cache key
+    """
+    parameters = json.dumps({'version': CACHE_VERSION, **parameters}, sort_keys=True)
+    digest = hashlib.blake2b(parameters.encode('utf8'), digest_size=20)
+    return f"{file_hash(path)}_{digest.hexdigest()}"
+
+def _to_json(value):
+    # JSON has no tuples (e.g. matchms pepmass) nor NumPy scalars
+    if isinstance(value, tuple):
+        return {'tuple': [_to_json(item) for item in value]}
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _from_json(value):
+    if isinstance(value, dict) and list(value) == ['tuple']:
+        return tuple(_from_json(item) for item in value['tuple'])
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    return value
+
+def metadata_to_arrays(metadata) -> dict:
+    """Arrays of a metadata table which can be saved in a .npz file without pickle
+
+    Args:
+        metadata (DataFrame): metadata of the spectra documents
+
+    Returns:
+        arrays (dict): {name: ndarray}, numeric and boolean columns as arrays, the other columns and the
+            description of the table as a JSON string. Raises TypeError for values which are not JSON serializable.
+    """
+    arrays = {'metadata_index': sparse.index_to_array(metadata.index)}
+    columns = []
+    for position, (name, column) in enumerate(metadata.items()):
+        if column.dtype.kind in 'biuf':
+            arrays[f"metadata_{position}"] = column.to_numpy()
+            columns.append({'name': name, 'values': None})
+        else:
+            columns.append({'name': name, 'values': [_to_json(value) for value in column]})
+    description = {'index_name': metadata.index.name, 'columns': columns}
+    arrays['metadata'] = np.asarray(json.dumps(description, allow_nan=True))
+    return arrays
+
+def metadata_from_arrays(arrays) -> pd.DataFrame:
+    """Metadata table saved with metadata_to_arrays
+
+    Args:
+        arrays (mapping): {name: ndarray}, e.g. an opened .npz file
+
+    Returns:
+        metadata (DataFrame): the metadata table
+    """
+    description = json.loads(arrays['metadata'].item())
+    index = sparse.index_from_array(arrays['metadata_index'], description['index_name'])
+    data = {}
+    for position, column in enumerate(description['columns']):
+        if column['values'] is None:
+            data[column['name']] = arrays[f"metadata_{position}"]
+        else:
+            data[column['name']] = pd.Series([_from_json(value) for value in column['values']], index=index, dtype=object)
+    return pd.DataFrame(data, index=index, columns=[column['name'] for column in description['columns']])
+
+def load(cache_dir, key):
+    """Load a document table from the cache
+
+    Args:
+        cache_dir (str): cache directory
+        key (str): cache key
+
+    Returns:
+        document (DataFrame): the cached table, None if the key is not in the cache
+    """
+    entry = os.path.join(cache_dir, key + '.npz')
+    try:
+        with np.load(entry, allow_pickle=False) as arrays:
+            lengths = arrays['lengths']
+            flat_words = arrays['words']
+            document = metadata_from_arrays(arrays)
+    except FileNotFoundError:
+        return None
+    os.utime(entry)  # used as last access time for the eviction
+    documents = np.split(flat_words, np.cumsum(lengths)[:-1]) if len(lengths) > 0 else []
+    if flat_words.dtype.kind == 'U':
+        documents = [words.tolist() for words in documents]
+    document['documents'] = documents
+    return document
+
+def save(cache_dir, key, document, max_size = None):
+    """Save a document table in the cache, then evict the least recently used entries above max_size
+
+    Args:
+        cache_dir (str): cache directory, created if needed
+        key (str): cache key
+        document (DataFrame): a SpectraDocuments.document table
+        max_size (int): maximal size of the cache directory in bytes, no eviction if None
+
+    Returns:
+        None
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    documents = document['documents']
+    lengths = documents.map(len).to_numpy(dtype=np.int64)
+    if len(documents) > 0 and isinstance(documents.iloc[0], np.ndarray):
+        flat_words = np.concatenate(documents.to_list()).astype(np.int64)
+    else:
+        flat_words = np.array([word for doc in documents for word in doc], dtype=str)
+    try:
+        metadata = metadata_to_arrays(document.drop(columns='documents'))
+    except TypeError as error:
+        warnings.warn(f"spectra documents not cached, their metadata cannot be saved without pickle: {error}")
+        return
+    handle, temporary = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as output:
+        np.savez_compressed(output, lengths=lengths, words=flat_words, **metadata)
+    os.replace(temporary, os.path.join(cache_dir, key + '.npz'))
+    if max_size is not None:
+        evict(cache_dir, max_size)
+
+def evict(cache_dir, max_size):
+    """Remove the least recently used entries until the cache directory is at most max_size bytes.
+    The most recently used entry is always kept.
+
+    Args:
+        cache_dir (str): cache directory
+        max_size (int): maximal size in bytes
+
+    Returns:
+        removed (list of str): the removed entries
+    """
+    entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.npz')]
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    removed = []
+    total = 0
+    for entry in entries:
+        total += entry.stat().st_size
+        if total > max_size and entry is not entries[0]:
+            os.remove(entry.path)
+            removed.append(entry.path)
+    return removed
+
+def clear(cache_dir):
+    """Remove all entries of a cache directory
+
+    Args:
+        cache_dir (str): cache directory
+
+    Returns:
+        None
+    """
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.npz'):
+            os.remove(entry.path)
@@ -1,43 +1,149 @@
 from dataclasses import dataclass, field
 from collections import Counter
-from spec2vec import SpectrumDocument
 import pandas as pd
 import numpy as np
+from memo_ms import cache
+from memo_ms import export_data
 from memo_ms import import_data
+from memo_ms import instrumentation
+from memo_ms import mgf
+from memo_ms import ondisk
+from memo_ms import parallel
+from memo_ms import sparse
 from tqdm import tqdm
 import os
 import copy
+import json
+import tempfile
+from functools import partial
 
 #pylint: disable=too-many-arguments
-def filter_table(table, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0, max_rel_occurence = 1):
-    
+def filter_table(table, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0, max_rel_occurence = 1,
+                 disk_dir = None):
+    with instrumentation.stage('filter_table', samples_in=table.shape[0], columns_in=table.shape[1]) as record:
+        if isinstance(table, ondisk.DiskMatrix):
+            table_filtered = ondisk.filter_table(table, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence, path=disk_dir)
+        else:
+            table_filtered = _filter_table(table, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence)
+        record.count(samples_out=table_filtered.shape[0], columns_out=table_filtered.shape[1])
+    return table_filtered
+
+def _filter_table(table, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence):
+    if isinstance(table, sparse.SparseTable):
+        return sparse.filter_table(table, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence)
     if use_samples_pattern:
-        table_matched = table[table.index.str.contains(samples_pattern, case = False)]
-        matched_samples = list(table_matched.index)
-        table_matched = table_matched.loc[:, (table_matched != 0).any(axis=0)]
-        count_null = table_matched.replace(0, np.nan).isnull().sum()
-        
+        matched = np.asarray(table.index.str.contains(samples_pattern, case = False), dtype=bool)
+        keep_columns = np.ones(table.shape[1], dtype=bool)
         if max_occurence is not None:
-            excluded_features = count_null[count_null < (len(table_matched)-max_occurence)].index
-            table_filtered = table.drop(excluded_features, axis=1)
-        else: 
-            table_filtered = table
-        
-        table_filtered = table_filtered.drop(matched_samples, axis=0)
-        table_filtered = table_filtered.astype(float)
-        table_filtered = table_filtered.loc[:, (table_filtered != 0).any(axis=0)]    
+            keep_columns = occurences(table, rows=matched) <= max_occurence
+        # columns first: pandas stores the values column-wise, so the row selection then only copies the output
+        table_filtered = table.iloc[:, np.flatnonzero(keep_columns)].iloc[np.flatnonzero(~matched)].astype(float, copy=False)
+        # columns left empty by the removal of the matched samples are dropped, missing values count as non-zero
+        non_zero = occurences(table_filtered, count_missing=True) > 0
+        if not non_zero.all():
+            table_filtered = table_filtered.iloc[:, np.flatnonzero(non_zero)]
     else:
-        table_filtered = table.replace(0, np.nan)
-        len_table = len(table_filtered)
+        occurence = occurences(table)
+        len_table = len(table)
         min_rel = min_rel_occurence*len_table
         max_rel = max_rel_occurence*len_table
-        table_filtered = table_filtered.loc[:, table_filtered.count(axis=0) <= max_rel]
-        table_filtered = table_filtered.loc[:, table_filtered.count(axis=0) >= min_rel]
-        table_filtered = table_filtered.fillna(0).astype(float)
-    
+        table_filtered = table.iloc[:, np.flatnonzero((occurence <= max_rel) & (occurence >= min_rel))]
+        table_filtered = table_filtered.astype(float, copy=False)
+        if table_filtered.isna().to_numpy().any():
+            table_filtered = table_filtered.fillna(0)
     return table_filtered
-        
-           
+
+def occurences(table, rows = None, count_missing = False, block_size = None) -> np.ndarray:
+    """Count in how many samples each column of a dense table is non-zero, going through the table by blocks of rows
+
+    Args:
+        table (DataFrame): A samples x features (or words) table
+        rows (ndarray of bool): Restrict the count to these rows, all if None
+        count_missing (bool): Count missing values (NaN) as non-zero
+        block_size (int): Number of rows processed at once, blocks of about 4M values if None
+
+    Returns:
+        occurences (ndarray): Number of samples with a non-zero value, per column
+    """
+    values = table.to_numpy()
+    n_rows, n_columns = values.shape
+    if block_size is None:
+        block_size = max(1, 2**22 // max(n_columns, 1))
+    rows = np.ones(n_rows, dtype=bool) if rows is None else np.asarray(rows, dtype=bool)
+    # few rows are gathered, otherwise all the rows are read by contiguous blocks and the others masked out
+    positions = np.flatnonzero(rows) if rows.sum() < n_rows / 2 else None
+    n_blocks = n_rows if positions is None else len(positions)
+    counts = np.zeros(n_columns, dtype=np.int64)
+    for start in range(0, n_blocks, block_size):
+        if positions is None:
+            block = values[start:start + block_size]
+        else:
+            block = values[positions[start:start + block_size]]
+        present = block != 0
+        if not count_missing:
+            present &= ~pd.isna(block)
+        if positions is None and not rows[start:start + block_size].all():
+            present = present[rows[start:start + block_size]]
+        counts += present.sum(axis=0)
+    return counts
+
+
+def find_sample_files(path_to_samples_dir, pattern_to_match = '.mgf') -> list:
+    """List the spectra files to use in MemoMatrix.memo_from_unaligned_samples.
+    Subfolders are also checked, a file name found twice is only used once.
+
+    Args:
+        path_to_samples_dir (str): Path to the directory where individual .mgf files are gathered
+        pattern_to_match (str): Shared pattern between all spectra files to input
+
+    Returns:
+        sample_files (list of tuple): (path, file name) of the spectra files, in os.walk order
+    """
+    sample_files = []
+    files_counted = set()  # Keep track of files already counted
+    for (root, _, files) in os.walk(path_to_samples_dir, topdown=True):
+        for file in files:
+            if file.endswith(pattern_to_match) and file not in files_counted:
+                files_counted.add(file)
+                sample_files.append((os.path.join(root, file), file))
+    return sample_files
+
+
+def count_words_from_mgf(path, min_relative_intensity = 0.01, max_relative_intensity = 1.00, min_peaks_required = 10,
+    losses_from = 10, losses_to = 200, n_decimals = 2, engine = 'matchms', word_encoding = 'string') -> dict:
+    """Count the peaks/losses words of all spectra in a .mgf file, i.e. one row of an unaligned MEMO matrix
+
+    Args:
+        path (str): Path to spectra file (.mgf)
+        Other arguments: see MemoMatrix.memo_from_unaligned_samples
+
+    Returns:
+        documents (dict): {word: count}
+    """
+    words = import_data.iter_spectra_words(
+        path = path, min_relative_intensity = min_relative_intensity,
+        max_relative_intensity = max_relative_intensity, loss_mz_from = losses_from, loss_mz_to = losses_to, n_required = min_peaks_required,
+        n_decimals = n_decimals, engine = engine, word_encoding = word_encoding
+        )
+    documents = Counter()
+    for _, spectrum_words in words:
+        documents.update(spectrum_words.tolist() if word_encoding == 'binned' else spectrum_words)
+    return dict(documents)
+
+
+def _count_sample_files(sample_files, pattern_to_match, n_jobs = 1, executor = None, **parameters) -> dict:
+    """Count the words of (path, file name) sample files, see MemoMatrix.memo_from_unaligned_samples
+
+    Returns:
+        dic_memo (dict): {sample name: {word: count}}, in sample_files order
+    """
+    count_words = partial(count_words_from_mgf, **parameters)
+    paths = [path for path, _ in sample_files]
+    with instrumentation.stage('count_sample_files', files=len(paths)), parallel.pool(n_jobs, executor) as pool:
+        counts = list(tqdm(pool.map(count_words, paths), total=len(paths)))
+    return {file.replace(pattern_to_match, ''): documents for (_, file), documents in zip(sample_files, counts)}
+
+
 @dataclass
 class SpectraDocuments:
     """Create a SpectraDocuments dataclass object containing spectra documents and metadata
@@ -51,6 +157,19 @@ class SpectraDocuments:
         losses_from (int): minimal m/z value for losses
         losses_to (int): maximal m/z value for losses
         n_decimals (int): number of decimal when translating peaks/losses into words
+        keep_spectra (bool): Keep the filtered matchms spectra in self.spectra. If False, the spectra file is streamed
+            one spectrum at a time and self.spectra is None.
+        engine (str): One of [matchms, numpy]: import and filter spectra with matchms or with the built-in NumPy parser.
+            The numpy engine is faster, gives the same documents, and never keeps spectra (self.spectra is None).
+        word_encoding (str): One of [string, binned]: documents as "peak@xx.xx" strings or as integer word ids
+            (see memo_ms.words), which are much lighter to count and store
+        cache_dir (str): If not None, directory of a persistent cache (see memo_ms.cache): documents built from the same
+            spectra file content and parameters are loaded from it instead of parsing the file again.
+            self.spectra is None when the documents are loaded from the cache.
+        max_cache_size (int): maximal size of cache_dir in bytes, least recently used entries are removed above it
+        peak_store (mgf.PeakStore): If not None, the spectra of path already parsed with mgf.read_peak_store: the
+            documents are derived from it with the numpy engine filters instead of reading path again, e.g. to try
+            several parameters (see memo_ms.sweep). self.spectra is None.
 
     Returns:
         self.document (DataFrame): A table containing spectra documents and metadata
@@ -62,26 +181,79 @@ class SpectraDocuments:
     losses_from : int = 10
     losses_to : int = 200
     n_decimals : int = 2
+    keep_spectra : bool = True
+    engine : str = 'matchms'
+    word_encoding : str = 'string'
+    cache_dir : str = None
+    max_cache_size : int = None
+    peak_store : mgf.PeakStore = field(default=None, repr=False)
     spectra : list = field(init=False)
     document : pd.DataFrame = field(init=False)
 
     def __post_init__(self):
-        self.spectra = import_data.load_and_filter_from_mgf(
-            path = self.path,  min_relative_intensity = self.min_relative_intensity,
-            max_relative_intensity = self.max_relative_intensity, loss_mz_from = self.losses_from,
-            loss_mz_to = self.losses_to, n_required = self.min_peaks_required
-            )
+        with instrumentation.stage('SpectraDocuments') as record:
+            self._load()
+            if instrumentation.enabled():  # counting the words is a pass over all the documents
+                record.count(spectra=len(self.document), words=self.document['documents'].map(len).sum())
+
+    def _load(self):
+        if self.cache_dir is not None:
+            with instrumentation.stage('SpectraDocuments.cache_load'):
+                key = cache.cache_key(self.path, self._parameters())
+                self.document = cache.load(self.cache_dir, key)
+            if self.document is not None:
+                self.spectra = None
+                return
+        if self.keep_spectra and self.engine == 'matchms' and self.peak_store is None:
+            self.spectra = import_data.load_and_filter_from_mgf(
+                path = self.path,  min_relative_intensity = self.min_relative_intensity,
+                max_relative_intensity = self.max_relative_intensity, loss_mz_from = self.losses_from,
+                loss_mz_to = self.losses_to, n_required = self.min_peaks_required
+                )
+        else:
+            self.spectra = None
         self.document = self._spec2doc()
+        if self.cache_dir is not None:
+            with instrumentation.stage('SpectraDocuments.cache_save'):
+                cache.save(self.cache_dir, key, self.document, max_size = self.max_cache_size)
+
+    def _parameters(self) -> dict:
+        """Parameters changing the document table, used as cache key"""
+        return {
+            'min_relative_intensity': self.min_relative_intensity, 'max_relative_intensity': self.max_relative_intensity,
+            'min_peaks_required': self.min_peaks_required, 'losses_from': self.losses_from, 'losses_to': self.losses_to,
+            'n_decimals': self.n_decimals, 'engine': self.engine, 'word_encoding': self.word_encoding
+            }
 
     def _spec2doc(self) -> pd.DataFrame:
         """
         Apply filters to spectra and convert them to words vectors with the number of specified decimals.
         Returns a pd.DataFrame with spectra "documents" and metadata.
         """
-        documents = [SpectrumDocument(s, n_decimals=self.n_decimals) for s in self.spectra]
-        doc_with_meta = pd.DataFrame(s.metadata for s in self.spectra)
-        doc_with_meta['documents'] = list(doc.words for doc in documents)
-        doc_with_meta.scans = doc_with_meta.scans.astype(int)
+        if self.peak_store is not None:
+            records = self.peak_store.iter_spectra_words(
+                self.min_relative_intensity, self.max_relative_intensity, self.losses_from, self.losses_to,
+                self.min_peaks_required, self.n_decimals, self.word_encoding
+                )
+        elif self.spectra is not None:
+            records = ((s.metadata, import_data.spectrum_words(s, self.n_decimals, self.word_encoding)) for s in self.spectra)
+            records = instrumentation.timed(records, 'import_data.spectra_words', count='spectra', words=lambda record: len(record[1]))
+        else:
+            records = import_data.iter_spectra_words(
+                path = self.path,  min_relative_intensity = self.min_relative_intensity,
+                max_relative_intensity = self.max_relative_intensity, loss_mz_from = self.losses_from,
+                loss_mz_to = self.losses_to, n_required = self.min_peaks_required, n_decimals = self.n_decimals,
+                engine = self.engine, word_encoding = self.word_encoding
+                )
+        metadata = []
+        documents = []
+        for spectrum_metadata, words in records:
+            metadata.append(spectrum_metadata)
+            documents.append(words)
+        with instrumentation.stage('SpectraDocuments.build_table', spectra=len(documents)):
+            doc_with_meta = pd.DataFrame(metadata)
+            doc_with_meta['documents'] = documents
+            doc_with_meta.scans = doc_with_meta.scans.astype(int)
         return doc_with_meta
 
 
@@ -91,28 +263,40 @@ class FeatureTable:
 
     Args:
         path (str): Path to a feature table file (.csv)
-        software (str): One of [mzmine, xcms, msdial, memo]: the software used for feature detection.
+        software (str): One of [mzmine, xcms, msdial, memo, matrix]: the software used for feature detection,
+            or matrix for a table exported with FeatureTable.export_matrix (.csv, .parquet, .feather, .npz or memmap directory)
+        dtype (numpy dtype): If not None, only the quantification columns are read, by chunks of features, into
+            a table of this dtype: float32 halves the memory used, bool only keeps the presence of the features,
+            which is all memo_from_aligned_samples uses (see import_data.read_quant_table). Not used for matrix.
+        chunksize (int): number of features read at once when dtype is not None, about 1M values if None
 
     Returns:
         self.feature_table (DataFrame): A cleaned feature quantification table
     """
     path : str
     software : str
+    dtype : object = None
+    chunksize : int = None
     feature_table : pd.DataFrame = field(init=False)
 
     def __post_init__(self):
-        if self.software == 'mzmine':
-            self.feature_table = import_data.import_mzmine2_quant_table(path = self.path)
-        elif self.software == 'xcms':
-            self.feature_table = import_data.import_xcms_quant_table(path = self.path)
-        elif self.software == 'msdial':
-            self.feature_table = import_data.import_msdial_quant_table(path = self.path)
-        elif self.software == 'memo':
-            self.feature_table = import_data.import_memo_quant_table(path = self.path)
-        else:
-            raise ValueError("software argument missing, choose one of the currently supported pre-processing softwares: [mzmine, xcms, msdial]")
+        with instrumentation.stage('FeatureTable') as record:
+            if self.software == 'mzmine':
+                self.feature_table = import_data.import_mzmine2_quant_table(path = self.path, dtype = self.dtype, chunksize = self.chunksize)
+            elif self.software == 'xcms':
+                self.feature_table = import_data.import_xcms_quant_table(path = self.path, dtype = self.dtype, chunksize = self.chunksize)
+            elif self.software == 'msdial':
+                self.feature_table = import_data.import_msdial_quant_table(path = self.path, dtype = self.dtype, chunksize = self.chunksize)
+            elif self.software == 'memo':
+                self.feature_table = import_data.import_memo_quant_table(path = self.path, dtype = self.dtype, chunksize = self.chunksize)
+            elif self.software == 'matrix':
+                self.feature_table = import_data.import_matrix(path = self.path, dense = True)
+            else:
+                raise ValueError("software argument missing, choose one of the currently supported pre-processing softwares: [mzmine, xcms, msdial]")
+            record.count(samples=self.feature_table.shape[0], features=self.feature_table.shape[1])
         
-    def filter(self, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0, max_rel_occurence = 1):
+    def filter(self, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0, max_rel_occurence = 1,
+               inplace = False):
         """Filter a feature table: remove samples matching samples_pattern
         AND remove features occuring in more than n = max_occurence samples matched by samples_pattern
 
@@ -122,30 +306,50 @@ class FeatureTable:
             max_occurence (int): maximal number of occurence allowed in matched samples before removing a feature
             min_rel_occurence (float): remove features contained in less than (min_rel_occurence * 100) percent of the samples
             max_rel_occurence (float): remove features contained in more than (max_rel_occurence * 100) percent of the samples
+            inplace (bool): replace self.feature_table by the filtered table and return None
 
         Returns:
-            self.filtered_feature_table (DataFrame): A filtered feature table
+            FeatureTable (FeatureTable): A FeatureTable with the filtered feature table, only built from the kept
+                samples and features. None if inplace is True.
         """
-        output = copy.deepcopy(self)
-        output.feature_table = filter_table(output.feature_table, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence)            
+        feature_table = filter_table(self.feature_table, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence)
+        if inplace:
+            self.feature_table = feature_table
+            return None
+        output = copy.copy(self)
+        output.feature_table = feature_table
         return output
     
-    def export_matrix(self, path, sep = ','):
+    def export_matrix(self, path, sep = ',', file_format = None):
         """Export a given matrix
 
         Args:
             path (str): path to export
-            sep (str): separator
+            sep (str): separator, for csv files
+            file_format (str): One of [csv, parquet, feather, npz, memmap]. Defaults to the path extension, csv if unknown.
 
         Returns:
             None
         """   
-        self.feature_table.to_csv(path, sep=sep)
+        export_data.export_table(self.feature_table, path, sep=sep, file_format=file_format)
     
 @dataclass
 class MemoMatrix:
     """Create an empty MemoMatrix dataclass object
+
+    Args:
+        sparse (bool): Store the MEMO matrix as a sparse.SparseTable instead of a dense DataFrame.
+            Use memo_matrix.to_dense() to get the DataFrame back.
     """
+    sparse : bool = False
+
+    def _set_matrix(self, table):
+        if self.sparse:
+            self.memo_matrix = table
+        else:
+            with instrumentation.stage('MemoMatrix.to_dense', samples=table.shape[0], words=table.shape[1]):
+                self.memo_matrix = table.to_dense()
+
     def memo_from_aligned_samples(self, featuretable, spectradocuments) -> pd.DataFrame:
         """
         Use a featuretable and a spectradocuments to generate a MEMO matrix.
@@ -156,7 +360,7 @@ class MemoMatrix:
             spectradocuments (SpectraDocuments): a SpectraDocuments dataclass oject
 
         Returns:
-            self.memo_matrix (DataFrame): A MEMO matrix
+            self.memo_matrix (DataFrame or SparseTable): A MEMO matrix
         """
         if featuretable is None:
             raise ValueError("featuretable argument missing")
@@ -168,23 +372,16 @@ class MemoMatrix:
             raise TypeError("spectradocuments argument must be of type SpectraDocuments")
         print('generating memo_matrix from input featuretable and spectradocument')
 
-        feature_table = featuretable.feature_table.copy()
-        document = spectradocuments.document[['scans', 'documents']].set_index('scans')['documents'].to_dict()
-        feature_table[feature_table == 0] = float('nan')
-        results = feature_table.stack().reset_index(level=1).groupby(level=0, sort=False)['feature_id'].apply(list).to_dict()        
-        for samples in tqdm(results):
-            results[samples] = [document.get(item,item) for item in results[samples]]
-            results[samples] = [ x for x in results[samples] if not isinstance(x, int)]
-            results[samples] = [item for sublist in results[samples] for item in sublist]
-            results[samples] = Counter(results[samples])
-        memo_matrix = pd.DataFrame(results)
-        memo_matrix = memo_matrix.transpose()
-        memo_matrix.fillna(0, inplace=True)
-        memo_matrix.index.name = 'filename'
-        self.memo_matrix = memo_matrix
+        with instrumentation.stage('MemoMatrix.memo_from_aligned_samples') as record:
+            n_decimals = spectradocuments.n_decimals if spectradocuments.word_encoding == 'binned' else None
+            memo_matrix = sparse.memo_from_aligned(featuretable.feature_table, spectradocuments.document, n_decimals)
+            memo_matrix.index.name = 'filename'
+            self._set_matrix(memo_matrix)
+            record.count(samples=memo_matrix.shape[0], words=memo_matrix.shape[1], nonzero=memo_matrix.counts.nnz)
 
     def memo_from_unaligned_samples(self, path_to_samples_dir, pattern_to_match = '.mgf', min_relative_intensity = 0.01,
-    max_relative_intensity = 1.00, min_peaks_required = 10, losses_from = 10, losses_to = 200, n_decimals = 2):
+    max_relative_intensity = 1.00, min_peaks_required = 10, losses_from = 10, losses_to = 200, n_decimals = 2,
+    n_jobs = 1, executor = None, engine = 'matchms', word_encoding = 'string', disk_dir = None, shard_size = 1000):
         """Generate a Memo matrix from a list of individual .mgf files
 
         Args:
@@ -196,40 +393,131 @@ class MemoMatrix:
             losses_from (int): minimal m/z value for losses
             losses_to (int): maximal m/z value for losses
             n_decimals (int): number of decimal when translating peaks/losses into words
+            n_jobs (int): number of worker processes used to process the files (-1 for all cores). Defaults to 1 (no pool).
+            executor (concurrent.futures.Executor): executor to use instead of creating a process pool from n_jobs
+            engine (str): One of [matchms, numpy]: import and filter spectra with matchms or with the built-in NumPy parser
+            word_encoding (str): One of [string, binned]: count words as strings or as integer word ids (see memo_ms.words).
+                Word ids are translated back to strings in the dense matrix and on export.
+            disk_dir (str): If not None, build the matrix out of core in this directory (see memo_ms.ondisk): the word
+                counts of shard_size samples at a time are spilled to shard files, and self.memo_matrix is an
+                ondisk.DiskMatrix read by blocks of rows, whatever self.sparse
+            shard_size (int): number of samples counted at once (and kept in memory) when disk_dir is not None
 
         Returns:
-            self.memo_matrix (DataFrame): A MEMO matrix
+            self.memo_matrix (DataFrame, SparseTable or DiskMatrix): A MEMO matrix
         """
         #pylint: disable=too-many-locals
-                  
-        dic_memo = {}
-        mgf_file = []
-        path_to_mg_file = []
-        files_counted = set()  # Keep track of files already counted
-        
-        for (root, _, files) in os.walk(path_to_samples_dir, topdown=True):
-            for file in files:                
-                if file.endswith(pattern_to_match) and file not in files_counted:
-                    files_counted.add(file)
-                    path_to_match_file = os.path.join(root, file)
-                    path_to_mg_file.append(path_to_match_file)
-                    mgf_file.append(file)
-
-        for path, file in tqdm(zip(path_to_mg_file, mgf_file), total=len(path_to_mg_file)):
-            spectra = import_data.load_and_filter_from_mgf(
-                path = path, min_relative_intensity = min_relative_intensity,
-                max_relative_intensity = max_relative_intensity, loss_mz_from = losses_from, loss_mz_to = losses_to, n_required = min_peaks_required
+        with instrumentation.stage('MemoMatrix.memo_from_unaligned_samples') as record:
+            sample_files = find_sample_files(path_to_samples_dir, pattern_to_match)
+            count_sample_files = partial(
+                _count_sample_files, pattern_to_match = pattern_to_match, n_jobs = n_jobs, executor = executor,
+                min_relative_intensity = min_relative_intensity, max_relative_intensity = max_relative_intensity,
+                min_peaks_required = min_peaks_required, losses_from = losses_from, losses_to = losses_to,
+                n_decimals = n_decimals, engine = engine, word_encoding = word_encoding
                 )
+            if disk_dir is not None:
+                # a single process pool counts all the shards
+                with parallel.pool(n_jobs, executor) as pool:
+                    shards = (
+                        count_sample_files(sample_files[start:start + shard_size], executor = pool)
+                        for start in range(0, len(sample_files), shard_size)
+                        )
+                    memo_matrix = ondisk.from_counters(
+                        shards, disk_dir, n_decimals = n_decimals if word_encoding == 'binned' else None
+                        )
+                self.memo_matrix = memo_matrix
+            else:
+                dic_memo = count_sample_files(sample_files)
+                with instrumentation.stage('sparse.from_counters'):
+                    memo_matrix = sparse.from_counters(dic_memo, n_decimals = n_decimals if word_encoding == 'binned' else None)
+                self._set_matrix(memo_matrix)
+            record.count(samples=memo_matrix.shape[0], words=memo_matrix.shape[1], nonzero=memo_matrix.nnz)
+
+    def update_from_unaligned_samples(self, path_to_samples_dir, state_dir, pattern_to_match = '.mgf', min_relative_intensity = 0.01,
+    max_relative_intensity = 1.00, min_peaks_required = 10, losses_from = 10, losses_to = 200, n_decimals = 2,
+    n_jobs = 1, executor = None, engine = 'matchms', word_encoding = 'string', use_hash = False):
+        """Incrementally generate a Memo matrix from a directory of individual .mgf files which changes over time.
+        The matrix and a manifest of the processed files are persisted in state_dir. On each call, only new or
+        changed files are processed: their rows are appended (new words extend the vocabulary) and the rows of
+        removed files are dropped. Everything is recomputed if the parameters changed since the last call.
 
-            documents = [SpectrumDocument(s, n_decimals= n_decimals) for s in spectra]
-            documents = list(doc.words for doc in documents)
-            documents = [item for sublist in documents for item in sublist]
-            documents = dict(Counter(documents))
-            dic_memo[file.replace(pattern_to_match, '')] = documents
-
-        self.memo_matrix = pd.DataFrame.from_dict(dic_memo, orient='index').fillna(0)
+        Args:
+            path_to_samples_dir (str): Path to the directory where individual .mgf files are gathered. Subfolders will also be checked.
+            state_dir (str): Directory where the matrix (memo_matrix.npz) and the manifest (manifest.json) are persisted.
+                The manifest records the hash of the matrix it describes: a matrix left by an interrupted call is recomputed.
+            use_hash (bool): Detect changed files with their content hash in addition to their size and modification time
+            Other arguments: see memo_from_unaligned_samples
 
-    def filter(self, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0, max_rel_occurence = 1):
+        Returns:
+            self.memo_matrix (DataFrame or SparseTable): A MEMO matrix
+        """
+        #pylint: disable=too-many-locals
+        parameters = {
+            'pattern_to_match': pattern_to_match, 'min_relative_intensity': min_relative_intensity,
+            'max_relative_intensity': max_relative_intensity, 'min_peaks_required': min_peaks_required,
+            'losses_from': losses_from, 'losses_to': losses_to, 'n_decimals': n_decimals, 'engine': engine,
+            'word_encoding': word_encoding
+            }
+        path_matrix = os.path.join(state_dir, 'memo_matrix.npz')
+        path_manifest = os.path.join(state_dir, 'manifest.json')
+        manifest = {'parameters': parameters, 'files': {}}
+        table = None
+        if os.path.exists(path_manifest) and os.path.exists(path_matrix):
+            with open(path_manifest, 'r', encoding='utf8') as handle:
+                previous = json.load(handle)
+            # the matrix written by a run interrupted before its manifest does not match the manifest hash
+            if previous['parameters'] == parameters and previous.get('matrix_hash') == cache.file_hash(path_matrix):
+                manifest = previous
+                table = sparse.load_npz(path_matrix)
+
+        sample_files = find_sample_files(path_to_samples_dir, pattern_to_match)
+        files = {}
+        to_process = []
+        unchanged = []
+        for path, file in sample_files:
+            stat = os.stat(path)
+            sample = file.replace(pattern_to_match, '')
+            files[sample] = {
+                'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                'hash': cache.file_hash(path) if use_hash else None
+                }
+            if manifest['files'].get(sample) == files[sample]:
+                unchanged.append(sample)
+            else:
+                to_process.append((path, file))
+
+        dic_memo = _count_sample_files(
+            to_process, pattern_to_match, n_jobs, executor, min_relative_intensity = min_relative_intensity,
+            max_relative_intensity = max_relative_intensity, min_peaks_required = min_peaks_required,
+            losses_from = losses_from, losses_to = losses_to, n_decimals = n_decimals, engine = engine,
+            word_encoding = word_encoding
+            )
+        new_rows = sparse.from_counters(dic_memo, n_decimals = n_decimals if word_encoding == 'binned' else None)
+        if table is not None:
+            kept = table.index.isin(unchanged)
+            if not kept.all():
+                table = table.take(rows=kept)
+                table = table.take(columns=table.occurences() > 0)
+            new_rows = sparse.merge([table, new_rows])
+            # rows in the order of a full memo_from_unaligned_samples run, not with the processed samples last
+            new_rows = new_rows.take(rows=new_rows.index.get_indexer(list(files)))
+
+        os.makedirs(state_dir, exist_ok=True)
+        # both files are replaced atomically, the manifest last, so that it never describes a partially written matrix
+        handle, temporary = tempfile.mkstemp(dir=state_dir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as output:
+            sparse.save_npz(new_rows, output)
+        os.replace(temporary, path_matrix)
+        manifest['files'] = files
+        manifest['matrix_hash'] = cache.file_hash(path_matrix)
+        handle, temporary = tempfile.mkstemp(dir=state_dir, suffix='.tmp')
+        with os.fdopen(handle, 'w', encoding='utf8') as output:
+            json.dump(manifest, output, indent=2)
+        os.replace(temporary, path_manifest)
+        self._set_matrix(new_rows)
+
+    def filter(self, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0, max_rel_occurence = 1,
+               inplace = False, disk_dir = None):
         """Filter a MEMO matrix: remove samples matching samples_pattern
         AND remove features occuring in more than n = max_occurence samples matched by samples_pattern
 
@@ -239,51 +527,104 @@ class MemoMatrix:
             max_occurence (int): maximal number of occurence allowed in matched samples before removing a word
             min_rel_occurence (float): remove words contained in less than (min_rel_occurence * 100 percent) of the samples
             max_rel_occurence (float): remove words contained in more than (max_rel_occurence * 100 percent) of the samples
+            inplace (bool): replace self.memo_matrix by the filtered matrix and return None
+            disk_dir (str): for an ondisk.DiskMatrix, directory where the filtered matrix is written block by block.
+                If None, the filtered matrix is loaded in memory as a SparseTable.
 
         Returns:
-            self.memo_matrix (DataFrame): A filtered feature table matrix
+            MemoMatrix (MemoMatrix): A MemoMatrix with the filtered matrix, only built from the kept samples and words.
+                None if inplace is True.
         """
-        output = copy.deepcopy(self)
-        output.memo_matrix = filter_table(output.memo_matrix, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence)        
+        memo_matrix = filter_table(
+            self.memo_matrix, use_samples_pattern, samples_pattern, max_occurence, min_rel_occurence, max_rel_occurence, disk_dir
+            )
+        if inplace:
+            self.memo_matrix = memo_matrix
+            return None
+        output = copy.copy(self)
+        output.memo_matrix = memo_matrix
         return output
 
     def merge_memo(self, memomatrix_2, drop_not_in_common=False):
-        """Merge 2 MEMO matrix
+        """Merge 2 MEMO matrix, see merge_memos to merge more matrices at once
 
         Args:
             memocontainer2 (MemoContainer): MemoMatrix dataclass object containing the 2nd MEMO matrix to merge
             drop_not_in_common (bool): Drop peaks/losses not in common
             
         Returns:
-            MemoContainer (MemoContainer): A MemoMatrix dataclass object containing the merged MEMO matrix
+            MemoContainer (MemoContainer): A MemoMatrix dataclass object containing the merged MEMO matrix.
+                The merged matrix is sparse if self.sparse is True.
         """
-        output = MemoMatrix()
-
         if not isinstance(memomatrix_2, MemoMatrix):
             raise TypeError ("merge_memo() memomatrix_2 argument must be a MemoMatrix")
+        return merge_memos([self, memomatrix_2], drop_not_in_common=drop_not_in_common)
 
-        table_left = self.memo_matrix
-        table_right = memomatrix_2.memo_matrix
-        
-        if drop_not_in_common is True:
-            # result = table_left.append(table_right, sort=False).dropna(axis='columns').fillna(0)
-            # append is now deprecated https://pandas.pydata.org/docs/whatsnew/v2.0.0.html#deprecations
-            result = pd.concat([table_left, table_right], sort=False).dropna(axis='columns').fillna(0)
-        else:
-            # result = table_left.append(table_right, sort=False).fillna(0)
-            result = pd.concat([table_left, table_right], sort=False).fillna(0)
-
-        output.memo_matrix = result
-        return output
-
-    def export_matrix(self, path, sep = ','):
+    def export_matrix(self, path, sep = ',', file_format = None):
         """Export a given matrix
 
         Args:
             path (str): path to export
-            sep (str): separator
+            sep (str): separator, for csv files
+            file_format (str): One of [csv, parquet, feather, npz, memmap]. Defaults to the path extension, csv if unknown.
+                parquet and feather (needs pyarrow) are dense, npz and memmap (a directory, see memo_ms.ondisk) keep
+                the matrix sparse. An ondisk.DiskMatrix is read by blocks of rows for csv, npz and memmap.
             
         Returns:
             None
         """      
-        self.memo_matrix.to_csv(path, sep=sep)
+        export_data.export_table(self.memo_matrix, path, sep=sep, file_format=file_format)
+
+    def memo_from_file(self, path, sep = ',', file_format = None):
+        """Load a MEMO matrix exported with export_matrix
+
+        Args:
+            path (str): path to the exported matrix
+            sep (str): separator, for csv files
+            file_format (str): One of [csv, parquet, feather, npz, memmap]. Defaults to memmap for a directory exported
+                as memmap, else to the path extension, csv if unknown. With sparse=True, a memmap matrix is opened
+                without copy: its counts are read-only memory maps shared with the other processes opening it.
+
+        Returns:
+            self.memo_matrix (DataFrame or SparseTable): the MEMO matrix
+        """
+        memo_matrix = import_data.import_matrix(path, sep=sep, file_format=file_format, dense=not self.sparse)
+        if self.sparse and isinstance(memo_matrix, pd.DataFrame):
+            memo_matrix = sparse.from_dense(memo_matrix)
+        self.memo_matrix = memo_matrix
+
+
+def _as_sparse(table) -> sparse.SparseTable:
+    if isinstance(table, sparse.SparseTable):
+        return table
+    if isinstance(table, ondisk.DiskMatrix):
+        # the memory maps are only read while stacking the merged counts
+        return table.to_sparse(copy=False)
+    return sparse.from_dense(table)
+
+def merge_memos(memo_matrices, drop_not_in_common = False):
+    """Merge MEMO matrices at once: the vocabulary of the merged matrix is built once, and the matrices are
+    stacked as sparse tables, their words remapped on this vocabulary, instead of merging them two by two
+
+    Args:
+        memo_matrices (list of MemoMatrix): MemoMatrix dataclass objects containing the MEMO matrices to merge,
+            dense, sparse or on disk (ondisk.DiskMatrix)
+        drop_not_in_common (bool): Drop peaks/losses not in all the matrices
+
+    Returns:
+        MemoContainer (MemoContainer): A MemoMatrix dataclass object containing the merged MEMO matrix.
+            Samples are stacked in the order of memo_matrices, words are in order of first appearance.
+            The merged matrix is sparse if the first matrix is sparse.
+    """
+    memo_matrices = list(memo_matrices)
+    if len(memo_matrices) == 0:
+        raise ValueError("merge_memos() memo_matrices argument must contain at least one MemoMatrix")
+    if not all(isinstance(memo_matrix, MemoMatrix) for memo_matrix in memo_matrices):
+        raise TypeError("merge_memos() memo_matrices argument must contain MemoMatrix objects")
+    output = MemoMatrix(sparse=memo_matrices[0].sparse)
+    with instrumentation.stage('merge_memos', matrices=len(memo_matrices)) as record:
+        tables = [_as_sparse(memo_matrix.memo_matrix) for memo_matrix in memo_matrices]
+        merged = sparse.merge(tables, drop_not_in_common=drop_not_in_common)
+        output._set_matrix(merged) #pylint: disable=protected-access
+        record.count(samples=merged.shape[0], words=merged.shape[1])
+    return output
@@ -0,0 +1,207 @@
+"""Command line interface: build, filter, merge and export MEMO matrices without notebooks.
+
+    memo aligned feature_table.csv spectra.mgf -o memo_matrix.parquet
+    memo unaligned samples_dir/ -o memo_matrix.npz --n-jobs 8
+    memo filter memo_matrix.npz -o filtered.npz --samples-pattern blank --max-occurence 0
+    memo merge memo_1.npz memo_2.npz -o merged.npz
+    memo export merged.npz -o merged.csv
+
+Matrices are read and written as csv, parquet, feather or npz files, see MemoMatrix.export_matrix.
+They are kept sparse while processed. Only unaligned runs in parallel processes (--n-jobs), one spectra file each.
+"""
+import argparse
+import sys
+from memo_ms import export_data
+from memo_ms import instrumentation
+from memo_ms.classes import FeatureTable, MemoMatrix, SpectraDocuments, merge_memos
+
+SIZE_UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def parse_size(size) -> int:
+    """Parse a memory size such as 512M or 8G
+
+    Args:
+        size (str): a number of bytes, optionally followed by one of [K, M, G, T]
+
+    Returns:
+        size (int): the number of bytes
+    """
+    size = str(size).strip().upper().rstrip('B')
+    unit = size[-1] if size and size[-1] in SIZE_UNITS else ''
+    try:
+        return int(float(size[:len(size) - len(unit)]) * SIZE_UNITS[unit])
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"invalid memory size: {size}") from error
+
+def set_memory_limit(limit):
+    """Limit the address space of the process, so that exceeding it raises MemoryError
+
+    Args:
+        limit (int): maximal number of bytes
+
+    Returns:
+        None
+    """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise OSError("--memory-limit is not supported on this platform") from error
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def _load(path, args) -> MemoMatrix:
+    memo_matrix = MemoMatrix(sparse=True)
+    memo_matrix.memo_from_file(path, sep=args.sep, file_format=args.input_format)
+    return memo_matrix
+
+def _export(memo_matrix, args):
+    memo_matrix.export_matrix(args.output, sep=args.sep, file_format=args.format)
+    print(f"memo_matrix {memo_matrix.memo_matrix.shape} written to {args.output}")
+
+def _spectra_parameters(args) -> dict:
+    return {
+        'min_relative_intensity': args.min_relative_intensity, 'max_relative_intensity': args.max_relative_intensity,
+        'min_peaks_required': args.min_peaks_required, 'losses_from': args.losses_from, 'losses_to': args.losses_to,
+        'n_decimals': args.n_decimals, 'engine': args.engine, 'word_encoding': args.word_encoding
+        }
+
+def run_aligned(args):
+    """memo aligned: MEMO matrix of aligned samples (feature table + spectra file)"""
+    feature_table = FeatureTable(args.feature_table, software=args.software, dtype=args.dtype)
+    spectra = SpectraDocuments(
+        args.spectra, keep_spectra=False, cache_dir=args.cache_dir, **_spectra_parameters(args)
+        )
+    memo_matrix = MemoMatrix(sparse=True)
+    memo_matrix.memo_from_aligned_samples(feature_table, spectra)
+    _export(memo_matrix, args)
+
+def run_unaligned(args):
+    """memo unaligned: MEMO matrix of a directory of unaligned samples spectra files"""
+    memo_matrix = MemoMatrix(sparse=True)
+    memo_matrix.memo_from_unaligned_samples(
+        args.samples_dir, pattern_to_match=args.pattern, n_jobs=args.n_jobs, disk_dir=args.disk_dir,
+        shard_size=args.shard_size, **_spectra_parameters(args)
+        )
+    _export(memo_matrix, args)
+
+def run_filter(args):
+    """memo filter: filter samples and words of a MEMO matrix"""
+    memo_matrix = _load(args.matrix, args).filter(
+        use_samples_pattern=args.samples_pattern is not None, samples_pattern=args.samples_pattern or '',
+        max_occurence=args.max_occurence, min_rel_occurence=args.min_rel_occurence,
+        max_rel_occurence=args.max_rel_occurence
+        )
+    _export(memo_matrix, args)
+
+def run_merge(args):
+    """memo merge: merge MEMO matrices"""
+    memo_matrices = [_load(path, args) for path in args.matrices]
+    _export(merge_memos(memo_matrices, drop_not_in_common=args.drop_not_in_common), args)
+
+def run_export(args):
+    """memo export: convert a MEMO matrix to another format"""
+    _export(_load(args.matrix, args), args)
+
+def _add_spectra_arguments(parser):
+    group = parser.add_argument_group('spectra filtering')
+    group.add_argument('--min-relative-intensity', type=float, default=0.01, help='minimal relative intensity to keep a peak')
+    group.add_argument('--max-relative-intensity', type=float, default=1.0, help='maximal relative intensity to keep a peak')
+    group.add_argument('--min-peaks-required', type=int, default=10, help='minimum number of peaks to keep a spectrum')
+    group.add_argument('--losses-from', type=float, default=10, help='minimal m/z value for losses')
+    group.add_argument('--losses-to', type=float, default=200, help='maximal m/z value for losses')
+    group.add_argument('--n-decimals', type=int, default=2, help='number of decimals to round peaks and losses m/z')
+    group.add_argument('--engine', choices=['matchms', 'numpy'], default='matchms', help='spectra import engine')
+    group.add_argument('--word-encoding', choices=['string', 'binned'], default='string', help='peaks/losses words encoding')
+
+def build_parser() -> argparse.ArgumentParser:
+    """Parser of the memo command"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-o', '--output', required=True, help='output matrix file')
+    common.add_argument('--format', choices=export_data.FILE_FORMATS, default=None,
+                        help='output format, defaults to the output file extension (csv if unknown)')
+    common.add_argument('--input-format', choices=export_data.FILE_FORMATS, default=None,
+                        help='format of the input matrices, defaults to their file extension (csv if unknown)')
+    common.add_argument('--sep', default=',', help='separator of csv files')
+    common.add_argument('--memory-limit', type=parse_size, default=None,
+                        help='maximal memory (address space) of the process, e.g. 8G')
+    common.add_argument('--profile', default=None,
+                        help='JSON file where the time, memory and counts of each processing stage are written')
+
+    parser = argparse.ArgumentParser(prog='memo', description='MS2 BasEd SaMple VectOrization')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    aligned = subparsers.add_parser('aligned', parents=[common], help='MEMO matrix of aligned samples')
+    aligned.add_argument('feature_table', help='feature table file')
+    aligned.add_argument('spectra', help='spectra file (.mgf)')
+    aligned.add_argument('--software', choices=['mzmine', 'xcms', 'msdial', 'memo', 'matrix'], default='mzmine',
+                         help='software used for feature detection')
+    aligned.add_argument('--dtype', choices=['float64', 'float32', 'bool'], default=None,
+                         help='read the feature table by chunks into this dtype, bool (presence) uses the least memory')
+    aligned.add_argument('--cache-dir', default=None, help='directory caching the spectra documents')
+    _add_spectra_arguments(aligned)
+    aligned.set_defaults(run=run_aligned)
+
+    unaligned = subparsers.add_parser('unaligned', parents=[common], help='MEMO matrix of unaligned samples')
+    unaligned.add_argument('samples_dir', help='directory of the samples spectra files')
+    unaligned.add_argument('--pattern', default='.mgf', help='pattern of the spectra files names')
+    unaligned.add_argument('--n-jobs', type=int, default=1,
+                           help='number of worker processes processing the spectra files, -1 for all the processors. '
+                           'Only unaligned supports it: aligned reads a single spectra file')
+    unaligned.add_argument('--disk-dir', default=None,
+                           help='build the matrix out of core in this directory, for more samples than fit in memory')
+    unaligned.add_argument('--shard-size', type=int, default=1000, help='number of samples counted at once with --disk-dir')
+    _add_spectra_arguments(unaligned)
+    unaligned.set_defaults(run=run_unaligned)
+
+    filtering = subparsers.add_parser('filter', parents=[common], help='filter a MEMO matrix')
+    filtering.add_argument('matrix', help='MEMO matrix file')
+    filtering.add_argument('--samples-pattern', default=None, help='remove the samples matching this pattern')
+    filtering.add_argument('--max-occurence', type=int, default=None,
+                           help='remove words occuring in more than max-occurence samples matching samples-pattern')
+    filtering.add_argument('--min-rel-occurence', type=float, default=0,
+                           help='remove words present in less than this proportion of the samples')
+    filtering.add_argument('--max-rel-occurence', type=float, default=1,
+                           help='remove words present in more than this proportion of the samples')
+    filtering.set_defaults(run=run_filter)
+
+    merge = subparsers.add_parser('merge', parents=[common], help='merge MEMO matrices')
+    merge.add_argument('matrices', nargs='+', help='MEMO matrix files')
+    merge.add_argument('--drop-not-in-common', action='store_true', help='only keep the words present in all the matrices')
+    merge.set_defaults(run=run_merge)
+
+    export = subparsers.add_parser('export', parents=[common], help='convert a MEMO matrix to another format')
+    export.add_argument('matrix', help='MEMO matrix file')
+    export.set_defaults(run=run_export)
+    return parser
+
+def main(argv = None) -> int:
+    """Entry point of the memo command
+
+    Args:
+        argv (list of str): command line arguments, sys.argv[1:] if None
+
+    Returns:
+        exit_code (int): 0 on success
+    """
+    args = build_parser().parse_args(argv)
+    if args.memory_limit is not None:
+        set_memory_limit(args.memory_limit)
+    if args.profile is not None:
+        instrumentation.enable()
+    try:
+        args.run(args)
+    except MemoryError:
+        print(f"memo {args.command}: memory limit exceeded", file=sys.stderr)
+        return 1
+    finally:
+        report = instrumentation.disable()
+        if report is not None:
+            report.to_json(args.profile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Pairwise distances between the samples of sparse MEMO matrices.
+
+The distances are computed from sums over the words shared by two samples and from per sample totals,
+so only the non-zero counts are visited: Bray-Curtis uses the sums of the pairwise minima, Jaccard the
+numbers of shared and of equal counts, cosine and euclidean the dot products. Rows are processed by
+blocks, optionally in parallel processes, and the results are returned in the condensed form of
+scipy.spatial.distance.pdist, as expected by skbio pcoa. The rows of an ondisk.DiskMatrix are read by blocks
+from disk, so only the distances have to fit in memory.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse
+import scipy.spatial.distance
+from memo_ms import ondisk
+from memo_ms import parallel
+from memo_ms import sparse
+
+METRICS = ('braycurtis', 'jaccard', 'cosine', 'euclidean')
+MAX_PAIRS = 2**22
+
+_WORKER_MATRIX = None
+
+
+def as_csr(matrix) -> scipy.sparse.csr_matrix:
+    """Convert a matrix to a float CSR matrix
+
+    Args:
+        matrix (SparseTable, DiskMatrix, DataFrame, ndarray or scipy.sparse matrix): samples x words matrix.
+            A DiskMatrix is loaded in memory.
+
+    Returns:
+        csr (csr_matrix): the matrix without explicit zeros
+    """
+    if isinstance(matrix, ondisk.DiskMatrix):
+        matrix = matrix.to_sparse()
+    if isinstance(matrix, sparse.SparseTable):
+        return matrix.counts  # already float, without explicit zeros
+    if isinstance(matrix, pd.DataFrame):
+        matrix = matrix.to_numpy(dtype=float)
+    csr = scipy.sparse.csr_matrix(matrix, dtype=float)
+    csr.eliminate_zeros()
+    return csr
+
+def _shared_sums(block, others, function):
+    """Sum function(block[i, k], others[j, k]) over the columns k where both rows are non-zero
+
+    Args:
+        block (csc_matrix): p x m matrix
+        others (csc_matrix): q x m matrix
+        function (callable): element-wise function of two arrays
+
+    Returns:
+        sums (ndarray): p x q array
+    """
+    n_rows, n_others = block.shape[0], others.shape[0]
+    sums = np.zeros(n_rows * n_others)
+    block_counts = np.diff(block.indptr)
+    others_counts = np.diff(others.indptr)
+    pairs = block_counts * others_counts
+    columns = np.flatnonzero(pairs)
+    # the cartesian products of the non-zeros of each column are expanded by chunks of about MAX_PAIRS pairs
+    chunk_ids = np.cumsum(pairs[columns]) // MAX_PAIRS
+    for chunk in np.split(columns, np.flatnonzero(np.diff(chunk_ids)) + 1):
+        chunk_pairs = pairs[chunk]
+        column = np.repeat(chunk, chunk_pairs)
+        rank = np.arange(column.size) - np.repeat(np.cumsum(chunk_pairs) - chunk_pairs, chunk_pairs)
+        in_block = block.indptr[column] + rank // others_counts[column]
+        in_others = others.indptr[column] + rank % others_counts[column]
+        values = function(block.data[in_block], others.data[in_others])
+        sums += np.bincount(
+            block.indices[in_block] * n_others + others.indices[in_others], weights=values, minlength=sums.size
+            )
+    return sums.reshape(n_rows, n_others)
+
+def _equal(left, right):
+    return (left == right).astype(float)
+
+def cdist(xa, xb, metric = 'braycurtis') -> np.ndarray:
+    """Distances between the rows of two sparse matrices
+
+    Args:
+        xa (csr_matrix): p x m matrix
+        xb (csr_matrix): q x m matrix
+        metric (str): One of [braycurtis, jaccard, cosine, euclidean], computed as scipy.spatial.distance does.
+            braycurtis requires non-negative values.
+
+    Returns:
+        distances (ndarray): p x q distances
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'braycurtis':
+            minima = _shared_sums(xa.tocsc(), xb.tocsc(), np.minimum)
+            totals = np.asarray(xa.sum(axis=1)) + np.asarray(xb.sum(axis=1)).T
+            differences = _refine(xa, xb, totals - 2 * minima, totals, lambda delta: abs(delta).sum(axis=1))
+            return differences / totals
+        if metric == 'jaccard':
+            shared = (xa != 0).astype(float) @ (xb != 0).astype(float).T
+            union = np.diff(xa.indptr)[:, None] + np.diff(xb.indptr)[None, :] - shared.toarray()
+            equal = _shared_sums(xa.tocsc(), xb.tocsc(), _equal)
+            return np.where(union > 0, (union - equal) / np.maximum(union, 1), 0.)
+        dots = (xa @ xb.T).toarray()
+        squares_a = np.asarray(xa.multiply(xa).sum(axis=1))
+        squares_b = np.asarray(xb.multiply(xb).sum(axis=1)).T
+        if metric == 'cosine':
+            return np.clip(1 - dots / np.sqrt(squares_a * squares_b), 0., 2.)
+        if metric == 'euclidean':
+            return _euclidean(xa, xb, squares_a + squares_b - 2 * dots)
+    raise ValueError(f"metric argument must be one of {list(METRICS)}")
+
+def _refine(xa, xb, values, scale, reduce):
+    """Expansions such as sum(u) + sum(v) - 2 * sum(min(u, v)) lose the precision of the distances
+    between (almost) identical rows: these are computed again from the differences of the rows"""
+    rows, others = np.nonzero(values <= 1e-6 * scale)
+    if rows.size > 0:
+        values[rows, others] = np.asarray(reduce(xa[rows] - xb[others])).ravel()
+    return values
+
+def _euclidean(xa, xb, squared):
+    scale = np.asarray(xa.multiply(xa).sum(axis=1)) + np.asarray(xb.multiply(xb).sum(axis=1)).T
+    squared = _refine(xa, xb, squared, scale, lambda delta: delta.multiply(delta).sum(axis=1))
+    return np.sqrt(np.maximum(squared, 0.))
+
+def _init_worker(matrix):
+    global _WORKER_MATRIX #pylint: disable=global-statement
+    _WORKER_MATRIX = matrix
+
+def _upper_block(matrix, start, stop, metric):
+    """Distances between the rows start:stop and the rows start: of matrix"""
+    if isinstance(matrix, ondisk.DiskMatrix):
+        return _disk_cdist(matrix, as_csr(matrix.rows(start, stop)), metric, start=start, block_size=stop - start)
+    return cdist(matrix[start:stop], matrix[start:], metric)
+
+def _disk_cdist(matrix, xa, metric, start = 0, block_size = 256):
+    """Distances between the rows of xa and the rows start: of a DiskMatrix, read by blocks"""
+    blocks = [cdist(xa, as_csr(block), metric) for block in matrix.iter_blocks(block_size, start=start)]
+    return np.hstack(blocks) if blocks else np.empty((xa.shape[0], 0))
+
+def _worker_upper_block(start, stop, metric):
+    return _upper_block(_WORKER_MATRIX, start, stop, metric)
+
+def pdist(matrix, metric = 'braycurtis', block_size = 256, n_jobs = 1, executor = None) -> np.ndarray:
+    """Condensed pairwise distances between the rows of a matrix, equivalent to scipy.spatial.distance.pdist
+
+    Args:
+        matrix (SparseTable, DiskMatrix, DataFrame, ndarray or scipy.sparse matrix): samples x words matrix
+        metric (str): One of [braycurtis, jaccard, cosine, euclidean]. Other metrics, and braycurtis on
+            matrices with negative values (e.g. scaled), are computed with scipy on the dense matrix.
+        block_size (int): number of rows processed at once, and read at once from a DiskMatrix
+        n_jobs (int): number of processes, -1 to use all the processors. The matrix is sent once to each of them.
+        executor (concurrent.futures.Executor): executor to use instead of creating a process pool from n_jobs.
+            The matrix is sent with each block of rows to the processes of a user provided process pool.
+
+    Returns:
+        dm (ndarray): condensed distance matrix
+    """
+    if metric not in METRICS:
+        return scipy.spatial.distance.pdist(as_csr(matrix).toarray(), metric)
+    # the rows of a DiskMatrix stay on disk, the CSR arrays have the same attributes
+    csr = matrix if isinstance(matrix, ondisk.DiskMatrix) else as_csr(matrix)
+    if metric == 'braycurtis' and csr.data.size > 0 and csr.data.min() < 0:
+        return scipy.spatial.distance.pdist(as_csr(csr).toarray(), metric)
+    n_rows = csr.shape[0]
+    dm = np.empty(n_rows * (n_rows - 1) // 2)
+    starts = list(range(0, n_rows, block_size))
+    stops = [min(start + block_size, n_rows) for start in starts]
+    metrics = [metric] * len(starts)
+    if executor is None and n_jobs not in (None, 1) and len(starts) > 1:
+        with parallel.pool(n_jobs, initializer=_init_worker, initargs=(csr,)) as pool:
+            _fill_condensed(dm, n_rows, starts, pool.map(_worker_upper_block, starts, stops, metrics))
+    else:
+        with parallel.pool(1, executor) as pool:
+            _fill_condensed(dm, n_rows, starts, pool.map(_upper_block, [csr] * len(starts), starts, stops, metrics))
+    return dm
+
+def distances_from(matrix, rows, metric = 'braycurtis') -> np.ndarray:
+    """Distances between some rows of a matrix and all its rows, equivalent to scipy.spatial.distance.cdist
+
+    Args:
+        matrix (SparseTable, DiskMatrix, DataFrame, ndarray or scipy.sparse matrix): samples x words matrix
+        rows (array-like of int): positions of the rows
+        metric (str): see pdist
+
+    Returns:
+        distances (ndarray): len(rows) x n distances
+    """
+    if isinstance(matrix, ondisk.DiskMatrix) and metric in METRICS:
+        if not (metric == 'braycurtis' and matrix.nnz > 0 and matrix.data.min() < 0):
+            return _disk_cdist(matrix, as_csr(matrix.take(rows)), metric)
+    csr = as_csr(matrix)
+    if metric not in METRICS or (metric == 'braycurtis' and csr.data.size > 0 and csr.data.min() < 0):
+        dense = csr.toarray()
+        return scipy.spatial.distance.cdist(dense[rows], dense, metric)
+    return cdist(csr[rows], csr, metric)
+
+def _fill_condensed(dm, n_rows, starts, blocks):
+    for start, distances in zip(starts, blocks):
+        for i in range(start, start + distances.shape[0]):
+            offset = n_rows * i - i * (i + 1) // 2
+            dm[offset:offset + n_rows - i - 1] = distances[i - start, i - start + 1:]
@@ -0,0 +1,122 @@
+"""Export of MEMO matrices and feature tables.
+
+Besides csv, tables can be written as parquet or feather files (dense, needs pyarrow), as compressed
+sparse .npz files or as memmap directories (the binary sparse layout of memo_ms.ondisk, opened without copy).
+The index, column names and dtypes are stored with the table so that import_data.import_matrix loads back
+exactly the exported table.
+"""
+import json
+import os
+import pandas as pd
+from memo_ms import ondisk
+from memo_ms import sparse
+
+FILE_FORMATS = ('csv', 'parquet', 'feather', 'npz', 'memmap')
+ARROW_METADATA_KEY = b'memo_ms'
+ARROW_INDEX_COLUMN = '__index__'
+
+
+def file_format_from_path(path, file_format = None) -> str:
+    """Find the format to use for a matrix file
+
+    Args:
+        path (str): path to the file
+        file_format (str): One of [csv, parquet, feather, npz, memmap]. Defaults to memmap for a disk matrix
+            directory, else to the file extension, csv if unknown.
+
+    Returns:
+        file_format (str): the format to use
+    """
+    if file_format is None and ondisk.is_disk_matrix(path):
+        file_format = 'memmap'
+    if file_format is None:
+        extension = os.path.splitext(str(path))[1].lower().lstrip('.')
+        file_format = extension if extension in FILE_FORMATS else 'csv'
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"file_format argument must be one of {list(FILE_FORMATS)}")
+    return file_format
+
+def import_pyarrow():
+    """Import pyarrow, an optional dependency needed for parquet and feather files"""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise ImportError("pyarrow is required for parquet and feather files: pip install pyarrow") from error
+    return pyarrow
+
+def table_to_arrow(table):
+    """Convert a dense table to a pyarrow.Table, keeping what is needed to restore its index and columns
+
+    Args:
+        table (DataFrame): a MemoMatrix.memo_matrix or FeatureTable.feature_table
+
+    Returns:
+        arrow_table (pyarrow.Table): the table with the index as first column and string column names
+    """
+    pyarrow = import_pyarrow()
+    metadata = {
+        'index_name': table.index.name, 'index_dtype': str(table.index.dtype),
+        'columns_name': table.columns.name, 'columns_dtype': str(table.columns.dtype)
+        }
+    frame = table.copy(deep=False)
+    frame.columns = [str(column) for column in frame.columns]
+    frame.insert(0, ARROW_INDEX_COLUMN, table.index)
+    arrow_table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    schema_metadata = dict(arrow_table.schema.metadata or {})
+    schema_metadata[ARROW_METADATA_KEY] = json.dumps(metadata).encode('utf8')
+    return arrow_table.replace_schema_metadata(schema_metadata)
+
+def table_from_arrow(arrow_table) -> pd.DataFrame:
+    """Convert back a pyarrow.Table created by table_to_arrow
+
+    Args:
+        arrow_table (pyarrow.Table): the table to convert
+
+    Returns:
+        table (DataFrame): the table with its original index, columns and dtypes
+    """
+    metadata = json.loads(arrow_table.schema.metadata[ARROW_METADATA_KEY])
+    table = arrow_table.to_pandas()
+    index = pd.Index(table.pop(ARROW_INDEX_COLUMN)).astype(metadata['index_dtype'])
+    table.index = index.rename(metadata['index_name'])
+    columns = pd.Index(table.columns, name=metadata['columns_name'])
+    if metadata['columns_dtype'] != 'object':
+        columns = columns.astype(metadata['columns_dtype'])
+    table.columns = columns
+    return table
+
+def export_table(table, path, sep = ',', file_format = None):
+    """Export a MEMO matrix or feature table
+
+    Args:
+        table (DataFrame, SparseTable or ondisk.DiskMatrix): the table to export. A DiskMatrix is read by blocks of
+            rows for csv and npz files, and loaded in memory for parquet and feather files.
+        path (str): path to export
+        sep (str): separator, for csv files
+        file_format (str): One of [csv, parquet, feather, npz, memmap]. Defaults to the path extension, csv if unknown.
+            parquet and feather need pyarrow and write dense tables, npz writes a compressed sparse table and memmap
+            a directory of binary sparse arrays (see memo_ms.ondisk).
+
+    Returns:
+        None
+    """
+    file_format = file_format_from_path(path, file_format)
+    if file_format == 'npz':
+        sparse.save_npz(table, path)
+        return
+    if file_format == 'memmap':
+        ondisk.write(table, path)
+        return
+    if file_format == 'csv':
+        table.to_csv(path, sep=sep)
+        return
+    if not isinstance(table, pd.DataFrame):
+        table = table.to_dense()
+    pyarrow = import_pyarrow()
+    arrow_table = table_to_arrow(table)
+    if file_format == 'parquet':
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+        pyarrow.parquet.write_table(arrow_table, path)
+    else:
+        import pyarrow.feather  # pylint: disable=import-outside-toplevel
+        pyarrow.feather.write_feather(arrow_table, path)
@@ -1,99 +1,299 @@
+import numpy as np
 import pandas as pd
-from matchms.importing import load_from_mgf
-from matchms.filtering import add_precursor_mz
-from matchms.filtering import add_losses
-from matchms.filtering import normalize_intensities
-from matchms.filtering import require_minimum_number_of_peaks
-from matchms.filtering import select_by_relative_intensity
+from memo_ms import export_data
+from memo_ms import instrumentation
+from memo_ms import mgf
+from memo_ms import ondisk
+from memo_ms import sparse
+from memo_ms import words
 
-def load_and_filter_from_mgf(path, min_relative_intensity, max_relative_intensity,
-                             loss_mz_from, loss_mz_to, n_required) -> list:
-    """Load and filter spectra from mgf file to prepare for MEMO matrix generation
+def iter_filtered_spectra(path, min_relative_intensity, max_relative_intensity,
+                          loss_mz_from, loss_mz_to, n_required):
+    """Lazily load and filter spectra from mgf file: only the current spectrum is kept in memory
 
-    Returns:
-        spectrums (list of matchms.spectrum): a list of matchms.spectrum objects
+    Yields:
+        spectrum (matchms.spectrum): filtered matchms.spectrum objects, spectra rejected by the filters are skipped
     """
     #pylint: disable=too-many-arguments
+    #pylint: disable=import-outside-toplevel
+    # matchms is slow to import: only loaded when spectra are imported with it
+    from matchms.importing import load_from_mgf
+    from matchms.filtering import add_precursor_mz
+    from matchms.filtering import add_losses
+    from matchms.filtering import normalize_intensities
+    from matchms.filtering import require_minimum_number_of_peaks
+    from matchms.filtering import select_by_relative_intensity
+
     def apply_filters(spectrum):
         spectrum = add_precursor_mz(spectrum)
         spectrum = normalize_intensities(spectrum)
         spectrum = select_by_relative_intensity(spectrum, intensity_from = min_relative_intensity,
                                                 intensity_to = max_relative_intensity)
-        spectrum = add_precursor_mz(spectrum)
         spectrum = add_losses(spectrum, loss_mz_from= loss_mz_from, loss_mz_to= loss_mz_to)
         spectrum = require_minimum_number_of_peaks(spectrum, n_required= n_required)
         return spectrum
 
-    spectra_list = [apply_filters(s) for s in load_from_mgf(path)]
-    spectra_list = [s for s in spectra_list if s is not None]
-    return spectra_list 
+    spectra = instrumentation.timed(load_from_mgf(path), 'import_data.parse_mgf', count='spectra_in')
+    filtered = (spectrum for spectrum in map(apply_filters, spectra) if spectrum is not None)
+    yield from instrumentation.timed(filtered, 'import_data.filter_spectra', count='spectra_out')
+
+def load_and_filter_from_mgf(path, min_relative_intensity, max_relative_intensity,
+                             loss_mz_from, loss_mz_to, n_required) -> list:
+    """Load and filter spectra from mgf file to prepare for MEMO matrix generation
+
+    Returns:
+        spectrums (list of matchms.spectrum): a list of matchms.spectrum objects
+    """
+    #pylint: disable=too-many-arguments
+    return list(iter_filtered_spectra(path, min_relative_intensity, max_relative_intensity,
+                                      loss_mz_from, loss_mz_to, n_required))
+
+def spectrum_words(spectrum, n_decimals, word_encoding = 'string'):
+    """Translate a filtered matchms spectrum into words
+
+    Args:
+        spectrum (matchms.spectrum): a spectrum filtered by iter_filtered_spectra
+        n_decimals (int): number of decimal when translating peaks/losses into words
+        word_encoding (str): One of [string, binned]: "peak@xx.xx" strings (spec2vec.SpectrumDocument words)
+            or integer word ids (see memo_ms.words)
+
+    Returns:
+        words (list of str or ndarray of int64): the spectrum peaks/losses words
+    """
+    if word_encoding == 'binned':
+        losses_mz = spectrum.losses.mz if spectrum.losses is not None else None
+        return words.encode(spectrum.peaks.mz, losses_mz, n_decimals)
+    if word_encoding == 'string':
+        from spec2vec import SpectrumDocument  # pylint: disable=import-outside-toplevel
+        return SpectrumDocument(spectrum, n_decimals=n_decimals).words
+    raise ValueError("word_encoding argument must be one of [string, binned]")
+
+def iter_spectra_words(path, min_relative_intensity, max_relative_intensity,
+                       loss_mz_from, loss_mz_to, n_required, n_decimals, engine = 'matchms', word_encoding = 'string'):
+    """Lazily translate the filtered spectra of a mgf file into words, without keeping the spectra
+
+    Args:
+        engine (str): One of [matchms, numpy]: import and filter spectra with matchms or with the built-in
+            NumPy parser (memo_ms.mgf), which gives the same words faster.
+        word_encoding (str): One of [string, binned]: "peak@xx.xx" strings or integer word ids (see memo_ms.words)
+
+    Yields:
+        metadata, words (dict, list of str or ndarray of int64): spectrum metadata and its peaks/losses words
+    """
+    #pylint: disable=too-many-arguments
+    if engine == 'numpy':
+        records = mgf.iter_spectra_words(path, min_relative_intensity, max_relative_intensity,
+                                         loss_mz_from, loss_mz_to, n_required, n_decimals, word_encoding)
+    elif engine == 'matchms':
+        spectra = iter_filtered_spectra(path, min_relative_intensity, max_relative_intensity,
+                                        loss_mz_from, loss_mz_to, n_required)
+        records = ((spectrum.metadata, spectrum_words(spectrum, n_decimals, word_encoding)) for spectrum in spectra)
+    else:
+        raise ValueError("engine argument must be one of [matchms, numpy]")
+    yield from instrumentation.timed(
+        records, 'import_data.spectra_words', count='spectra', words=lambda record: len(record[1])
+        )
+
+def _count_lines(path, chunksize = 2**24) -> int:
+    with open(path, 'rb') as handle:
+        return sum(block.count(b'\n') for block in iter(lambda: handle.read(chunksize), b'')) + 1
+
+def read_quant_table(path, sep = ',', index_col = 0, usecols = None, skiprows = None, dtype = np.float32,
+                     chunksize = None, fill_value = None, index_dtype = None) -> pd.DataFrame:
+    """Read a features x samples quantification table by chunks of features into a samples x features table.
+    Only usecols are parsed, and the values are stored directly in the output orientation with a compact dtype,
+    so the memory used is about the size of the output.
+
+    Args:
+        path (str): Path to the table, with features as rows and samples as columns
+        sep (str): separator
+        index_col (int or str): column of the features ids
+        usecols (list or callable): columns to read, index_col included, see pandas.read_csv. All if None.
+        skiprows (int): number of lines to skip before the header
+        dtype (numpy dtype): dtype of the values, e.g. float32. bool gives the presence (non-zero and not missing)
+            of the features.
+        chunksize (int): number of features read at once, about 1M values if None
+        fill_value (float): value replacing missing values, kept if None
+        index_dtype (type): dtype of the features ids, e.g. str, inferred by pandas if None
+
+    Returns:
+        quant_table (DataFrame): samples x features table, with the features ids as columns
+    """
+    #pylint: disable=too-many-arguments
+    dtype = np.dtype(dtype)
+    # nrows=1: with nrows=0, pandas can select the wrong columns from positional usecols
+    header = pd.read_csv(path, sep=sep, index_col=index_col, usecols=usecols, skiprows=skiprows, nrows=1)
+    dtypes = {column: float for column in header.columns}
+    if index_dtype is not None:
+        dtypes[header.index.name] = index_dtype
+    # features are stored in the rows of values: values.T is the samples x features table, without copy
+    values = np.empty((_count_lines(path), len(header.columns)), dtype=dtype)
+    if chunksize is None:
+        chunksize = max(1, 2**20 // max(len(header.columns), 1))
+    feature_ids = []
+    n_features = 0
+    reader = pd.read_csv(path, sep=sep, index_col=index_col, usecols=usecols, skiprows=skiprows,
+                         chunksize=chunksize, dtype=dtypes)
+    for chunk in reader:
+        block = chunk.to_numpy(dtype=float)
+        if dtype == bool:
+            block = (block != 0) & ~np.isnan(block)
+        elif fill_value is not None:
+            block[np.isnan(block)] = fill_value
+        values[n_features:n_features + len(block)] = block
+        n_features += len(block)
+        feature_ids.append(chunk.index)
+    feature_ids = feature_ids[0].append(feature_ids[1:]) if feature_ids else header.index[:0].astype(index_dtype or header.index.dtype)
+    return pd.DataFrame(values[:n_features].T, index=header.columns, columns=feature_ids)
 
-def import_mzmine2_quant_table(path) -> pd.DataFrame:
+def _is_mzmine_column(column):
+    return column == 'row ID' or 'Peak area' in column
+
+def import_mzmine2_quant_table(path, dtype = None, chunksize = None) -> pd.DataFrame:
     """Import feature quantification table generated from MzMine 2 and clean it
 
     Args:
         path (str): Path to feature quantification table
+        dtype (numpy dtype): If not None, read only the peak areas by chunks into this dtype (see read_quant_table),
+            e.g. float32 or bool (presence)
+        chunksize (int): number of features read at once, implies dtype float64 if dtype is None
 
     Returns:
         quant_table (DataFrame): A cleaned MzMine2 feature quantification table
     """
-    quant_table = pd.read_csv(path, sep=',')
-    quant_table.set_index('row ID', inplace=True)
-    quant_table = quant_table.filter(like='Peak area', axis=1)
-    quant_table.rename(columns = lambda x: x.replace(' Peak area', ''), inplace=True)
-    quant_table = quant_table.transpose()
+    if dtype is not None or chunksize is not None:
+        quant_table = read_quant_table(path, sep=',', index_col='row ID', usecols=_is_mzmine_column,
+                                       dtype=dtype or np.float64, chunksize=chunksize)
+    else:
+        quant_table = pd.read_csv(path, sep=',', usecols=_is_mzmine_column)
+        quant_table.set_index('row ID', inplace=True)
+        quant_table = quant_table.filter(like='Peak area', axis=1)
+        quant_table = quant_table.transpose()
+    quant_table.rename(index = lambda x: x.replace(' Peak area', ''), inplace=True)
     quant_table.index.name = 'filename'
     quant_table.columns.name = 'feature_id'
     return quant_table
 
-def import_msdial_quant_table(path) -> pd.DataFrame:
+def _msdial_header(path):
+    """Line number of the columns header of a MS-DIAL table, and the columns positions to read"""
+    with open(path, 'r', encoding='utf8') as handle:
+        top = handle.readline().rstrip('\r\n').split('\t')
+        for line_number, line in enumerate(handle, start=1):
+            columns = line.rstrip('\r\n').split('\t')
+            if columns[0] != '':
+                break
+    # as in the default import: the index, then the columns with a top header, except the MS/MS spectrum
+    positions = [0] + [position for position, name in enumerate(top) if position > 0 and name != ''
+                       and position < len(columns) and columns[position] != 'MS/MS spectrum']
+    return line_number, positions
+
+def import_msdial_quant_table(path, dtype = None, chunksize = None) -> pd.DataFrame:
     """Import feature quantification table generated from MS-DIAL and clean it
 
     Args:
         path (str): Path to feature quantification table
+        dtype (numpy dtype): If not None, read only the samples columns by chunks into this dtype
+            (see read_quant_table), e.g. float32 or bool (presence). The values are then parsed as numbers,
+            the features ids are kept as strings as in the default import.
+        chunksize (int): number of features read at once, implies dtype float64 if dtype is None
 
     Returns:
         quant_table (DataFrame): A cleaned MS-DIAL feature quantification table
     """
-    quant_table = pd.read_csv(path, sep='\t', index_col=0)
-    quant_table = quant_table.drop(quant_table.filter(regex='Unnamed').columns, axis=1)
-    quant_table = quant_table[quant_table.index.notnull()]
-    quant_table.columns = quant_table.iloc[0]
-    quant_table = quant_table.iloc[1: , :]
-    quant_table = quant_table.drop(columns=['MS/MS spectrum']).transpose()
+    if dtype is not None or chunksize is not None:
+        header_line, positions = _msdial_header(path)
+        quant_table = read_quant_table(path, sep='\t', index_col=0, usecols=positions, skiprows=header_line,
+                                       dtype=dtype or np.float64, chunksize=chunksize, index_dtype=str)
+    else:
+        quant_table = pd.read_csv(path, sep='\t', index_col=0)
+        quant_table = quant_table.drop(quant_table.filter(regex='Unnamed').columns, axis=1)
+        quant_table = quant_table[quant_table.index.notnull()]
+        quant_table.columns = quant_table.iloc[0]
+        quant_table = quant_table.iloc[1: , :]
+        quant_table = quant_table.drop(columns=['MS/MS spectrum']).transpose()
     quant_table.index.name = 'filename'
     quant_table.columns.name = 'feature_id'
     return quant_table
 
-def import_xcms_quant_table(path) -> pd.DataFrame:
+def import_xcms_quant_table(path, dtype = None, chunksize = None) -> pd.DataFrame:
     """Import feature quantification table generated from XCMS and clean it
 
     Args:
         path (str): Path to feature quantification table
+        dtype (numpy dtype): If not None, read only the samples columns by chunks into this dtype
+            (see read_quant_table), e.g. float32 or bool (presence)
+        chunksize (int): number of features read at once, implies dtype float64 if dtype is None
 
     Returns:
         quant_table (DataFrame): A cleaned XCMS feature quantification table
     """
-    quant_table = pd.read_csv(path, sep='\t', index_col=0)
-    ext = quant_table.columns[-1].split(sep='.')[-1]
-    quant_table = quant_table.filter(like=ext, axis=1)
-    quant_table.index = quant_table.index.str.replace('FT', '').astype(int)
-    quant_table = quant_table.transpose().fillna(0)
+    if dtype is not None or chunksize is not None:
+        header = pd.read_csv(path, sep='\t', index_col=0, nrows=0).columns
+        ext = header[-1].split(sep='.')[-1]
+        usecols = [0] + [position + 1 for position, column in enumerate(header) if ext in column]
+        quant_table = read_quant_table(path, sep='\t', index_col=0, usecols=usecols, dtype=dtype or np.float64,
+                                       chunksize=chunksize, fill_value=0)
+        quant_table.columns = quant_table.columns.str.replace('FT', '').astype(int)
+    else:
+        quant_table = pd.read_csv(path, sep='\t', index_col=0)
+        ext = quant_table.columns[-1].split(sep='.')[-1]
+        quant_table = quant_table.filter(like=ext, axis=1)
+        quant_table.index = quant_table.index.str.replace('FT', '').astype(int)
+        quant_table = quant_table.transpose().fillna(0)
     quant_table.index.name = 'filename'
     quant_table.columns.name = 'feature_id'
     return quant_table
 
-def import_memo_quant_table(path) -> pd.DataFrame:
+def import_memo_quant_table(path, dtype = None, chunksize = None) -> pd.DataFrame:
     """Import feature quantification table memo ready
 
     Args:
         path (str): Path to a MEMO ready feature quantification table: a csv file (sep = ",") with feature as rows and samples as columns.
 The first column must contain feature's ID and the header must be "feature_id". 
+        dtype (numpy dtype): If not None, read the table by chunks into this dtype (see read_quant_table),
+            e.g. float32 or bool (presence)
+        chunksize (int): number of features read at once, implies dtype float64 if dtype is None
 
     Returns:
         quant_table (DataFrame): A cleaned feature quantification table
     """
-    quant_table = pd.read_csv(path, sep=',', index_col=0)
-    quant_table = quant_table.transpose()
+    if dtype is not None or chunksize is not None:
+        quant_table = read_quant_table(path, sep=',', index_col=0, dtype=dtype or np.float64, chunksize=chunksize)
+    else:
+        quant_table = pd.read_csv(path, sep=',', index_col=0)
+        quant_table = quant_table.transpose()
     quant_table.index.name = 'filename'
     return quant_table
+
+def import_matrix(path, sep = ',', file_format = None, dense = None):
+    """Import a MEMO matrix or feature table exported with export_matrix
+
+    Args:
+        path (str): Path to the exported table
+        sep (str): separator, for csv files
+        file_format (str): One of [csv, parquet, feather, npz, memmap]. Defaults to memmap for a disk matrix directory,
+            else to the path extension, csv if unknown.
+        dense (bool): for npz and memmap files, return a DataFrame (True) or a SparseTable (False). Defaults to the
+            exported type. The SparseTable of a memmap directory shares its read-only memory maps, without copy.
+
+    Returns:
+        table (DataFrame or SparseTable): the exported table
+    """
+    file_format = export_data.file_format_from_path(path, file_format)
+    if file_format == 'npz':
+        return sparse.load_npz(path, dense=dense)
+    if file_format == 'memmap':
+        matrix = ondisk.DiskMatrix(path)
+        if dense or (dense is None and matrix.dense_dtype is not None):
+            return matrix.to_dense()
+        return matrix.to_sparse(copy=False)
+    if file_format == 'csv':
+        return pd.read_csv(path, sep=sep, index_col=0)
+    pyarrow = export_data.import_pyarrow()
+    if file_format == 'parquet':
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+        arrow_table = pyarrow.parquet.read_table(path)
+    else:
+        import pyarrow.feather  # pylint: disable=import-outside-toplevel
+        arrow_table = pyarrow.feather.read_table(path)
+    return export_data.table_from_arrow(arrow_table)
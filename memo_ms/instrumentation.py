@@ -0,0 +1,261 @@
+"""Opt-in timing and memory instrumentation of the MEMO pipeline stages.
+
+While a profile is active, each instrumented stage of import_data, mgf, sparse and classes records its wall
+time, CPU time, the peak resident set size (RSS) of the process and item counts (spectra read and kept, words,
+samples...) in a Report, optionally emitted as one JSON log message per stage:
+
+    with instrumentation.profile(json_logs=True) as report:
+        memo_matrix.memo_from_aligned_samples(FeatureTable(...), SpectraDocuments(...))
+    print(report.summary())
+
+Streamed stages (spectra parsed, filtered and translated into words one at a time) only account the time spent
+producing their items, not the time of their consumer. Stages are nested: the times of a stage include those of
+the stages it runs. CPU times include the worker processes of the pools closed during the stage, stages run in
+worker processes are not recorded. Outside of a profile, instrumentation only costs a flag check.
+"""
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+import json
+import logging
+import os
+import sys
+import time
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+LOGGER = logging.getLogger(__name__)
+
+_REPORT = None
+_JSON_LOGS = False
+_OPEN_STAGES = []
+
+
+def peak_rss():
+    """Peak resident set size of the process
+
+    Returns:
+        peak_rss (int): number of bytes, None if not available on this platform
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def cpu_time() -> float:
+    """CPU time (user and system) of the process and of its terminated children, in seconds"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+@dataclass
+class StageRecord:
+    """Measures of a pipeline stage
+
+    Args:
+        name (str): name of the stage
+        parent (str): name of the stage running it, None for top level stages
+        wall_time (float): elapsed time in seconds
+        cpu_time (float): CPU time in seconds
+        peak_rss (int): peak RSS of the process at the end of the stage, in bytes
+        peak_rss_increase (int): increase of the peak RSS during the stage, in bytes
+        counts (dict): {item: count}, e.g. spectra_in, spectra_out, words, samples
+    """
+    name : str
+    parent : str = None
+    wall_time : float = 0.
+    cpu_time : float = 0.
+    peak_rss : int = None
+    peak_rss_increase : int = None
+    counts : dict = field(default_factory=dict)
+
+    def count(self, **counts):
+        """Add to the item counts of the stage, e.g. record.count(spectra_out=10)"""
+        for item, count in counts.items():
+            self.counts[item] = self.counts.get(item, 0) + int(count)
+
+
+class _NullRecord:
+    """Stand-in for StageRecord outside of a profile"""
+
+    def count(self, **counts):
+        pass
+
+
+_NULL_RECORD = _NullRecord()
+
+
+@dataclass
+class Report:
+    """Measures of the stages run during a profile, in completion order
+
+    Returns:
+        self.stages (list of StageRecord): the stage records
+    """
+    stages : list = field(default_factory=list)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Table of the stage records, one row per stage and one column per count"""
+        columns = [column for column in asdict(StageRecord('')) if column != 'counts']
+        counts = list(dict.fromkeys(item for record in self.stages for item in record.counts))
+        records = [{**asdict(record), **record.counts} for record in self.stages]
+        return pd.DataFrame(records, columns=columns + counts)
+
+    def summary(self) -> pd.DataFrame:
+        """Stage records aggregated by name: summed times and counts, maximal peak RSS
+
+        Returns:
+            summary (DataFrame): one row per stage name, in order of first completion
+        """
+        table = self.to_frame()
+        aggregations = {'wall_time': 'sum', 'cpu_time': 'sum', 'peak_rss': 'max', 'peak_rss_increase': 'sum'}
+        aggregations.update({column: 'sum' for column in table.columns if column not in aggregations and column not in ('name', 'parent')})
+        summary = table.groupby('name', sort=False).agg(aggregations)
+        summary.insert(0, 'calls', table.groupby('name', sort=False).size())
+        return summary
+
+    def to_json(self, path = None):
+        """Serialize the stage records as JSON
+
+        Args:
+            path (str): if not None, file where the JSON is written
+
+        Returns:
+            report (str): the JSON document, a list of stage records
+        """
+        report = json.dumps([asdict(record) for record in self.stages], indent=2)
+        if path is not None:
+            with open(path, 'w', encoding='utf8') as handle:
+                handle.write(report)
+        return report
+
+
+def enabled() -> bool:
+    """True while a profile is active"""
+    return _REPORT is not None
+
+def enable(json_logs = False) -> Report:
+    """Start recording the pipeline stages, see profile
+
+    Args:
+        json_logs (bool): also emit each stage record as a JSON message on the memo_ms.instrumentation logger
+
+    Returns:
+        report (Report): the report the stages are recorded in
+    """
+    global _REPORT, _JSON_LOGS #pylint: disable=global-statement
+    _REPORT = Report()
+    _JSON_LOGS = json_logs
+    return _REPORT
+
+def disable() -> Report:
+    """Stop recording the pipeline stages
+
+    Returns:
+        report (Report): the recorded stages, None if instrumentation was not enabled
+    """
+    global _REPORT #pylint: disable=global-statement
+    report, _REPORT = _REPORT, None
+    _OPEN_STAGES.clear()
+    return report
+
+@contextmanager
+def profile(json_logs = False):
+    """Record the pipeline stages run in the context
+
+    Args:
+        json_logs (bool): also emit each stage record as a JSON message (INFO level) on the
+            memo_ms.instrumentation logger
+
+    Yields:
+        report (Report): the report filled with the stage records
+    """
+    report = enable(json_logs)
+    try:
+        yield report
+    finally:
+        disable()
+
+def _start(name) -> StageRecord:
+    return StageRecord(name, parent=_OPEN_STAGES[-1].name if _OPEN_STAGES else None, peak_rss=peak_rss())
+
+def _finish(record):
+    rss = peak_rss()
+    if rss is not None:
+        record.peak_rss_increase = rss - record.peak_rss
+        record.peak_rss = rss
+    if _REPORT is not None:
+        _REPORT.stages.append(record)
+        if _JSON_LOGS:
+            LOGGER.info(json.dumps(asdict(record)))
+
+@contextmanager
+def stage(name, **counts):
+    """Measure a pipeline stage
+
+    Args:
+        name (str): name of the stage, e.g. MemoMatrix.filter
+        counts: initial item counts of the stage
+
+    Yields:
+        record (StageRecord): record to add item counts to with record.count(), a no-op outside of a profile
+    """
+    if _REPORT is None:
+        yield _NULL_RECORD
+        return
+    record = _start(name)
+    record.count(**counts)
+    _OPEN_STAGES.append(record)
+    wall, cpu = time.perf_counter(), cpu_time()
+    try:
+        yield record
+    finally:
+        record.wall_time = time.perf_counter() - wall
+        record.cpu_time = cpu_time() - cpu
+        if _OPEN_STAGES and _OPEN_STAGES[-1] is record:
+            _OPEN_STAGES.pop()
+        _finish(record)
+
+def timed(iterable, name, count = None, **sums):
+    """Measure a streamed stage: only the time spent producing the items of iterable is accounted
+
+    Args:
+        iterable (iterable): the items produced by the stage
+        name (str): name of the stage
+        count (str): if not None, name of the count of items
+        sums (callable): {count name: function of an item returning the number to add to this count},
+            e.g. words=len
+
+    Returns:
+        iterable (iterable): iterable itself outside of a profile, else an iterator over its items
+    """
+    if _REPORT is None:
+        return iterable
+    return _timed(iterable, name, count, sums)
+
+def _timed(iterable, name, count, sums):
+    record = _start(name)
+    if count is not None:
+        record.counts[count] = 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            wall, cpu = time.perf_counter(), cpu_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                record.wall_time += time.perf_counter() - wall
+                record.cpu_time += cpu_time() - cpu
+            if count is not None:
+                record.counts[count] += 1
+            for item_count, function in sums.items():
+                record.count(**{item_count: function(item)})
+            yield item
+    finally:
+        _finish(record)
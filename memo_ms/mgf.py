@@ -0,0 +1,273 @@
+"""NumPy based .mgf reader specialized for MEMO: a fast alternative to matchms import and filters.
+
+Only what MEMO needs is parsed (header fields as strings, PEPMASS, CHARGE and the peaks m/z and intensities),
+and the matchms filters used in import_data.load_and_filter_from_mgf are applied as array operations.
+Spectra are filtered by batches: the peaks of batch_size spectra are concatenated in ragged arrays (peaks
+m/z and intensities plus the offsets of each spectrum), normalized, selected, rejected and turned into losses
+in a few NumPy passes over the whole batch (filter_batch).
+"""
+from dataclasses import dataclass
+import numpy as np
+from memo_ms import instrumentation
+from memo_ms import words
+
+BATCH_SIZE = 512
+
+
+def _parse_charge(value):
+    value = value.strip()
+    sign = -1 if value.endswith('-') else 1
+    try:
+        return sign * int(value.rstrip('+-'))
+    except ValueError:
+        return value
+
+def _parse_pepmass(value):
+    fields = value.split()
+    mass = float(fields[0])
+    intensity = float(fields[1]) if len(fields) > 1 else None
+    return (mass, intensity)
+
+def _parse_peaks(lines):
+    if not lines:
+        return np.empty(0), np.empty(0)
+    n_columns = len(lines[0].split())
+    values = np.array(' '.join(lines).split(), dtype=float)
+    if values.size != n_columns * len(lines):
+        values = np.array([line.split()[:2] for line in lines], dtype=float)
+        n_columns = 2
+    values = values.reshape(len(lines), n_columns)
+    return values[:, 0], values[:, 1]
+
+def iter_mgf(path):
+    """Lazily read the spectra of a mgf file
+
+    Args:
+        path (str): Path to spectra file (.mgf)
+
+    Yields:
+        metadata, mz, intensities (dict, ndarray, ndarray): header fields (lower case keys) and the peaks, sorted by m/z.
+        PEPMASS is parsed to a (mass, intensity) tuple and copied to precursor_mz, CHARGE is parsed to an int.
+    """
+    metadata = None
+    peaks = []
+    with open(path, 'r', encoding='utf8') as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            if metadata is None:
+                if line == 'BEGIN IONS':
+                    metadata = {}
+                    peaks = []
+                continue
+            if line == 'END IONS':
+                if 'pepmass' in metadata:
+                    metadata['precursor_mz'] = metadata['pepmass'][0]
+                mz, intensities = _parse_peaks(peaks)
+                if not np.all(mz[:-1] <= mz[1:]):
+                    idx_sorted = np.argsort(mz)
+                    mz, intensities = mz[idx_sorted], intensities[idx_sorted]
+                yield metadata, mz, intensities
+                metadata = None
+            elif line[0].isdigit():
+                peaks.append(line)
+            elif '=' in line:
+                key, value = line.split('=', 1)
+                key = key.lower()
+                if key == 'pepmass':
+                    metadata[key] = _parse_pepmass(value)
+                elif key == 'charge':
+                    metadata[key] = _parse_charge(value)
+                else:
+                    metadata[key] = value
+
+def iter_batches(spectra, batch_size = BATCH_SIZE):
+    """Group spectra into ragged batches
+
+    Args:
+        spectra (iterable): (metadata, mz, intensities) spectra, e.g. iter_mgf(path)
+        batch_size (int): number of spectra per batch
+
+    Yields:
+        metadata, mz, intensities, offsets (list of dict, ndarray, ndarray, ndarray): metadata of the spectra of
+        the batch, their concatenated peaks and the offsets of the peaks of each spectrum (len(metadata) + 1 values)
+    """
+    batch = []
+    for spectrum in spectra:
+        batch.append(spectrum)
+        if len(batch) == batch_size:
+            yield _ragged(batch)
+            batch = []
+    if batch:
+        yield _ragged(batch)
+
+def _ragged(batch):
+    metadata = [spectrum[0] for spectrum in batch]
+    lengths = [len(spectrum[1]) for spectrum in batch]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.intp)
+    mz = np.concatenate([spectrum[1] for spectrum in batch]) if offsets[-1] > 0 else np.empty(0)
+    intensities = np.concatenate([spectrum[2] for spectrum in batch]) if offsets[-1] > 0 else np.empty(0)
+    return metadata, mz, intensities, offsets
+
+def filter_batch(mz, intensities, offsets, precursor_mz, min_relative_intensity, max_relative_intensity,
+                 loss_mz_from, loss_mz_to, n_required):
+    """Array equivalent of the matchms filters applied in import_data.load_and_filter_from_mgf, applied to the
+    ragged peaks arrays of many spectra at once
+
+    Args:
+        mz (ndarray): concatenated peaks m/z, sorted within each spectrum
+        intensities (ndarray): concatenated peaks intensities
+        offsets (ndarray): offsets of the peaks of each spectrum in mz (number of spectra + 1 values)
+        precursor_mz (ndarray): precursor m/z of each spectrum, losses are not computed if NaN or 0
+        Other arguments: see import_data.load_and_filter_from_mgf
+
+    Returns:
+        kept, peaks_mz, peaks_offsets, losses_mz, losses_offsets (ndarray): mask of the spectra passing the filters,
+        and the ragged arrays of their kept peaks and losses m/z (kept.sum() + 1 offsets)
+    """
+    #pylint: disable=too-many-arguments,too-many-locals
+    lengths = np.diff(offsets)
+    spectrum_of_peak = np.repeat(np.arange(len(lengths)), lengths)
+    # normalize by the maximal intensity of each (non-empty) spectrum, spectra with a maximum <= 0 are rejected
+    non_empty = lengths > 0
+    max_intensity = np.ones(len(lengths))
+    if non_empty.any():
+        max_intensity[non_empty] = np.maximum.reduceat(intensities, offsets[:-1][non_empty])
+    rejected = non_empty & (max_intensity <= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized_intensities = intensities / max_intensity[spectrum_of_peak]
+    selected = (min_relative_intensity <= normalized_intensities) & (normalized_intensities <= max_relative_intensity)
+    kept = ~rejected & (np.bincount(spectrum_of_peak[selected], minlength=len(lengths)) >= n_required)
+    selected &= kept[spectrum_of_peak]
+    peaks_mz = mz[selected]
+    spectrum_of_peak = spectrum_of_peak[selected]
+    peaks_offsets = np.concatenate([[0], np.cumsum(np.bincount(spectrum_of_peak, minlength=len(lengths))[kept])])
+
+    # losses of each spectrum are its peaks in reverse order, subtracted from the precursor m/z
+    precursor_mz = np.asarray(precursor_mz, dtype=float)
+    has_precursor = ~np.isnan(precursor_mz) & (precursor_mz != 0)
+    starts = np.repeat(peaks_offsets[:-1], np.diff(peaks_offsets))
+    stops = np.repeat(peaks_offsets[1:], np.diff(peaks_offsets))
+    reverse = starts + stops - 1 - np.arange(len(peaks_mz))
+    spectrum_of_loss = spectrum_of_peak[reverse]
+    losses_mz = precursor_mz[spectrum_of_loss] - peaks_mz[reverse]
+    in_range = has_precursor[spectrum_of_loss] & (losses_mz >= loss_mz_from) & (losses_mz <= loss_mz_to)
+    losses_mz = losses_mz[in_range]
+    losses_offsets = np.concatenate([[0], np.cumsum(np.bincount(spectrum_of_loss[in_range], minlength=len(lengths))[kept])])
+    return kept, peaks_mz, peaks_offsets, losses_mz, losses_offsets
+
+def to_words(peaks_mz, losses_mz, n_decimals):
+    """Translate peaks and losses m/z into words, as spec2vec.SpectrumDocument does
+
+    Returns:
+        words (list of str): "peak@xx.xx" words followed by "loss@yy.yy" words
+    """
+    return [f"peak@{mz:.{n_decimals}f}" for mz in peaks_mz] + [f"loss@{mz:.{n_decimals}f}" for mz in losses_mz]
+
+def _batch_words(peaks_mz, peaks_offsets, losses_mz, losses_offsets, n_decimals, word_encoding):
+    """Translate the ragged peaks and losses of a batch into the words of each spectrum"""
+    if word_encoding == 'binned':
+        peaks = words.bin_mz(peaks_mz, n_decimals) << 1
+        losses = (words.bin_mz(losses_mz, n_decimals) << 1) | words.LOSS_FLAG
+        return [
+            np.concatenate([peaks[peaks_offsets[i]:peaks_offsets[i + 1]], losses[losses_offsets[i]:losses_offsets[i + 1]]])
+            for i in range(len(peaks_offsets) - 1)
+            ]
+    peaks = [f"peak@{mz:.{n_decimals}f}" for mz in peaks_mz.tolist()]
+    losses = [f"loss@{mz:.{n_decimals}f}" for mz in losses_mz.tolist()]
+    return [
+        peaks[peaks_offsets[i]:peaks_offsets[i + 1]] + losses[losses_offsets[i]:losses_offsets[i + 1]]
+        for i in range(len(peaks_offsets) - 1)
+        ]
+
+def _filtered_words(batches, min_relative_intensity, max_relative_intensity, loss_mz_from, loss_mz_to, n_required,
+                    n_decimals, word_encoding):
+    """Filter ragged batches of spectra and translate the kept ones into words, see iter_spectra_words"""
+    #pylint: disable=too-many-arguments
+    for metadata, mz, intensities, offsets in batches:
+        precursor_mz = [np.nan if spectrum.get('precursor_mz') is None else spectrum['precursor_mz'] for spectrum in metadata]
+        kept, *ragged = filter_batch(mz, intensities, offsets, precursor_mz, min_relative_intensity,
+                                     max_relative_intensity, loss_mz_from, loss_mz_to, n_required)
+        yield from zip((spectrum for spectrum, keep in zip(metadata, kept) if keep),
+                       _batch_words(*ragged, n_decimals, word_encoding))
+
+def iter_spectra_words(path, min_relative_intensity, max_relative_intensity,
+                       loss_mz_from, loss_mz_to, n_required, n_decimals, word_encoding = 'string', batch_size = BATCH_SIZE):
+    """Lazily read, filter and translate the spectra of a mgf file into words, batch_size spectra at a time
+
+    Args:
+        word_encoding (str): One of [string, binned]: "peak@xx.xx" strings or integer word ids (see memo_ms.words)
+        batch_size (int): number of spectra filtered and translated at once, see filter_batch
+
+    Yields:
+        metadata, words (dict, list of str or ndarray of int64): spectrum metadata and its peaks/losses words
+    """
+    if word_encoding not in ('string', 'binned'):
+        raise ValueError("word_encoding argument must be one of [string, binned]")
+    #pylint: disable=too-many-arguments
+    spectra = instrumentation.timed(iter_mgf(path), 'mgf.parse_mgf', count='spectra_in')
+    records = _filtered_words(iter_batches(spectra, batch_size), min_relative_intensity, max_relative_intensity,
+                              loss_mz_from, loss_mz_to, n_required, n_decimals, word_encoding)
+    yield from instrumentation.timed(records, 'mgf.filter_spectra', count='spectra_out')
+
+
+@dataclass
+class PeakStore:
+    """Raw (unfiltered) peaks of all the spectra of a mgf file, parsed once with read_peak_store and filtered
+    as many times as needed with different parameters, e.g. in a parameter sweep (see memo_ms.sweep)
+
+    Args:
+        metadata (list of dict): metadata of the spectra, see iter_mgf
+        mz (ndarray): concatenated peaks m/z, sorted within each spectrum
+        intensities (ndarray): concatenated peaks intensities
+        offsets (ndarray): offsets of the peaks of each spectrum (number of spectra + 1 values)
+    """
+    metadata : list
+    mz : np.ndarray
+    intensities : np.ndarray
+    offsets : np.ndarray
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def batches(self, batch_size = BATCH_SIZE):
+        """Ragged batches of spectra, as iter_batches yields them. The peaks arrays are views of the store.
+
+        Args:
+            batch_size (int): number of spectra per batch
+
+        Yields:
+            metadata, mz, intensities, offsets (list of dict, ndarray, ndarray, ndarray): see iter_batches
+        """
+        for start in range(0, len(self), batch_size):
+            offsets = self.offsets[start:start + batch_size + 1]
+            yield (self.metadata[start:start + batch_size], self.mz[offsets[0]:offsets[-1]],
+                   self.intensities[offsets[0]:offsets[-1]], offsets - offsets[0])
+
+    def iter_spectra_words(self, min_relative_intensity, max_relative_intensity, loss_mz_from, loss_mz_to, n_required,
+                           n_decimals, word_encoding = 'string', batch_size = BATCH_SIZE):
+        """Filter and translate the stored spectra into words, see the iter_spectra_words function
+
+        Yields:
+            metadata, words (dict, list of str or ndarray of int64): spectrum metadata and its peaks/losses words
+        """
+        #pylint: disable=too-many-arguments
+        if word_encoding not in ('string', 'binned'):
+            raise ValueError("word_encoding argument must be one of [string, binned]")
+        records = _filtered_words(self.batches(batch_size), min_relative_intensity, max_relative_intensity,
+                                  loss_mz_from, loss_mz_to, n_required, n_decimals, word_encoding)
+        yield from instrumentation.timed(records, 'mgf.filter_spectra', count='spectra_out')
+
+
+def read_peak_store(path) -> PeakStore:
+    """Parse all the spectra of a mgf file into a PeakStore
+
+    Args:
+        path (str): Path to spectra file (.mgf)
+
+    Returns:
+        peak_store (PeakStore): the raw peaks and metadata of the spectra
+    """
+    spectra = list(instrumentation.timed(iter_mgf(path), 'mgf.parse_mgf', count='spectra_in'))
+    return PeakStore(*_ragged(spectra))
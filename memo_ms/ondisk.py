@@ -0,0 +1,453 @@
+"""Out-of-core MEMO matrices: sparse matrices stored in a directory and read by blocks of rows.
+
+A disk matrix directory holds the CSR arrays of a samples x words matrix as raw binary files (data.bin,
+indices.bin, indptr.bin), its samples index (index.npy), its words vocabulary (columns.npy) and a meta.json
+file with the shape, the dtypes and the names of the index and columns. DiskMatrix opens the CSR arrays as
+read-only memory maps: only the rows being processed are read, so filter_table, export_data.export_table
+and distances.pdist work on matrices larger than the memory.
+
+Any MEMO matrix can be exported in this layout (export_matrix with file_format='memmap'). DiskMatrix.to_sparse
+(copy=False), used by memo_from_file, opens it as a SparseTable sharing the memory maps: opening is immediate
+whatever the size of the matrix, and the processes opening the same matrix share its pages through the OS cache
+instead of each parsing and holding a private copy.
+
+from_counters builds the MEMO matrix of more unaligned samples than fit in memory (MemoMatrix.memo_from_unaligned_samples
+with disk_dir) in three passes: the words counted in each shard of samples are spilled to a shard file, the
+vocabulary is built from the shards, then the shards are remapped on the vocabulary and appended to the matrix
+arrays one after the other.
+"""
+from dataclasses import dataclass, field
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from memo_ms import instrumentation
+from memo_ms import sparse
+from memo_ms import words
+
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+BLOCK_SIZE = 1024
+DATA_DTYPE = np.float64
+INDEX_DTYPE = np.int64
+
+
+def is_disk_matrix(path) -> bool:
+    """True if path is a disk matrix directory"""
+    return os.path.isfile(os.path.join(str(path), META_FILE))
+
+def _memmap(path, dtype, length):
+    if length == 0:  # empty files cannot be memory mapped
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+
+@dataclass
+class DiskMatrix:
+    """Open a disk matrix directory, see write, MatrixWriter and from_counters to create one
+
+    Args:
+        path (str): the disk matrix directory
+
+    Returns:
+        self.data, self.indices, self.indptr (memmap): the CSR arrays, as read-only memory maps
+        self.index (Index): Samples names, one per row
+        self.columns (Index): Words vocabulary, one per column
+        self.n_decimals (int): n_decimals of the word ids, None for string words (see sparse.SparseTable)
+        self.dense_dtype (str): dtype of the exported DataFrame, None if a sparse matrix was exported
+    """
+    path : str
+    data : np.ndarray = field(init=False, repr=False)
+    indices : np.ndarray = field(init=False, repr=False)
+    indptr : np.ndarray = field(init=False, repr=False)
+    index : pd.Index = field(init=False, repr=False)
+    columns : pd.Index = field(init=False, repr=False)
+    n_decimals : int = field(init=False)
+    dense_dtype : str = field(init=False)
+
+    def __post_init__(self):
+        self.path = str(self.path)
+        with open(os.path.join(self.path, META_FILE), 'r', encoding='utf8') as handle:
+            meta = json.load(handle)
+        if meta['version'] > FORMAT_VERSION:
+            raise ValueError(f"{self.path} was written by a newer version of memo_ms")
+        n_rows, self._n_columns = meta['shape']
+        self.data = _memmap(os.path.join(self.path, 'data.bin'), meta['data_dtype'], meta['nnz'])
+        self.indices = _memmap(os.path.join(self.path, 'indices.bin'), meta['index_dtype'], meta['nnz'])
+        self.indptr = _memmap(os.path.join(self.path, 'indptr.bin'), meta['index_dtype'], n_rows + 1)
+        self.index = sparse.index_from_array(np.load(os.path.join(self.path, 'index.npy')), meta['index_name'])
+        self.columns = sparse.index_from_array(np.load(os.path.join(self.path, 'columns.npy')), meta['columns_name'])
+        self.n_decimals = meta['n_decimals']
+        self.dense_dtype = meta.get('dense_dtype')
+
+    def __getstate__(self):
+        # pickled (e.g. sent to worker processes) as its path, the memory maps are opened again
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.__post_init__()
+
+    @property
+    def shape(self):
+        """(number of samples, number of words)"""
+        return (len(self.index), self._n_columns)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def nnz(self) -> int:
+        """Number of non-zero counts"""
+        return len(self.data)
+
+    @property
+    def labels(self) -> pd.Index:
+        """Columns as string words, decoding word ids if needed"""
+        if self.n_decimals is None:
+            return self.columns
+        return pd.Index(words.decode(self.columns, self.n_decimals), dtype=object)
+
+    def rows(self, start, stop) -> sparse.SparseTable:
+        """Read the consecutive rows start:stop
+
+        Args:
+            start (int): first row
+            stop (int): row after the last one
+
+        Returns:
+            SparseTable (SparseTable): the rows, in memory
+        """
+        stop = min(stop, len(self))
+        begin, end = self.indptr[start], self.indptr[stop]
+        counts = scipy.sparse.csr_matrix(
+            (np.array(self.data[begin:end]), np.array(self.indices[begin:end]), np.array(self.indptr[start:stop + 1]) - begin),
+            shape=(stop - start, self.shape[1])
+            )
+        return sparse.SparseTable(counts, self.index[start:stop], self.columns, self.n_decimals)
+
+    def take(self, rows) -> sparse.SparseTable:
+        """Read some rows, only accessing their non-zero counts
+
+        Args:
+            rows (array-like): positions or boolean mask of the rows
+
+        Returns:
+            SparseTable (SparseTable): the rows, in memory
+        """
+        rows = np.asarray(rows)
+        rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.intp, copy=False)
+        starts = np.asarray(self.indptr[rows])
+        lengths = np.asarray(self.indptr[rows + 1]) - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+        counts = scipy.sparse.csr_matrix(
+            (self.data[positions], self.indices[positions], np.concatenate([[0], np.cumsum(lengths)])),
+            shape=(len(rows), self.shape[1])
+            )
+        return sparse.SparseTable(counts, self.index[rows], self.columns, self.n_decimals)
+
+    def iter_blocks(self, block_size = BLOCK_SIZE, start = 0):
+        """Read the rows by blocks
+
+        Args:
+            block_size (int): number of rows read at once
+            start (int): first row
+
+        Yields:
+            block (SparseTable): block_size consecutive rows (less for the last block)
+        """
+        for block_start in range(start, len(self), block_size):
+            yield self.rows(block_start, block_start + block_size)
+
+    def occurences(self, rows = None, block_size = BLOCK_SIZE) -> np.ndarray:
+        """Count in how many samples each word occurs, going through the matrix by blocks of rows
+
+        Args:
+            rows (ndarray of bool): Restrict the count to these rows, all if None
+            block_size (int): number of rows read at once
+
+        Returns:
+            occurences (ndarray): Number of samples with a non-zero count, per column
+        """
+        counts = np.zeros(self.shape[1], dtype=np.int64)
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            kept = None if rows is None else np.asarray(rows[start:stop], dtype=bool)
+            if kept is not None and not kept.any():
+                continue
+            indptr = np.asarray(self.indptr[start:stop + 1])
+            indices = np.asarray(self.indices[indptr[0]:indptr[-1]])
+            if kept is not None and not kept.all():
+                indices = indices[np.repeat(kept, np.diff(indptr))]
+            counts += np.bincount(indices, minlength=self.shape[1])
+        return counts
+
+    def to_sparse(self, copy = True) -> sparse.SparseTable:
+        """The whole matrix as a SparseTable
+
+        Args:
+            copy (bool): read the matrix in memory. If False, the counts of the SparseTable are the read-only memory
+                maps themselves: nothing is read before it is used, and the pages read are shared with the other
+                processes opening the matrix.
+
+        Returns:
+            SparseTable (SparseTable): the matrix
+        """
+        if copy:
+            return self.rows(0, len(self))
+        counts = scipy.sparse.csr_matrix(self.shape)
+        counts.data, counts.indices, counts.indptr = self.data, self.indices, self.indptr
+        return sparse.SparseTable(counts, self.index, self.columns, self.n_decimals)
+
+    def to_dense(self) -> pd.DataFrame:
+        """Load the whole matrix in memory as a dense table, with the exported dtype of a DataFrame
+
+        Returns:
+            table (DataFrame): see sparse.SparseTable.to_dense
+        """
+        return self.to_sparse(copy=False).to_dense().astype(self.dense_dtype or 'float64', copy=False)
+
+    def to_csv(self, path, sep = ',', chunksize = BLOCK_SIZE):
+        """Write the matrix as csv, reading and densifying at most chunksize rows at a time
+
+        Args:
+            path (str): path to export
+            sep (str): separator
+            chunksize (int): number of rows written at once
+
+        Returns:
+            None
+        """
+        with open(path, 'w', encoding='utf8', newline='') as handle:
+            if len(self) == 0:
+                self.to_dense().to_csv(handle, sep=sep)
+            for start, block in zip(range(0, len(self), chunksize), self.iter_blocks(chunksize)):
+                block.to_dense().to_csv(handle, sep=sep, header=start == 0)
+
+
+class MatrixWriter:
+    """Write a disk matrix directory by blocks of rows: the blocks are appended to the CSR arrays files
+
+        with MatrixWriter(path, columns) as writer:
+            for block in blocks:
+                writer.append(block)
+        disk_matrix = writer.matrix
+
+    Args:
+        path (str): the disk matrix directory, created or replaced
+        columns (Index): Words vocabulary of the matrix
+        n_decimals (int): n_decimals of the word ids, None for string words
+        dense_dtype (str): dtype of the DataFrame written, if any, see DiskMatrix
+
+    Returns:
+        self.matrix (DiskMatrix): the written matrix, once closed
+    """
+
+    def __init__(self, path, columns, n_decimals = None, dense_dtype = None):
+        self.path = str(path)
+        self.columns = pd.Index(columns)
+        self.n_decimals = n_decimals
+        self.dense_dtype = dense_dtype
+        self.matrix = None
+        self._index = []
+        self._nnz = 0
+        os.makedirs(self.path, exist_ok=True)
+        # the files are written to temporary files, which replace those of the directory once closed: a matrix of
+        # the same directory still open (memory mapped) keeps reading its own files
+        self._files = {}
+        self._temporaries = {}
+        for name in ('data.bin', 'indices.bin', 'indptr.bin', 'index.npy', 'columns.npy', META_FILE):
+            handle, self._temporaries[name] = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            self._files[name] = os.fdopen(handle, 'w' if name == META_FILE else 'wb')
+        np.zeros(1, dtype=INDEX_DTYPE).tofile(self._files['indptr.bin'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, *args):
+        if error_type is None:
+            self.close()
+        else:
+            for name, handle in self._files.items():
+                handle.close()
+                os.remove(self._temporaries[name])
+        return False
+
+    def append(self, table):
+        """Append rows to the matrix
+
+        Args:
+            table (SparseTable): rows whose columns are the vocabulary of the matrix
+
+        Returns:
+            None
+        """
+        if table.shape[1] != len(self.columns):
+            raise ValueError("table columns do not match the columns of the matrix")
+        counts = table.counts
+        if not counts.has_sorted_indices:
+            counts = counts.sorted_indices()
+        counts.data.astype(DATA_DTYPE, copy=False).tofile(self._files['data.bin'])
+        counts.indices.astype(INDEX_DTYPE, copy=False).tofile(self._files['indices.bin'])
+        (counts.indptr[1:].astype(INDEX_DTYPE) + self._nnz).tofile(self._files['indptr.bin'])
+        self._nnz += counts.nnz
+        self._index.append(table.index)
+
+    def close(self) -> DiskMatrix:
+        """Write the index, vocabulary and meta data of the matrix and open it
+
+        Returns:
+            matrix (DiskMatrix): the written matrix
+        """
+        index = self._index[0].append(self._index[1:]) if self._index else pd.Index([], dtype=object)
+        np.save(self._files['index.npy'], sparse.index_to_array(index), allow_pickle=False)
+        np.save(self._files['columns.npy'], sparse.index_to_array(self.columns), allow_pickle=False)
+        meta = {
+            'version': FORMAT_VERSION, 'shape': [len(index), len(self.columns)], 'nnz': self._nnz,
+            'data_dtype': np.dtype(DATA_DTYPE).name, 'index_dtype': np.dtype(INDEX_DTYPE).name,
+            'index_name': index.name, 'columns_name': self.columns.name, 'n_decimals': self.n_decimals,
+            'dense_dtype': self.dense_dtype
+            }
+        json.dump(meta, self._files[META_FILE], indent=2)
+        for handle in self._files.values():
+            handle.close()
+        # meta.json is replaced last, and removed before: an interrupted writer does not leave a readable matrix
+        if os.path.exists(os.path.join(self.path, META_FILE)):
+            os.remove(os.path.join(self.path, META_FILE))
+        for name, temporary in self._temporaries.items():
+            os.replace(temporary, os.path.join(self.path, name))
+        self.matrix = DiskMatrix(self.path)
+        return self.matrix
+
+
+def write(table, path, block_size = BLOCK_SIZE) -> DiskMatrix:
+    """Write a table to a disk matrix directory
+
+    Args:
+        table (SparseTable, DiskMatrix or DataFrame): the table to write. Missing values of a DataFrame are considered
+            as 0, and the DataFrame is loaded back as a DataFrame with the same dtype.
+        path (str): the disk matrix directory, created or replaced
+        block_size (int): number of rows written at once
+
+    Returns:
+        matrix (DiskMatrix): the written matrix
+    """
+    dense_dtype = getattr(table, 'dense_dtype', None)
+    if isinstance(table, pd.DataFrame):
+        dtypes = table.dtypes.unique()
+        dense_dtype = str(dtypes[0]) if len(dtypes) == 1 else 'float64'
+        blocks = (sparse.from_dense(table.iloc[start:start + block_size]) for start in range(0, len(table), block_size))
+    elif isinstance(table, DiskMatrix):
+        blocks = table.iter_blocks(block_size)
+    else:
+        blocks = (table.take(rows=np.arange(start, min(start + block_size, len(table)))) for start in range(0, len(table), block_size))
+    with MatrixWriter(path, table.columns, getattr(table, 'n_decimals', None), dense_dtype) as writer:
+        for block in blocks:
+            writer.append(block)
+    return writer.matrix
+
+
+def filter_table(matrix, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0,
+                 max_rel_occurence = 1, path = None, block_size = BLOCK_SIZE):
+    """Block-wise equivalent of sparse.filter_table for a DiskMatrix, see MemoMatrix.filter for the filtering arguments
+
+    Args:
+        path (str): if not None, disk matrix directory where the filtered matrix is written
+        block_size (int): number of rows read at once
+
+    Returns:
+        table_filtered (DiskMatrix or SparseTable): the filtered matrix, loaded in memory if path is None
+    """
+    #pylint: disable=too-many-arguments
+    if use_samples_pattern:
+        matched = np.asarray(matrix.index.str.contains(samples_pattern, case = False), dtype=bool)
+        keep_columns = np.ones(matrix.shape[1], dtype=bool)
+        if max_occurence is not None:
+            keep_columns = matrix.occurences(rows=matched, block_size=block_size) <= max_occurence
+        # words left without occurence once the matched samples are removed are dropped
+        keep_rows = ~matched
+        keep_columns &= matrix.occurences(rows=keep_rows, block_size=block_size) > 0
+    else:
+        occurences = matrix.occurences(block_size=block_size)
+        keep_rows = np.ones(len(matrix), dtype=bool)
+        keep_columns = (occurences <= max_rel_occurence*len(matrix)) & (occurences >= min_rel_occurence*len(matrix))
+    blocks = (
+        block.take(rows=keep_rows[start:start + block_size], columns=keep_columns)
+        for start, block in zip(range(0, len(matrix), block_size), matrix.iter_blocks(block_size))
+        )
+    columns = matrix.columns[keep_columns]
+    if path is None:
+        blocks = list(blocks)
+        counts = scipy.sparse.vstack([block.counts for block in blocks], format='csr') if blocks else scipy.sparse.csr_matrix((0, len(columns)))
+        return sparse.SparseTable(counts, matrix.index[keep_rows], columns, matrix.n_decimals)
+    with MatrixWriter(path, columns, matrix.n_decimals) as writer:
+        for block in blocks:
+            writer.append(block)
+    return writer.matrix
+
+
+def _spill(counters, path, binned):
+    """Write per-sample word counts to a shard file
+
+    Returns:
+        n_nonzero (int): number of (sample, word) counts in the shard
+    """
+    flat_words = [word for counts in counters.values() for word in counts]
+    np.savez(
+        path, samples=np.asarray(list(counters), dtype=str),
+        lengths=np.asarray([len(counts) for counts in counters.values()], dtype=np.int64),
+        words=np.asarray(flat_words, dtype=np.int64 if binned else str),
+        counts=np.asarray([count for counts in counters.values() for count in counts.values()], dtype=DATA_DTYPE)
+        )
+    return len(flat_words)
+
+def from_counters(shards, path, n_decimals = None, keep_shards = False) -> DiskMatrix:
+    """Build a disk matrix from per-sample word counts produced shard by shard, see the module documentation.
+    The matrix is the same as the one of sparse.from_counters for all the samples at once.
+
+    Args:
+        shards (iterable of dict): {sample: {word: count}} mappings of consecutive samples, e.g. a generator
+            counting the words of shard_size spectra files at a time. Only one shard is kept in memory.
+        path (str): the disk matrix directory, created or replaced. Shards are spilled in its shards subdirectory.
+        n_decimals (int): n_decimals of the word ids, None for string words
+        keep_shards (bool): keep the shard files instead of removing them once the matrix is written
+
+    Returns:
+        matrix (DiskMatrix): the samples x words matrix
+    """
+    binned = n_decimals is not None
+    shards_dir = os.path.join(str(path), 'shards')
+    os.makedirs(shards_dir, exist_ok=True)
+    paths = []
+    with instrumentation.stage('ondisk.spill_shards') as record:
+        for counters in shards:
+            paths.append(os.path.join(shards_dir, f"shard_{len(paths):05d}.npz"))
+            record.count(shards=1, samples=len(counters), nonzero=_spill(counters, paths[-1], binned))
+
+    # columns are ordered by first appearance, as sparse.from_counters does
+    with instrumentation.stage('ondisk.vocabulary') as record:
+        # a dict keeps the first position of each word, in time linear in the number of shards
+        words = {}
+        for shard in paths:
+            with np.load(shard, allow_pickle=False) as arrays:
+                words.update(dict.fromkeys(pd.unique(arrays['words']).tolist()))
+        vocabulary = pd.Index(list(words), dtype=np.int64 if binned else object)
+        record.count(vocabulary=len(vocabulary))
+
+    with instrumentation.stage('ondisk.write', shards=len(paths)):
+        with MatrixWriter(path, vocabulary, n_decimals) as writer:
+            for shard in paths:
+                with np.load(shard, allow_pickle=False) as arrays:
+                    lengths = arrays['lengths']
+                    counts = scipy.sparse.csr_matrix(
+                        (arrays['counts'], vocabulary.get_indexer(arrays['words']), np.concatenate([[0], np.cumsum(lengths)])),
+                        shape=(len(lengths), len(vocabulary))
+                        )
+                    writer.append(sparse.SparseTable(counts, arrays['samples'].tolist(), vocabulary, n_decimals))
+    if not keep_shards:
+        shutil.rmtree(shards_dir)
+    return writer.matrix
@@ -0,0 +1,181 @@
+"""Principal coordinates analysis computing only the requested axes.
+
+skbio pcoa decomposes the whole centered matrix, which is cubic in the number of samples. Here only the
+n_components largest eigenpairs are computed, with an iterative (eigsh) or randomized eigensolver, or
+on a subset of landmark samples, the other samples being projected on the landmarks axes (landmark MDS).
+Results are skbio OrdinationResults, as returned by skbio pcoa, with the proportions explained relative
+to the sum of the positive eigenvalues of the centered matrix, as in skbio. Where the whole spectrum is not
+computed, this sum is the trace of the centered matrix minus its negative eigenvalues, estimated by stochastic
+Lanczos quadrature (non euclidean metrics such as braycurtis have negative eigenvalues).
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse.linalg
+import scipy.spatial.distance
+from skbio import OrdinationResults
+from skbio.stats.ordination import pcoa as skbio_pcoa
+
+METHODS = ('eigh', 'eigsh', 'randomized', 'landmark')
+
+
+def center_distances(distances) -> np.ndarray:
+    """Gower centering of a square distance matrix: B = -1/2 J D**2 J
+
+    Args:
+        distances (ndarray): n x n distance matrix
+
+    Returns:
+        centered (ndarray): n x n centered matrix
+    """
+    centered = -0.5 * np.square(distances)
+    row_means = centered.mean(axis=1, keepdims=True)
+    centered -= row_means
+    centered -= row_means.T
+    centered += row_means.mean()
+    return centered
+
+def randomized_eigh(matrix, n_components, n_oversamples = 10, n_iter = 4, random_state = 0):
+    """Largest eigenpairs of a symmetric matrix by randomized subspace iteration (Halko et al., 2011)
+
+    Args:
+        matrix (ndarray): n x n symmetric matrix
+        n_components (int): number of eigenpairs
+        n_oversamples (int): additional dimensions of the random subspace
+        n_iter (int): number of power iterations
+        random_state (int): seed of the random subspace
+
+    Returns:
+        eigvals, eigvecs (ndarray, ndarray): the largest eigenvalues, in decreasing order, and their eigenvectors
+    """
+    size = min(n_components + n_oversamples, matrix.shape[0])
+    rng = np.random.default_rng(random_state)
+    basis, _ = np.linalg.qr(matrix @ rng.standard_normal((matrix.shape[0], size)))
+    for _ in range(n_iter):
+        basis, _ = np.linalg.qr(matrix @ basis)
+    eigvals, eigvecs = np.linalg.eigh(basis.T @ matrix @ basis)
+    order = np.argsort(eigvals)[::-1][:n_components]
+    return eigvals[order], basis @ eigvecs[:, order]
+
+def positive_trace(matrix, n_probes = 32, n_steps = 32, random_state = 0) -> float:
+    """Sum of the positive eigenvalues of a symmetric matrix, without computing them: the trace minus the sum
+    of the negative eigenvalues, estimated by stochastic Lanczos quadrature (Ubaru et al., 2017)
+
+    Args:
+        matrix (ndarray): n x n symmetric matrix
+        n_probes (int): number of random probe vectors
+        n_steps (int): number of Lanczos steps per probe vector
+        random_state (int): seed of the probe vectors
+
+    Returns:
+        total (float): estimated sum of the positive eigenvalues, exact if n_steps >= n
+    """
+    n_samples = matrix.shape[0]
+    n_steps = min(n_steps, n_samples)
+    rng = np.random.default_rng(random_state)
+    vectors = rng.choice([-1.0, 1.0], size=(n_samples, n_probes)) / np.sqrt(n_samples)
+    basis = np.zeros((n_steps, n_samples, n_probes))
+    alphas = np.zeros((n_probes, n_steps))
+    betas = np.zeros((n_probes, n_steps))
+    # Lanczos tridiagonalization of all the probes at once, with full reorthogonalization
+    for step in range(n_steps):
+        basis[step] = vectors
+        vectors = matrix @ vectors
+        alphas[:, step] = np.einsum('ip,ip->p', basis[step], vectors)
+        for _ in range(2):
+            projections = np.einsum('kip,ip->kp', basis[:step + 1], vectors)
+            vectors -= np.einsum('kip,kp->ip', basis[:step + 1], projections)
+        betas[:, step] = np.linalg.norm(vectors, axis=0)
+        vectors /= np.where(betas[:, step] > 0, betas[:, step], 1)
+    negative = 0
+    scale = np.abs(alphas).max(initial=0)
+    for alpha, beta in zip(alphas, betas):
+        # the Krylov subspace of a probe is exhausted at its first null beta
+        breakdown = np.flatnonzero(beta[:-1] <= 1e-12 * scale)
+        size = breakdown[0] + 1 if len(breakdown) else n_steps
+        tridiagonal = np.diag(alpha[:size]) + np.diag(beta[:size - 1], 1) + np.diag(beta[:size - 1], -1)
+        nodes, weights = np.linalg.eigh(tridiagonal)
+        # Gauss quadrature of v.T min(A, 0) v with ||v||**2 = n_samples
+        negative += n_samples * np.sum(weights[0] ** 2 * np.minimum(nodes, 0))
+    return np.trace(matrix) - negative / n_probes
+
+def _results(eigvals, coordinates, total, ids, long_method_name):
+    # as in skbio pcoa, axes with a negative eigenvalue are returned with null coordinates
+    positive = ~(np.isclose(eigvals, 0) | (eigvals < 0))
+    eigvals = np.where(positive, eigvals, 0)
+    axis_labels = [f"PC{i}" for i in range(1, len(eigvals) + 1)]
+    return OrdinationResults(
+        short_method_name='PCoA',
+        long_method_name=long_method_name,
+        eigvals=pd.Series(eigvals, index=axis_labels),
+        samples=pd.DataFrame(np.where(positive, coordinates, 0), index=ids, columns=axis_labels),
+        proportion_explained=pd.Series(eigvals / total, index=axis_labels)
+        )
+
+def pcoa(dm, n_components = None, method = 'eigh', random_state = 0) -> OrdinationResults:
+    """Principal coordinates analysis
+
+    Args:
+        dm (ndarray): condensed distance matrix, see scipy.spatial.distance.pdist
+        n_components (int): number of axes to compute, all if None
+        method (str): One of [eigh, eigsh, randomized]. eigh is skbio pcoa (all eigenvalues),
+            eigsh and randomized only compute the n_components largest eigenvalues.
+        random_state (int): seed of the randomized method
+
+    Returns:
+        pcoa_results (OrdinationResults): the PCoA results
+    """
+    if method == 'eigh':
+        if n_components is None:
+            return skbio_pcoa(dm)
+        return skbio_pcoa(dm, number_of_dimensions=n_components)
+    if method not in ('eigsh', 'randomized'):
+        raise ValueError("method argument must be one of [eigh, eigsh, randomized]")
+    centered = center_distances(scipy.spatial.distance.squareform(dm))
+    n_samples = centered.shape[0]
+    n_components = n_samples if n_components is None else min(n_components, n_samples)
+    if method == 'eigsh' and n_components >= n_samples - 1:
+        eigvals, eigvecs = np.linalg.eigh(centered)
+        total = eigvals[eigvals > 0].sum()
+        eigvals, eigvecs = eigvals[::-1][:n_components], eigvecs[:, ::-1][:, :n_components]
+    else:
+        if method == 'eigsh':
+            eigvals, eigvecs = scipy.sparse.linalg.eigsh(centered, k=n_components, which='LA')
+            order = np.argsort(eigvals)[::-1]
+            eigvals, eigvecs = eigvals[order], eigvecs[:, order]
+        else:
+            eigvals, eigvecs = randomized_eigh(centered, n_components, random_state=random_state)
+        total = positive_trace(centered, random_state=random_state)
+    coordinates = eigvecs * np.sqrt(np.maximum(eigvals, 0))
+    ids = [str(i) for i in range(n_samples)]
+    return _results(eigvals, coordinates, total, ids, f"Principal Coordinate Analysis ({method})")
+
+def landmark_pcoa(landmark_distances, landmarks, n_components = 3) -> OrdinationResults:
+    """Landmark principal coordinates analysis (de Silva & Tenenbaum, 2004): PCoA of the landmark
+    samples, the other samples being placed from their distances to the landmarks
+
+    Args:
+        landmark_distances (ndarray): n_landmarks x n_samples distances between the landmarks and all the samples
+        landmarks (array-like of int): positions of the landmarks among the samples
+        n_components (int): number of axes to compute
+
+    Returns:
+        pcoa_results (OrdinationResults): the PCoA results. Eigenvalues are those of the landmarks scaled
+            to the number of samples.
+    """
+    squared = np.square(landmark_distances)
+    landmark_squared = squared[:, landmarks]
+    centered = center_distances(landmark_distances[:, landmarks])
+    n_landmarks, n_samples = squared.shape
+    n_components = min(n_components, n_landmarks)
+    eigvals, eigvecs = np.linalg.eigh(centered)
+    total = eigvals[eigvals > 0].sum()
+    eigvals, eigvecs = eigvals[::-1][:n_components], eigvecs[:, ::-1][:, :n_components]
+    positive = eigvals > 0
+    # distance based triangulation: x = -1/2 L# (d - mean(d_landmarks))
+    pseudo_inverse = np.zeros_like(eigvecs)
+    pseudo_inverse[:, positive] = eigvecs[:, positive] / np.sqrt(eigvals[positive])
+    coordinates = -0.5 * (squared - landmark_squared.mean(axis=1, keepdims=True)).T @ pseudo_inverse
+    ids = [str(i) for i in range(n_samples)]
+    scale = n_samples / n_landmarks
+    return _results(eigvals * scale, coordinates, total * scale, ids,
+                    "Landmark Principal Coordinate Analysis")
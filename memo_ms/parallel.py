@@ -0,0 +1,31 @@
+"""Executors used by the functions accepting n_jobs / executor arguments."""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import os
+
+
+class SerialExecutor:
+    """Minimal stand-in for concurrent.futures executors running everything in the current process"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    @staticmethod
+    def map(func, *iterables):
+        return map(func, *iterables)
+
+
+def pool(n_jobs = 1, executor = None, initializer = None, initargs = ()):
+    """Executor (context manager) to use for n_jobs: a user provided one, a process pool or a serial one.
+    initializer(*initargs) is run once in each process of the process pool, e.g. to send it large shared inputs."""
+    if executor is not None:
+        return nullcontext(executor)
+    if n_jobs == 0:
+        raise ValueError("n_jobs argument must be a number of processes (1 for no pool), or negative for all the processors")
+    if n_jobs is None or n_jobs == 1:
+        return SerialExecutor()
+    return ProcessPoolExecutor(
+        max_workers = os.cpu_count() if n_jobs < 0 else n_jobs, initializer = initializer, initargs = initargs
+        )
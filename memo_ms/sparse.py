@@ -0,0 +1,394 @@
+from dataclasses import dataclass
+import json
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from memo_ms import instrumentation
+from memo_ms import words
+
+
+@dataclass
+class SparseTable:
+    """Create a SparseTable dataclass object: a sparse samples x words table
+
+    Args:
+        counts (scipy.sparse.csr_matrix): Occurence counts of the words (columns) in the samples (rows)
+        index (Index): Samples names, one per row of counts
+        columns (Index): Words vocabulary, one per column of counts
+        n_decimals (int): If not None, columns are integer word ids (see memo_ms.words) encoded with n_decimals,
+            translated back to "peak@xx.xx" words by to_dense() and to_csv()
+
+    Returns:
+        self.counts (csr_matrix): The sparse counts, without explicit zeros
+    """
+    counts : scipy.sparse.csr_matrix
+    index : pd.Index
+    columns : pd.Index
+    n_decimals : int = None
+
+    def __post_init__(self):
+        if scipy.sparse.isspmatrix_csr(self.counts):
+            # float CSR counts are not copied, e.g. the memory maps of ondisk.DiskMatrix.to_sparse(copy=False)
+            self.counts = self.counts.astype(float, copy=False)
+        else:
+            self.counts = scipy.sparse.csr_matrix(self.counts, dtype=float)
+        # read-only counts are memory maps of disk matrices, written without explicit zeros
+        if self.counts.data.flags.writeable:
+            self.counts.eliminate_zeros()
+        self.index = pd.Index(self.index)
+        self.columns = pd.Index(self.columns)
+        if self.counts.shape != (len(self.index), len(self.columns)):
+            raise ValueError("counts shape does not match index and columns lengths")
+
+    @property
+    def shape(self):
+        """(number of samples, number of words)"""
+        return self.counts.shape
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    @property
+    def nnz(self) -> int:
+        """Number of non-zero counts"""
+        return self.counts.nnz
+
+    @property
+    def labels(self) -> pd.Index:
+        """Columns as string words, decoding word ids if needed"""
+        if self.n_decimals is None:
+            return self.columns
+        return pd.Index(words.decode(self.columns, self.n_decimals), dtype=object)
+
+    def decoded(self):
+        """Same table with string words as columns
+
+        Returns:
+            SparseTable (SparseTable): A SparseTable with labels as columns and n_decimals None
+        """
+        return SparseTable(self.counts, self.index, self.labels)
+
+    def take(self, rows = None, columns = None):
+        """Select rows and/or columns using positions or boolean masks
+
+        Args:
+            rows (array-like): Rows to keep, all if None
+            columns (array-like): Columns to keep, all if None
+
+        Returns:
+            SparseTable (SparseTable): A new SparseTable with the selected rows and columns
+        """
+        counts = self.counts
+        index = self.index
+        vocabulary = self.columns
+        if rows is not None:
+            rows = _as_positions(rows)
+            counts = counts[rows, :]
+            index = index[rows]
+        if columns is not None:
+            columns = _as_positions(columns)
+            counts = counts[:, columns]
+            vocabulary = vocabulary[columns]
+        return SparseTable(counts, index, vocabulary, self.n_decimals)
+
+    def occurences(self, rows = None):
+        """Count in how many samples each word occurs
+
+        Args:
+            rows (array-like): Restrict the count to these rows (positions or boolean mask), all if None
+
+        Returns:
+            occurences (ndarray): Number of samples with a non-zero count, per column
+        """
+        counts = self.counts if rows is None else self.counts[_as_positions(rows), :]
+        return np.bincount(counts.indices, minlength=counts.shape[1])
+
+    def to_dense(self) -> pd.DataFrame:
+        """Convert to the dense pandas representation used by MemoMatrix.memo_matrix
+
+        Returns:
+            table (DataFrame): A dense float table with samples as index and words as columns
+        """
+        return pd.DataFrame(self.counts.toarray(), index=self.index, columns=self.labels)
+
+    def to_csv(self, path, sep = ',', chunksize = 1000):
+        """Write the table as csv, densifying at most chunksize rows at a time
+
+        Args:
+            path (str): path to export
+            sep (str): separator
+            chunksize (int): number of rows written at once
+
+        Returns:
+            None
+        """
+        with open(path, 'w', encoding='utf8', newline='') as handle:
+            if len(self) == 0:
+                self.to_dense().to_csv(handle, sep=sep)
+            for start in range(0, len(self), chunksize):
+                block = self.take(rows=np.arange(start, min(start + chunksize, len(self))))
+                block.to_dense().to_csv(handle, sep=sep, header=start == 0)
+
+
+def _as_positions(selection):
+    selection = np.asarray(selection)
+    if selection.dtype == bool:
+        return np.flatnonzero(selection)
+    return selection.astype(np.intp, copy=False)
+
+
+def from_dense(table) -> SparseTable:
+    """Convert a dense table (DataFrame) to a SparseTable. Missing values are considered as 0.
+
+    Args:
+        table (DataFrame): A table with samples as index and words as columns
+
+    Returns:
+        SparseTable (SparseTable): The sparse equivalent of table
+    """
+    values = table.to_numpy(dtype=float, na_value=0)
+    return SparseTable(scipy.sparse.csr_matrix(values), table.index, table.columns)
+
+
+def from_counters(counters, index_name = None, n_decimals = None) -> SparseTable:
+    """Build a SparseTable from per-sample word counts.
+    Columns are ordered by first appearance, as pd.DataFrame.from_dict(counters, orient='index') does.
+
+    Args:
+        counters (dict): {sample: {word: count}} mapping, e.g. a dict of collections.Counter
+        index_name (str): name of the samples index
+        n_decimals (int): n_decimals of the word ids, None for string words
+
+    Returns:
+        SparseTable (SparseTable): A samples x words sparse table
+    """
+    vocabulary = {}
+    indices = []
+    data = []
+    indptr = [0]
+    for counts in counters.values():
+        for word, count in counts.items():
+            indices.append(vocabulary.setdefault(word, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+    counts = scipy.sparse.csr_matrix(
+        (np.asarray(data, dtype=float), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(counters), len(vocabulary))
+        )
+    columns = pd.Index(list(vocabulary), dtype=object if n_decimals is None else np.int64)
+    return SparseTable(counts, pd.Index(list(counters), name=index_name), columns, n_decimals)
+
+
+def _flatten_documents(document):
+    document = document[['scans', 'documents']].drop_duplicates('scans', keep='last')
+    lengths = document['documents'].map(len).to_numpy()
+    if len(document) > 0 and isinstance(document['documents'].iloc[0], np.ndarray):
+        flat_words = pd.Series(np.concatenate(document['documents'].to_list()), dtype=np.int64)
+    else:
+        flat_words = pd.Series([word for doc in document['documents'] for word in doc], dtype=object)
+    codes, vocabulary = pd.factorize(flat_words, sort=False)
+    rows = np.repeat(np.arange(len(document)), lengths)
+    positions = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return pd.Index(document['scans']), pd.Index(vocabulary), rows, codes, positions
+
+
+def documents_to_sparse(document, n_decimals = None) -> SparseTable:
+    """Build a features x words count table from a SpectraDocuments.document table.
+    Columns are ordered by first appearance. If a scan number appears more than once, the last document is used.
+
+    Args:
+        document (DataFrame): A SpectraDocuments.document table with 'scans' and 'documents' columns
+        n_decimals (int): n_decimals of the word ids, None for string words
+
+    Returns:
+        SparseTable (SparseTable): A features (scans) x words sparse table
+    """
+    scans, vocabulary, rows, codes, _ = _flatten_documents(document)
+    counts = scipy.sparse.csr_matrix((np.ones(len(codes)), (rows, codes)), shape=(len(scans), len(vocabulary)))
+    return SparseTable(counts, scans, vocabulary, n_decimals)
+
+
+def memo_from_aligned(feature_table, document, n_decimals = None) -> SparseTable:
+    """Compute a MEMO matrix as the product of the binarized feature table with the features x words counts.
+    The output (rows, columns and their order) is the same as counting words sample by sample:
+    samples without any detected feature are dropped and words are ordered by first appearance,
+    going through samples, then their features, then the features' documents.
+
+    Args:
+        feature_table (DataFrame): A FeatureTable.feature_table (samples x features)
+        document (DataFrame): A SpectraDocuments.document table
+        n_decimals (int): n_decimals of the word ids, None for string words
+
+    Returns:
+        SparseTable (SparseTable): A samples x words MEMO matrix
+    """
+    #pylint: disable=too-many-locals
+    with instrumentation.stage('sparse.flatten_documents') as record:
+        scans, vocabulary, rows, codes, positions = _flatten_documents(document)
+        record.count(spectra=len(scans), words=len(codes), vocabulary=len(vocabulary))
+
+    with instrumentation.stage('sparse.count_words'):
+        values = feature_table.to_numpy()
+        presence = (values != 0) & ~pd.isna(values)
+        detected = presence.any(axis=1)
+        presence = presence[detected]
+
+        # Re-index the documents' words on the feature table columns, dropping features absent from the table
+        feature_of_scan = np.full(len(scans), -1)
+        matched = scans.get_indexer(feature_table.columns)
+        feature_of_scan[matched[matched >= 0]] = np.flatnonzero(matched >= 0)
+        features = feature_of_scan[rows]
+        kept = features >= 0
+        features, codes, positions = features[kept], codes[kept], positions[kept]
+        features_words = scipy.sparse.csr_matrix(
+            (np.ones(len(codes)), (features, codes)), shape=(presence.shape[1], len(vocabulary))
+            )
+        counts = scipy.sparse.csr_matrix(presence, dtype=float) @ features_words
+
+    # Order words by (first sample, first feature in this sample, first position in this feature's document)
+    with instrumentation.stage('sparse.order_words'):
+        counts_csc = counts.tocsc()
+        counts_csc.sort_indices()
+        used = np.flatnonzero(np.diff(counts_csc.indptr) > 0)
+        first_sample = np.zeros(len(vocabulary), dtype=np.intp)
+        first_sample[used] = counts_csc.indices[counts_csc.indptr[used]]
+        in_first_sample = presence[first_sample[codes], features]
+        rank = features.astype(np.int64) * (positions.max(initial=0) + 1) + positions
+        first_rank = np.full(len(vocabulary), np.iinfo(np.int64).max)
+        np.minimum.at(first_rank, codes[in_first_sample], rank[in_first_sample])
+        columns_order = used[np.lexsort((first_rank[used], first_sample[used]))]
+
+    table = SparseTable(counts, feature_table.index[detected], vocabulary, n_decimals)
+    return table.take(columns=columns_order)
+
+
+def filter_table(table, use_samples_pattern = False, samples_pattern = '', max_occurence = None, min_rel_occurence = 0, max_rel_occurence = 1):
+    """Sparse equivalent of memo_ms.classes.filter_table, see MemoMatrix.filter for the arguments
+
+    Returns:
+        table_filtered (SparseTable): A filtered SparseTable
+    """
+    if use_samples_pattern:
+        matched = np.asarray(table.index.str.contains(samples_pattern, case = False), dtype=bool)
+        keep_columns = np.ones(table.shape[1], dtype=bool)
+        if max_occurence is not None:
+            keep_columns = table.occurences(rows=matched) <= max_occurence
+        table_filtered = table.take(rows=~matched, columns=keep_columns)
+        table_filtered = table_filtered.take(columns=table_filtered.occurences() > 0)
+    else:
+        occurences = table.occurences()
+        len_table = len(table)
+        min_rel = min_rel_occurence*len_table
+        max_rel = max_rel_occurence*len_table
+        table_filtered = table.take(columns=(occurences <= max_rel) & (occurences >= min_rel))
+    return table_filtered
+
+
+def merge(tables, drop_not_in_common = False) -> SparseTable:
+    """Stack SparseTables on top of each other, aligning their columns on a vocabulary built once:
+    the union of their columns in order of first appearance, or their intersection in the order of the first table.
+    The counts are stacked without densifying, their columns remapped with integer positions.
+
+    Args:
+        tables (list of SparseTable): tables to stack
+        drop_not_in_common (bool): keep only words present in all tables instead of the union
+
+    Returns:
+        SparseTable (SparseTable): The stacked table, with word ids only if all tables share the same n_decimals
+    """
+    #pylint: disable=too-many-locals
+    n_decimals = tables[0].n_decimals
+    if any(table.n_decimals != n_decimals for table in tables):
+        tables = [table.decoded() for table in tables]
+        n_decimals = None
+    all_columns = tables[0].columns.append([table.columns for table in tables[1:]])
+    if drop_not_in_common:
+        codes, uniques = pd.factorize(all_columns)
+        columns = uniques[np.bincount(codes, minlength=len(uniques)) == len(tables)]
+    else:
+        columns = all_columns.unique()
+    data, indices, lengths = [], [], []
+    for table in tables:
+        counts = table.counts
+        remapped = columns.get_indexer(table.columns)[counts.indices]
+        row_lengths = np.diff(counts.indptr)
+        values = counts.data
+        if drop_not_in_common:
+            kept = remapped >= 0
+            rows = np.repeat(np.arange(counts.shape[0]), row_lengths)
+            row_lengths = np.bincount(rows[kept], minlength=counts.shape[0])
+            remapped, values = remapped[kept], values[kept]
+        data.append(values)
+        indices.append(remapped)
+        lengths.append(row_lengths)
+    indptr = np.concatenate([[0], np.cumsum(np.concatenate(lengths))])
+    counts = scipy.sparse.csr_matrix(
+        (np.concatenate(data), np.concatenate(indices), indptr), shape=(len(indptr) - 1, len(columns))
+        )
+    counts.sort_indices()
+    index = tables[0].index.append([table.index for table in tables[1:]])
+    return SparseTable(counts, index, columns, n_decimals)
+
+
+def index_to_array(index):
+    """Index as a NumPy array which can be saved without pickle: object (string) indexes are converted to str"""
+    if index.dtype == object:
+        return np.asarray(index.astype(str), dtype=str)
+    return index.to_numpy()
+
+def index_from_array(values, name):
+    """Index saved with index_to_array, str arrays are loaded back as object indexes"""
+    if values.dtype.kind == 'U':
+        return pd.Index(values.tolist(), dtype=object, name=name)
+    return pd.Index(values, name=name)
+
+def save_npz(table, path):
+    """Save a SparseTable, or a dense DataFrame in sparse form, as a compressed .npz file
+
+    Args:
+        table (SparseTable, ondisk.DiskMatrix or DataFrame): the table to save. A DataFrame is loaded back as a DataFrame
+            with the same dtype. The memory mapped arrays of a DiskMatrix are compressed by chunks.
+        path (str): path of the .npz file
+
+    Returns:
+        None
+    """
+    dense_dtype = None
+    if isinstance(table, pd.DataFrame):
+        dtypes = table.dtypes.unique()
+        dense_dtype = str(dtypes[0]) if len(dtypes) == 1 else 'float64'
+        table = from_dense(table)
+    counts = table.counts if isinstance(table, SparseTable) else table  # a DiskMatrix holds the CSR arrays itself
+    meta = json.dumps({
+        'index_name': table.index.name, 'columns_name': table.columns.name, 'n_decimals': table.n_decimals,
+        'dense_dtype': dense_dtype
+        })
+    np.savez_compressed(
+        path, data=counts.data, indices=counts.indices, indptr=counts.indptr, shape=np.asarray(table.shape),
+        index=index_to_array(table.index), columns=index_to_array(table.columns), meta=np.asarray(meta)
+        )
+
+def load_npz(path, dense = None):
+    """Load a table saved with save_npz
+
+    Args:
+        path (str): path of the .npz file
+        dense (bool): return a DataFrame (True) or a SparseTable (False). Defaults to the type that was saved.
+
+    Returns:
+        table (SparseTable or DataFrame): the loaded table
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = json.loads(str(arrays['meta']))
+        counts = scipy.sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape'])
+            )
+        index = index_from_array(arrays['index'], meta['index_name'])
+        columns = index_from_array(arrays['columns'], meta['columns_name'])
+    table = SparseTable(counts, index, columns, meta['n_decimals'])
+    dense_dtype = meta.get('dense_dtype')
+    if dense is None:
+        dense = dense_dtype is not None
+    if not dense:
+        return table
+    return table.to_dense().astype(dense_dtype or 'float64')
@@ -0,0 +1,85 @@
+"""Parameter sweeps: SpectraDocuments and MEMO matrices of one spectra file for a grid of parameters.
+
+The spectra file is parsed once into a mgf.PeakStore, then the documents of each combination of parameters are
+derived from the stored peaks (with the numpy engine filters), optionally in parallel processes sharing the store:
+
+    results = sweep.parameter_sweep(
+        'spectra.mgf', {'n_decimals': [2, 3], 'min_relative_intensity': [0.01, 0.05]},
+        feature_table=FeatureTable('feature_table.csv', software='mzmine'), n_jobs=4
+        )
+    results[(3, 0.01)].memo_matrix
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import itertools
+import os
+from memo_ms import instrumentation
+from memo_ms import mgf
+from memo_ms import parallel
+from memo_ms.classes import MemoMatrix, SpectraDocuments
+
+PARAMETERS = (
+    'min_relative_intensity', 'max_relative_intensity', 'min_peaks_required', 'losses_from', 'losses_to',
+    'n_decimals', 'word_encoding'
+    )
+
+_WORKER_INPUTS = None
+
+
+def _init_worker(peak_store, feature_table):
+    global _WORKER_INPUTS #pylint: disable=global-statement
+    _WORKER_INPUTS = (peak_store, feature_table)
+
+def _derive(values, names, path, sparse, inputs = None):
+    """Documents, or MEMO matrix if the feature table is not None, of one combination of parameters.
+    inputs is (peak store, feature table), those sent to the worker process by _init_worker if None."""
+    peak_store, feature_table = inputs if inputs is not None else _WORKER_INPUTS
+    spectra = SpectraDocuments(path, engine='numpy', peak_store=peak_store, **dict(zip(names, values)))
+    spectra.peak_store = None  # results are sent back from worker processes without the store
+    if feature_table is None:
+        return spectra
+    memo_matrix = MemoMatrix(sparse=sparse)
+    memo_matrix.memo_from_aligned_samples(feature_table, spectra)
+    return memo_matrix
+
+def parameter_sweep(path, grid, feature_table = None, sparse = True, n_jobs = 1, executor = None, peak_store = None) -> dict:
+    """Build the SpectraDocuments, or the MEMO matrices of aligned samples, of a spectra file for every combination
+    of parameters of a grid, parsing the spectra file only once
+
+    Args:
+        path (str): Path to spectra file (.mgf)
+        grid (dict): {parameter: list of values}, parameters among [min_relative_intensity, max_relative_intensity,
+            min_peaks_required, losses_from, losses_to, n_decimals, word_encoding] (see SpectraDocuments).
+            The other parameters keep their default value.
+        feature_table (FeatureTable): if not None, the MEMO matrix of these aligned samples is built for each
+            combination (see MemoMatrix.memo_from_aligned_samples), else the SpectraDocuments are returned
+        sparse (bool): build sparse MEMO matrices, see MemoMatrix
+        n_jobs (int): number of worker processes (-1 for all cores). The peak store and the feature table are sent
+            once to each of them.
+        executor (concurrent.futures.Executor): executor to use instead of creating a process pool from n_jobs.
+            The peak store and the feature table are sent with each combination to the processes of a user
+            provided process pool.
+        peak_store (mgf.PeakStore): the spectra of path already parsed with mgf.read_peak_store, parsed if None
+
+    Returns:
+        results (dict): {tuple of parameter values, in grid order: SpectraDocuments or MemoMatrix}
+    """
+    #pylint: disable=too-many-arguments
+    unknown = [name for name in grid if name not in PARAMETERS]
+    if unknown:
+        raise ValueError(f"grid parameters must be among {list(PARAMETERS)}, got {unknown}")
+    names = list(grid)
+    combinations = list(itertools.product(*(grid[name] for name in names)))
+    with instrumentation.stage('parameter_sweep', combinations=len(combinations)):
+        if peak_store is None:
+            peak_store = mgf.read_peak_store(path)
+        derive = partial(_derive, names=names, path=path, sparse=sparse)
+        if executor is None and n_jobs is not None and n_jobs != 1:
+            n_workers = min(os.cpu_count() if n_jobs < 0 else n_jobs, len(combinations))
+            initargs = (peak_store, feature_table)
+            with ProcessPoolExecutor(max(n_workers, 1), initializer=_init_worker, initargs=initargs) as pool:
+                results = list(pool.map(derive, combinations))
+        else:
+            with parallel.pool(1, executor) as pool:
+                results = list(pool.map(partial(derive, inputs=(peak_store, feature_table)), combinations))
+    return dict(zip(combinations, results))
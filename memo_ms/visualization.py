@@ -1,23 +1,224 @@
+from dataclasses import dataclass, field
+from functools import partial
+import os
 import numpy as np
+import pandas as pd
 import scipy as sp
 from itertools import cycle
-from skbio.stats.ordination import pcoa
 import cimcb_lite as cb
 import plotly.express as px
 import plotly.graph_objects as go
 import plotly.figure_factory as ff
 from matplotlib import pyplot as plt
 from scipy.cluster.hierarchy import dendrogram, linkage
+from memo_ms import distances
+from memo_ms import ordination
+from memo_ms import parallel
+from memo_ms import sparse
+
+# Linkage methods only defined on Euclidean distances
+EUCLIDEAN_LINKAGES = ('centroid', 'median', 'ward')
+
+
+@dataclass
+class PreparedAnalysis:
+    """Samples of a MEMO matrix / Feature table matched with their metadata, with memoized
+    preprocessing, distances, PCoA and linkage. Pass it instead of the matrix to the plotting
+    functions to reuse these results between plots.
+
+    Args:
+        matrix (DataFrame or SparseTable): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format
+        df_metadata (DataFrame): Metadata of the MEMO matrix samples
+        filename_col (str): Column name in df_metadata to match memo_matrix index
+        n_jobs (int): number of processes used to compute the distances, -1 to use all the processors
+
+    Returns:
+        self.matrix (DataFrame or SparseTable): the samples of matrix present in df_metadata, in the df_metadata order
+        self.df_metadata (DataFrame): the metadata of these samples
+    """
+    matrix : pd.DataFrame
+    df_metadata : pd.DataFrame
+    filename_col : str
+    n_jobs : int = 1
+    _results : dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self.df_metadata = self.df_metadata[self.df_metadata[self.filename_col].isin(list(self.matrix.index))]
+        filenames = list(self.df_metadata[self.filename_col])
+        if isinstance(self.matrix, sparse.SparseTable):
+            self.matrix = self.matrix.take(rows=self.matrix.index.get_indexer(filenames))
+        else:
+            self.matrix = self.matrix[self.matrix.index.isin(filenames)].reindex(filenames)
+
+    def _memoize(self, key, compute):
+        if key not in self._results:
+            self._results[key] = compute()
+        return self._results[key]
+
+    def preprocessed(self, norm = False, scaling = False):
+        """Normalized and/or scaled matrix
+
+        Args:
+            norm (bool, optional): Apply samples normalization. Defaults to False.
+            scaling (bool, optional): Apply log10 and pareto scaling to the matrix columns. Defaults to False.
+
+        Returns:
+            matrix (DataFrame, SparseTable or ndarray): the preprocessed matrix, an array if scaled
+        """
+        def compute():
+            matrix = self.matrix
+            if norm is True and isinstance(matrix, sparse.SparseTable):
+                with np.errstate(divide='ignore'):
+                    totals = sp.sparse.diags(1 / np.asarray(matrix.counts.sum(axis=1)).ravel())
+                matrix = sparse.SparseTable(totals @ matrix.counts, matrix.index, matrix.columns, matrix.n_decimals)
+            elif norm is True:
+                matrix = matrix.div(matrix.sum(axis=1), axis=0)
+            if scaling is True:
+                matrix = matrix.counts.toarray() if isinstance(matrix, sparse.SparseTable) else matrix.to_numpy(dtype=float)
+                matrix = np.log10(matrix, out=np.zeros_like(matrix), where=(matrix!=0)) # Log scale (base-10)
+                matrix = cb.utils.scale(matrix, method='pareto')
+            return matrix
+        return self._memoize(('preprocessed', norm, scaling), compute)
+
+    def distances(self, metric = 'braycurtis', norm = False, scaling = False) -> np.ndarray:
+        """Condensed distance matrix between the samples, see memo_ms.distances.pdist
+
+        Returns:
+            dm (ndarray): the condensed distance matrix
+        """
+        return self._memoize(
+            ('distances', metric, norm, scaling),
+            lambda: distances.pdist(self.preprocessed(norm, scaling), metric, n_jobs=self.n_jobs)
+            )
+
+    def pcoa(self, metric = 'braycurtis', norm = False, scaling = False, method = 'eigh', n_components = None,
+             n_landmarks = 500, random_state = 0):
+        """PCoA of the samples distances, see memo_ms.ordination
+
+        Args:
+            method (str): One of [eigh, eigsh, randomized, landmark]. eigh computes all the axes (skbio pcoa),
+                the other methods only the n_components first ones. landmark only computes the distances
+                to n_landmarks random samples.
+            n_components (int): number of axes, all if None (3 with landmark)
+            n_landmarks (int): number of landmarks of the landmark method
+            random_state (int): seed of the randomized and landmark methods
+
+        Returns:
+            pcoa_results (skbio.OrdinationResults): the PCoA results
+        """
+        #pylint: disable=too-many-arguments
+        if method not in ordination.METHODS:
+            raise ValueError(f"method argument must be one of {list(ordination.METHODS)}")
+        def compute():
+            if method != 'landmark':
+                return ordination.pcoa(self.distances(metric, norm, scaling), n_components, method, random_state)
+            n_samples = len(self.df_metadata)
+            rng = np.random.default_rng(random_state)
+            landmarks = np.sort(rng.choice(n_samples, min(n_landmarks, n_samples), replace=False))
+            landmark_distances = distances.distances_from(self.preprocessed(norm, scaling), landmarks, metric)
+            return ordination.landmark_pcoa(landmark_distances, landmarks, n_components or 3)
+        return self._memoize(
+            ('pcoa', metric, norm, scaling, method, n_components, n_landmarks, random_state), compute
+            )
+
+    def linkage(self, method = 'ward', metric = 'euclidean', norm = False, scaling = False) -> np.ndarray:
+        """Hierarchical clustering of the samples, see scipy.cluster.hierarchy.linkage
+
+        Returns:
+            Z (ndarray): the linkage matrix
+        """
+        if method in EUCLIDEAN_LINKAGES and metric != 'euclidean':
+            raise ValueError(f"method={method} requires the distance metric to be Euclidean")
+        return self._memoize(
+            ('linkage', method, metric, norm, scaling),
+            lambda: linkage(self.distances(metric, norm, scaling), method=method)
+            )
+
+
+def prepare(matrix, df_metadata, filename_col) -> PreparedAnalysis:
+    """Match a MEMO matrix / Feature table with its metadata, reusing matrix if it is already a PreparedAnalysis
+
+    Args:
+        matrix (DataFrame, SparseTable or PreparedAnalysis): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format
+        df_metadata (DataFrame): Metadata of the MEMO matrix samples, ignored if matrix is a PreparedAnalysis
+        filename_col (str): Column name in df_metadata to match memo_matrix index, ignored if matrix is a PreparedAnalysis
+
+    Returns:
+        analysis (PreparedAnalysis): the prepared analysis
+    """
+    if isinstance(matrix, PreparedAnalysis):
+        return matrix
+    return PreparedAnalysis(matrix, df_metadata, filename_col)
+
+
+def save_figure(fig, output_path, output_format = None, include_plotlyjs = True):
+    """Write a figure returned by the plotting functions
+
+    Args:
+        fig (plotly Figure or matplotlib Figure): the figure
+        output_path (str): path of the file to write
+        output_format (str, optional): One of [html, json, png, jpeg, webp, svg, pdf] for plotly figures
+        (png, jpeg, webp and pdf need kaleido), any matplotlib format for matplotlib figures. Defaults to the path extension.
+        include_plotlyjs (bool or str, optional): see plotly write_html, 'directory' writes plotly.min.js once
+        next to the html files. Defaults to True.
+
+    Returns:
+        None
+    """
+    if output_format is None:
+        output_format = os.path.splitext(str(output_path))[1].lstrip('.').lower() or 'html'
+    if not isinstance(fig, go.Figure):
+        fig.savefig(output_path, format=output_format)
+    elif output_format == 'html':
+        fig.write_html(output_path, include_plotlyjs=include_plotlyjs)
+    elif output_format == 'json':
+        fig.write_json(output_path)
+    else:
+        fig.write_image(output_path, format=output_format)
+
+
+def _output(fig, output_path, output_format, show):
+    """Save and/or show a figure: shown if show is True, or if show is None and it is not saved"""
+    if output_path is not None:
+        save_figure(fig, output_path, output_format)
+    if show is None:
+        show = output_path is None
+    if isinstance(fig, go.Figure):
+        if show:
+            fig.show()
+    elif show:
+        plt.show()
+    else:
+        plt.close(fig)
+    return fig
+
+
+def _hover_names(names, coordinates, max_hover_samples):
+    """Above max_hover_samples samples, keep the hover names of max_hover_samples evenly spaced samples
+    and round the coordinates to 6 significant digits, to keep the figures small"""
+    if max_hover_samples is None or len(names) <= max_hover_samples:
+        return names, coordinates
+    step = -(-len(names) // max_hover_samples)
+    names = names.where(np.arange(len(names)) % step == 0, '')
+    rounded = []
+    for values in coordinates:
+        largest = np.abs(values).max()
+        decimals = 6 - int(np.ceil(np.log10(largest))) if largest > 0 else 0
+        rounded.append(values.round(decimals))
+    return names, rounded
 
 
 def plot_pcoa_2d(
     matrix, df_metadata, filename_col, group_col,
-    metric = 'braycurtis', norm = False, scaling = False, pc_to_plot = (1, 2)
+    metric = 'braycurtis', norm = False, scaling = False, pc_to_plot = (1, 2),
+    pcoa_method = 'eigh', n_landmarks = 500, max_hover_samples = 5000,
+    output_path = None, output_format = None, show = None
     ):
     """ Simple 2D PCoA plot of a MEMO matrix / Feature table using Plotly
 
     Args:
-        matrix (DataFrame): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format
+        matrix (DataFrame or PreparedAnalysis): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format,
+        or a PreparedAnalysis to reuse its preprocessing, distances, PCoA and linkage
         df_metadata (DataFrame): Metadata of the MEMO matrix samples
         filename_col (str): Column name in df_metadata to match memo_matrix index
         group_col (str): Column name in df_metadata to use as groups for plotting
@@ -26,27 +227,28 @@ def plot_pcoa_2d(
         norm (bool, optional): Apply samples normalization. Defaults to False.
         scaling (bool, optional): Apply pareto scaling to MEMO matrix columns. Defaults to False.
         pc_to_plot (list of int, optional): PCs to plot. Defaults to [1,2].
+        pcoa_method (str, optional): One of [eigh, eigsh, randomized, landmark]: eigh computes all the PCs,
+        the other methods only the plotted ones, faster for large numbers of samples. Defaults to 'eigh'.
+        n_landmarks (int, optional): Number of samples used by the landmark pcoa_method. Defaults to 500.
+        max_hover_samples (int, optional): Above this number of samples, only the names of max_hover_samples
+        samples are kept for hovering and coordinates are rounded, to keep the figure small. Defaults to 5000.
+        output_path (str, optional): Write the figure to this file, see save_figure. Defaults to None.
+        output_format (str, optional): Format of output_path. Defaults to its extension.
+        show (bool, optional): Show the figure. Defaults to showing it only if it is not written to output_path.
 
     Returns:
-        None
+        fig (plotly.graph_objects.Figure): the figure
     """
     #pylint: disable=too-many-arguments
     #pylint: disable=too-many-locals
-    df_metadata_resticted = df_metadata[df_metadata[filename_col].isin(list(matrix.index))]
-    matrix = matrix[matrix.index.isin(list(df_metadata_resticted[filename_col]))].reindex(list(df_metadata_resticted[filename_col]))
-    if norm is True:
-        matrix = matrix.div(matrix.sum(axis=1), axis=0)
-    if scaling is True:
-        matrix = matrix.to_numpy()
-        matrix = np.log10(matrix, out=np.zeros_like(matrix), where=(matrix!=0)) # Log scale (base-10)
-        matrix = cb.utils.scale(matrix, method='pareto')
-
-    dm_memo = sp.spatial.distance.pdist(matrix, metric)
-    pcoa_results = pcoa(dm_memo)
+    analysis = prepare(matrix, df_metadata, filename_col)
+    df_metadata_resticted, filename_col = analysis.df_metadata, analysis.filename_col
+    n_components = None if pcoa_method == 'eigh' else max(pc_to_plot)
+    pcoa_results = analysis.pcoa(metric, norm, scaling, pcoa_method, n_components, n_landmarks)
 
     x = pcoa_results.samples[f'PC{pc_to_plot[0]}']
     y = pcoa_results.samples[f'PC{pc_to_plot[1]}']
-
+    hover_name, (x, y) = _hover_names(df_metadata_resticted[filename_col], (x, y), max_hover_samples)
 
     exp_var_pc1 = round(100*pcoa_results.proportion_explained[pc_to_plot[0] - 1 ], 1)
     exp_var_pc2 = round(100*pcoa_results.proportion_explained[pc_to_plot[1] - 1 ], 1)
@@ -57,21 +259,24 @@ def plot_pcoa_2d(
                 'color': group_col
                 },
         title="2D PCoA",
-        hover_name=df_metadata_resticted[filename_col],
+        hover_name=hover_name,
         template="simple_white"
     )
     fig.update_layout({'width':1000, 'height':650})
-    fig.show()
+    return _output(fig, output_path, output_format, show)
 
 
 def plot_pcoa_3d(
     matrix, df_metadata, filename_col, group_col,
-    metric = 'braycurtis', norm = False, scaling = False, pc_to_plot = (1, 2, 3)
+    metric = 'braycurtis', norm = False, scaling = False, pc_to_plot = (1, 2, 3),
+    pcoa_method = 'eigh', n_landmarks = 500, max_hover_samples = 5000,
+    output_path = None, output_format = None, show = None
     ):
     """ Simple 2D PCoA plot of a MEMO matrix / Feature table using Plotly
 
     Args:
-        matrix (DataFrame): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format
+        matrix (DataFrame or PreparedAnalysis): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format,
+        or a PreparedAnalysis to reuse its preprocessing, distances, PCoA and linkage
         df_metadata (DataFrame): Metadata of the MEMO matrix samples
         filename_col (str): Column name in df_metadata to match memo_matrix index
         group_col (str): Column name in df_metadata to use as groups for plotting
@@ -80,27 +285,29 @@ def plot_pcoa_3d(
         norm (bool, optional): Apply samples normalization. Defaults to False.
         scaling (bool, optional): Apply pareto scaling to MEMO matrix columns. Defaults to False.
         pc_to_plot (list of int, optional): PCs to plot. Defaults to [1,2,3].
+        pcoa_method (str, optional): One of [eigh, eigsh, randomized, landmark]: eigh computes all the PCs,
+        the other methods only the plotted ones, faster for large numbers of samples. Defaults to 'eigh'.
+        n_landmarks (int, optional): Number of samples used by the landmark pcoa_method. Defaults to 500.
+        max_hover_samples (int, optional): Above this number of samples, only the names of max_hover_samples
+        samples are kept for hovering and coordinates are rounded, to keep the figure small. Defaults to 5000.
+        output_path (str, optional): Write the figure to this file, see save_figure. Defaults to None.
+        output_format (str, optional): Format of output_path. Defaults to its extension.
+        show (bool, optional): Show the figure. Defaults to showing it only if it is not written to output_path.
 
     Returns:
-        None
+        fig (plotly.graph_objects.Figure): the figure
     """
     #pylint: disable=too-many-arguments
     #pylint: disable=too-many-locals
-    df_metadata_resticted = df_metadata[df_metadata[filename_col].isin(list(matrix.index))]
-    matrix = matrix[matrix.index.isin(list(df_metadata_resticted[filename_col]))].reindex(list(df_metadata_resticted[filename_col]))
-    if norm is True:
-        matrix = matrix.div(matrix.sum(axis=1), axis=0)
-    if scaling is True:
-        matrix = matrix.to_numpy()
-        matrix = np.log10(matrix, out=np.zeros_like(matrix), where=(matrix!=0)) # Log scale (base-10)
-        matrix = cb.utils.scale(matrix, method='pareto')
-
-    dm_memo = sp.spatial.distance.pdist(matrix, metric)
-    pcoa_results = pcoa(dm_memo)
+    analysis = prepare(matrix, df_metadata, filename_col)
+    df_metadata_resticted, filename_col = analysis.df_metadata, analysis.filename_col
+    n_components = None if pcoa_method == 'eigh' else max(pc_to_plot)
+    pcoa_results = analysis.pcoa(metric, norm, scaling, pcoa_method, n_components, n_landmarks)
 
     x = pcoa_results.samples[f'PC{pc_to_plot[0]}']
     y = pcoa_results.samples[f'PC{pc_to_plot[1]}']
     z = pcoa_results.samples[f'PC{pc_to_plot[2]}']
+    hover_name, (x, y, z) = _hover_names(df_metadata_resticted[filename_col], (x, y, z), max_hover_samples)
 
     exp_var_pc1 = round(100*pcoa_results.proportion_explained[pc_to_plot[0] - 1 ], 1)
     exp_var_pc2 = round(100*pcoa_results.proportion_explained[pc_to_plot[1] - 1 ], 1)
@@ -113,111 +320,125 @@ def plot_pcoa_3d(
                 'color': group_col
                 },
         title="3D PCoA",
-        hover_name=df_metadata_resticted[filename_col],
+        hover_name=hover_name,
         template="simple_white"
     )
     fig.update_layout({'width':1000, 'height':650})
-    fig.show()
+    return _output(fig, output_path, output_format, show)
 
 
 def plot_hca(
     matrix, df_metadata, filename_col, group_col,
     plotly_discrete_cm = px.colors.qualitative.Plotly,
     linkage_method = 'ward', linkage_metric = 'euclidean',
-    norm = False, scaling = False):
+    norm = False, scaling = False,
+    output_path = None, output_format = None, show = None):
     """Simple HCA plot of a MEMO matrix / Feature table using matplotlib
 
     Args:
-        matrix (DataFrame): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format
+        matrix (DataFrame or PreparedAnalysis): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format,
+        or a PreparedAnalysis to reuse its preprocessing, distances, PCoA and linkage
         df_metadata (DataFrame): Metadata of the MEMO matrix samples
         filename_col (str): Column name in df_metadata to match memo_matrix index
         group_col (str): Column name in df_metadata to use as groups for plotting
         plotly_discrete_cm ([type], optional): Plotly discrete colormap to use for groups. Defaults to px.colors.qualitative.Plotly.
         linkage_method (str, optional): Linkage method to use. Defaults to 'ward'.
-        linkage_metric (str, optional): Linkage metric to use. Defaults to 'euclidean'.
+        linkage_metric (str, optional): Linkage metric to use, must be 'euclidean' for the 'ward', 'centroid' and
+            'median' methods. Defaults to 'euclidean'.
         norm (bool, optional): Apply samples normalization. Defaults to False.
         scaling (bool, optional): Apply pareto scaling to MEMO matrix columns. Defaults to False.
+        output_path (str, optional): Write the figure to this file, see save_figure. Defaults to None.
+        output_format (str, optional): Format of output_path. Defaults to its extension.
+        show (bool, optional): Show the figure. Defaults to showing it only if it is not written to output_path.
 
     Returns:
-        None
+        fig (matplotlib.figure.Figure): the figure
     """
     #pylint: disable=too-many-arguments
     #pylint: disable=too-many-locals
     #pylint: disable=dangerous-default-value
-    df_metadata_resticted = df_metadata[df_metadata[filename_col].isin(list(matrix.index))]
-    matrix = matrix[matrix.index.isin(list(df_metadata_resticted[filename_col]))].reindex(list(df_metadata_resticted[filename_col]))
-    if norm is True:
-        matrix = matrix.div(matrix.sum(axis=1), axis=0)
-    if scaling is True:
-        matrix = matrix.to_numpy()
-        matrix = np.log10(matrix, out=np.zeros_like(matrix), where=(matrix!=0)) # Log scale (base-10)
-        matrix = cb.utils.scale(matrix, method='pareto')
+    if linkage_method in EUCLIDEAN_LINKAGES and linkage_metric != 'euclidean':
+        raise ValueError(
+            f"linkage_metric argument must be 'euclidean' with linkage_method={linkage_method}, got {linkage_metric}"
+            )
+    analysis = prepare(matrix, df_metadata, filename_col)
+    df_metadata_resticted, filename_col = analysis.df_metadata, analysis.filename_col
 
     groups = df_metadata_resticted[group_col].unique()
     colors_list = plotly_discrete_cm
     dic_col = dict(zip(groups, cycle(colors_list)))
 
-    Z = linkage(matrix, method=linkage_method, metric=linkage_metric)
+    Z = analysis.linkage(linkage_method, linkage_metric, norm, scaling)
 
-    plt.figure(figsize=(12, 8), dpi=80)
+    fig, ax = plt.subplots(figsize=(12, 8), dpi=80)
 
     dendrogram(
         Z, labels =df_metadata_resticted[group_col].to_list(),
         leaf_rotation=0,
-        orientation='left'
+        orientation='left',
+        ax=ax
         )
-    xlbls = plt.gca().get_yticklabels()
+    xlbls = ax.get_yticklabels()
     for lbl in xlbls:
         lbl.set_color(dic_col[lbl.get_text()])
 
-    plt.show()
+    return _output(fig, output_path, output_format, show)
 
 
 def plot_heatmap(
     matrix, df_metadata, filename_col, group_col,
     plotly_discrete_cm = px.colors.qualitative.Plotly,
     linkage_method = 'ward', linkage_metric = 'euclidean',
-    heatmap_metric = 'braycurtis', norm = False, scaling = False):
+    heatmap_metric = 'braycurtis', norm = False, scaling = False,
+    output_path = None, output_format = None, show = None):
     """HCA and heatmap plot of a MEMO matrix / Feature table using Plotly
 
     Args:
-        matrix (DataFrame): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format
+        matrix (DataFrame or PreparedAnalysis): A Table in the MemoMatrix.memo_matrix or FeatureTable.feature_table format,
+        or a PreparedAnalysis to reuse its preprocessing, distances, PCoA and linkage
         df_metadata (DataFrame): Metadata of the MEMO matrix samples
         filename_col (str): Column name in df_metadata to match memo_matrix index
         group_col (str): Column name in df_metadata to use as groups for plotting
         plotly_discrete_cm ([type], optional): Plotly discrete colormap to use for groups. Defaults to px.colors.qualitative.Plotly.
         linkage_method (str, optional): Linkage method to use. Defaults to 'ward'.
-        linkage_metric (str, optional): Linkage metric to use. Defaults to 'euclidean'.
+        linkage_metric (str, optional): Linkage metric to use, must be 'euclidean' for the 'ward', 'centroid' and
+            'median' methods. Defaults to 'euclidean'.
         heatmap_metric (str, optional): Distance metric to use for heatmap. Defaults to 'braycurtis'.
         norm (bool, optional): Apply samples normalization. Defaults to False.
         scaling (bool, optional): Apply pareto scaling to MEMO matrix columns. Defaults to False.
+        output_path (str, optional): Write the figure to this file, see save_figure. Defaults to None.
+        output_format (str, optional): Format of output_path. Defaults to its extension.
+        show (bool, optional): Show the figure. Defaults to showing it only if it is not written to output_path.
 
     Returns:
-        None
+        fig (plotly.graph_objects.Figure): the figure
     """
     #pylint: disable=too-many-arguments
     #pylint: disable=too-many-locals
     #pylint: disable=dangerous-default-value
-    df_metadata_resticted = df_metadata[df_metadata[filename_col].isin(list(matrix.index))]
-    matrix = matrix[matrix.index.isin(list(df_metadata_resticted[filename_col]))].reindex(list(df_metadata_resticted[filename_col]))
-    if norm is True:
-        matrix = matrix.div(matrix.sum(axis=1), axis=0)
-    if scaling is True:
-        matrix = matrix.to_numpy()
-        matrix = np.log10(matrix, out=np.zeros_like(matrix), where=(matrix!=0)) # Log scale (base-10)
-        matrix = cb.utils.scale(matrix, method='pareto')
-
-    dm_memo = sp.spatial.distance.pdist(matrix, heatmap_metric)
+    if linkage_method in EUCLIDEAN_LINKAGES and linkage_metric != 'euclidean':
+        raise ValueError(
+            f"linkage_metric argument must be 'euclidean' with linkage_method={linkage_method}, got {linkage_metric}"
+            )
+    analysis = prepare(matrix, df_metadata, filename_col)
+    df_metadata_resticted, filename_col = analysis.df_metadata, analysis.filename_col
+    matrix = analysis.preprocessed(norm, scaling)
+    dm_memo = analysis.distances(heatmap_metric, norm, scaling)
+    # Both dendrograms use the memoized distances and linkage instead of computing them again
+    def distfun(_):
+        return analysis.distances(linkage_metric, norm, scaling)
+    def linkagefun(_):
+        return analysis.linkage(linkage_method, linkage_metric, norm, scaling)
 
     fig = ff.create_dendrogram(matrix, orientation='bottom', labels= df_metadata_resticted[group_col].to_list(),
-    linkagefun=lambda x: linkage(x, method=linkage_method, metric = linkage_metric)
+    distfun=distfun, linkagefun=linkagefun
     )
     for i in range(len(fig['data'])):
         fig['data'][i]['yaxis'] = 'y2'
 
     # Create Side Dendrogram
     dendro_side = ff.create_dendrogram(matrix, orientation='right',
-    linkagefun=lambda x: linkage(x, method=linkage_method, metric = linkage_metric),
+    distfun=distfun, linkagefun=linkagefun
     )
     for i in range(len(dendro_side['data'])):
         dendro_side['data'][i]['xaxis'] = 'x2'
@@ -331,4 +552,60 @@ def plot_heatmap(
     fig.update_layout(legend={"orientation": 'v', "y": 1, "x": 1})
 
     fig.update_xaxes(tickangle=45)
-    fig.show()
+    return _output(fig, output_path, output_format, show)
+
+
+PLOTS = {'pcoa_2d': plot_pcoa_2d, 'pcoa_3d': plot_pcoa_3d, 'hca': plot_hca, 'heatmap': plot_heatmap}
+
+
+def _render(item, df_metadata, filename_col, group_col, output_dir, plots, output_format, plot_kwargs):
+    """Write the plots of one (name, matrix) item of render_batch"""
+    #pylint: disable=too-many-arguments
+    name, matrix = item
+    analysis = prepare(matrix, df_metadata, filename_col)
+    paths = []
+    for plot in plots:
+        fig = PLOTS[plot](analysis, None, None, group_col, show=False, **plot_kwargs.get(plot, {}))
+        plot_format = output_format
+        if plot == 'hca' and output_format in ('html', 'json'):
+            plot_format = 'svg'
+        path = os.path.join(output_dir, f"{name}_{plot}.{plot_format}")
+        save_figure(fig, path, plot_format, include_plotlyjs='directory')
+        paths.append(path)
+    return name, paths
+
+
+def render_batch(
+    matrices, df_metadata, filename_col, group_col, output_dir,
+    plots = ('pcoa_2d', 'hca', 'heatmap'), output_format = 'html', plot_kwargs = None,
+    n_jobs = 1, executor = None
+    ):
+    """Write the plots of many MEMO matrices / Feature tables without showing them
+
+    Args:
+        matrices (dict): {name: matrix}, matrices in the MemoMatrix.memo_matrix or FeatureTable.feature_table format
+        df_metadata (DataFrame): Metadata of the samples of all the matrices
+        filename_col (str): Column name in df_metadata to match the matrices index
+        group_col (str): Column name in df_metadata to use as groups for plotting
+        output_dir (str): Directory where the plots are written as {name}_{plot}.{output_format}, created if needed
+        plots (list of str, optional): Plots to write, among [pcoa_2d, pcoa_3d, hca, heatmap]. Defaults to ('pcoa_2d', 'hca', 'heatmap').
+        output_format (str, optional): Format of the plots, see save_figure. The HCA, drawn with matplotlib, is written
+        as svg when output_format is html or json. html files share a plotly.min.js written in output_dir. Defaults to 'html'.
+        plot_kwargs (dict, optional): {plot: keyword arguments of the plotting function}. Defaults to None.
+        n_jobs (int, optional): Number of matrices rendered in parallel processes, -1 to use all the processors. Defaults to 1.
+        executor (concurrent.futures.Executor, optional): Executor to use instead of n_jobs. Defaults to None.
+
+    Returns:
+        paths (dict): {name: list of the written files}
+    """
+    #pylint: disable=too-many-arguments
+    unknown = set(plots) - set(PLOTS)
+    if unknown:
+        raise ValueError(f"plots argument must be among {list(PLOTS)}")
+    os.makedirs(output_dir, exist_ok=True)
+    render = partial(
+        _render, df_metadata=df_metadata, filename_col=filename_col, group_col=group_col, output_dir=output_dir,
+        plots=plots, output_format=output_format, plot_kwargs=plot_kwargs or {}
+        )
+    with parallel.pool(n_jobs, executor) as pool:
+        return dict(pool.map(render, matrices.items()))
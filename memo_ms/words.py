@@ -0,0 +1,66 @@
+"""Integer encoding of the peaks/losses words.
+
+A word id is the m/z binned at n_decimals (round(m/z * 10**n_decimals)) shifted left by one bit,
+the last bit flagging losses: "peak@71.05" <-> 7105 << 1 and "loss@18.01" <-> (1801 << 1) | 1.
+Ids are much cheaper to hash, count and store than strings and are translated back to the usual
+string words only when exporting.
+"""
+import numpy as np
+
+LOSS_FLAG = 1
+
+
+def bin_mz(mz, n_decimals) -> np.ndarray:
+    """Bin m/z values at n_decimals, rounding exactly as the "{mz:.{n_decimals}f}" string words do
+
+    Args:
+        mz (array-like): m/z values
+        n_decimals (int): number of decimals
+
+    Returns:
+        bins (ndarray of int64): the binned m/z values
+    """
+    mz = np.asarray(mz, dtype=float)
+    scaled = mz * 10**n_decimals
+    bins = np.rint(scaled)
+    # float products close to a rounding boundary may round differently than the decimal string formatting
+    ambiguous = np.flatnonzero(np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6)
+    for i in ambiguous:
+        bins[i] = int(f"{mz[i]:.{n_decimals}f}".replace('.', ''))
+    return bins.astype(np.int64)
+
+def encode(peaks_mz, losses_mz, n_decimals) -> np.ndarray:
+    """Translate peaks and losses m/z into word ids, in the same order as spec2vec.SpectrumDocument words
+
+    Args:
+        peaks_mz (array-like): peaks m/z
+        losses_mz (array-like): losses m/z, can be None
+        n_decimals (int): number of decimals
+
+    Returns:
+        word_ids (ndarray of int64): peaks ids followed by losses ids
+    """
+    peaks = bin_mz(peaks_mz, n_decimals) << 1
+    if losses_mz is None:
+        return peaks
+    losses = (bin_mz(losses_mz, n_decimals) << 1) | LOSS_FLAG
+    return np.concatenate([peaks, losses])
+
+def decode(word_ids, n_decimals) -> list:
+    """Translate word ids back to "peak@xx.xx" / "loss@yy.yy" words
+
+    Args:
+        word_ids (array-like of int): word ids
+        n_decimals (int): number of decimals used to encode them
+
+    Returns:
+        words (list of str): the string words
+    """
+    word_ids = np.asarray(word_ids, dtype=np.int64)
+    kinds = np.where(word_ids & LOSS_FLAG, 'loss@', 'peak@')
+    bins = word_ids >> 1
+    signs = np.where(bins < 0, '-', '')
+    units, decimals = np.divmod(np.abs(bins), 10**n_decimals)
+    if n_decimals == 0:
+        return [f"{kind}{sign}{unit}" for kind, sign, unit in zip(kinds, signs, units)]
+    return [f"{kind}{sign}{unit}.{decimal:0{n_decimals}d}" for kind, sign, unit, decimal in zip(kinds, signs, units, decimals)]
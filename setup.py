@@ -31,6 +31,7 @@ setup(name='memo_ms',
           'ipykernel',
           'pandas',
           'numpy',
+          'scipy',
           'jupyter >= 1.0.0',
           'matchms >= 0.9.0',
           'spec2vec >= 0.4',
@@ -47,6 +48,10 @@ setup(name='memo_ms',
                             "pytest-cov",
                             "sphinx>=3.0.0,!=3.2.0,!=3.5.0,<4.0.0",
                             "sphinx_rtd_theme",
-                            "sphinxcontrib-apidoc"],
+                            "sphinxcontrib-apidoc",
+                            "pyarrow",
+                            "pytest-benchmark"],
+                     "columnar": ["pyarrow"],
                      },
+      entry_points={"console_scripts": ["memo = memo_ms.cli:main"]},
       zip_safe=False)
@@ -1,5 +1,10 @@
+import json
 import os
+import shutil
+import tracemalloc
+from collections import Counter
 import numpy as np
+import pandas as pd
 import pytest
 import memo_ms as memo
 
@@ -137,4 +142,255 @@ def test_merge():
     
     merge = container.merge_memo(container2)
     assert merge.memo_matrix.shape == (203, 12849), "Expected different table shape"
-    
\ No newline at end of file
+    
+def test_memo_matrix_sparse():
+    container = memo.MemoMatrix()
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+    container_sparse = memo.MemoMatrix(sparse=True)
+    container_sparse.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+    assert isinstance(container_sparse.memo_matrix, memo.sparse.SparseTable), "Expected a SparseTable"
+    assert container_sparse.memo_matrix.shape == (5, 12842), "Expected different table shape"
+    np.testing.assert_array_equal(container_sparse.memo_matrix.to_dense().to_numpy(), container.memo_matrix.to_numpy())
+    filtered = container_sparse.filter(use_samples_pattern = True, samples_pattern= 'blank', max_occurence=0)
+    assert filtered.memo_matrix.shape == (4, 12274), "Expected different table shape after filtering"
+    filtered = container_sparse.filter(use_samples_pattern = False, min_rel_occurence = 0.4, max_rel_occurence = 0.8)
+    assert filtered.memo_matrix.shape == (5, 3246), "Expected different table shape after filtering"
+
+def test_merge_sparse(tmp_path):
+    container = memo.MemoMatrix(sparse=True)
+    filename_table = os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv")
+    filename_spectra = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+    spectra = memo.SpectraDocuments(filename_spectra)
+    table = memo.FeatureTable(filename_table, software="mzmine")
+    container.memo_from_aligned_samples(table, spectra)
+
+    container2 = memo.MemoMatrix()
+    container2.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+
+    merge = container.merge_memo(container2)
+    assert merge.memo_matrix.shape == (203, 12849), "Expected different table shape"
+    assert container.merge_memo(container2, drop_not_in_common=True).memo_matrix.shape == (203, 115), \
+        "Expected different table shape"
+    dense = merge.memo_matrix.to_dense()
+    merge.export_matrix(tmp_path / "sparse.csv")
+    dense.to_csv(tmp_path / "dense.csv")
+    assert (tmp_path / "sparse.csv").read_text() == (tmp_path / "dense.csv").read_text(), \
+        "Expected sparse and dense exports to be identical"
+
+def test_memo_matrix_from_aligned_matches_counter():
+    filename_table = os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv")
+    filename_spectra = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+    spectra = memo.SpectraDocuments(filename_spectra)
+    table = memo.FeatureTable(filename_table, software="mzmine")
+    container = memo.MemoMatrix()
+    container.memo_from_aligned_samples(table, spectra)
+
+    documents = spectra.document.set_index('scans')['documents'].to_dict()
+    expected = {}
+    for sample, row in table.feature_table.iterrows():
+        if (row != 0).any():
+            words = [word for feature in row.index[row != 0] for word in documents.get(feature, [])]
+            expected[sample] = Counter(words)
+    expected = pd.DataFrame(expected).transpose().fillna(0)
+    expected.index.name = 'filename'
+    pd.testing.assert_frame_equal(container.memo_matrix, expected)
+
+def test_memo_matrix_from_unaligned_parallel():
+    container = memo.MemoMatrix()
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+    container_parallel = memo.MemoMatrix()
+    container_parallel.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"), n_jobs=2)
+    pd.testing.assert_frame_equal(container.memo_matrix, container_parallel.memo_matrix)
+    with pytest.raises(ValueError, match="n_jobs"):
+        container_parallel.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"), n_jobs=0)
+
+def test_spectra_documents_without_spectra():
+    filename = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+    spectra = memo.SpectraDocuments(filename)
+    spectra_streamed = memo.SpectraDocuments(filename, keep_spectra=False)
+    assert spectra_streamed.spectra is None, "Expected no spectra to be kept"
+    pd.testing.assert_frame_equal(spectra.document, spectra_streamed.document)
+
+def test_spectra_documents_cache(tmp_path):
+    filename = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+    spectra = memo.SpectraDocuments(filename, cache_dir=str(tmp_path))
+    assert len(spectra.spectra) == 3, "Expected spectra when building the cache"
+    assert len(list(tmp_path.glob("*.npz"))) == 1, "Expected one cache entry"
+    spectra_cached = memo.SpectraDocuments(filename, cache_dir=str(tmp_path))
+    assert spectra_cached.spectra is None, "Expected documents to be loaded from the cache"
+    pd.testing.assert_frame_equal(spectra.document, spectra_cached.document)
+
+    spectra_binned = memo.SpectraDocuments(filename, cache_dir=str(tmp_path), word_encoding="binned", n_decimals=3)
+    assert len(list(tmp_path.glob("*.npz"))) == 2, "Expected a new cache entry for other parameters"
+    spectra_binned_cached = memo.SpectraDocuments(filename, cache_dir=str(tmp_path), word_encoding="binned", n_decimals=3)
+    for doc, doc_cached in zip(spectra_binned.document.documents, spectra_binned_cached.document.documents):
+        np.testing.assert_array_equal(doc, doc_cached)
+
+    memo.SpectraDocuments(filename, cache_dir=str(tmp_path), losses_to=100, max_cache_size=1)
+    assert len(list(tmp_path.glob("*.npz"))) == 1, "Expected least recently used entries to be evicted"
+
+def test_cache_metadata_without_pickle(tmp_path):
+    metadata = pd.DataFrame({
+        'scans': [1, 2, 3], 'pepmass': [(338.342, None), (702.2131, 1.0), (10.0, None)],
+        'collision_energy': ['0.0', None, np.nan], 'precursor_mz': [338.342, 702.2131, np.nan], 'ok': [True, False, True]
+        })
+    document = metadata.assign(documents=[['peak@1.00'], [], ['loss@2.00', 'peak@3.00']])
+    memo.cache.save(str(tmp_path), 'key', document)
+    with np.load(tmp_path / "key.npz", allow_pickle=False) as arrays:
+        assert all(arrays[name].dtype != object for name in arrays.files), "Expected no pickled array"
+    pd.testing.assert_frame_equal(memo.cache.load(str(tmp_path), 'key'), document)
+
+class RecordingExecutor:
+    """Serial executor recording the processed files"""
+    def __init__(self):
+        self.paths = []
+
+    def map(self, func, paths):
+        paths = list(paths)
+        self.paths.extend(os.path.basename(path) for path in paths)
+        return map(func, paths)
+
+def test_memo_matrix_update_from_unaligned(tmp_path):
+    samples_dir = tmp_path / "samples"
+    samples_dir.mkdir()
+    files = sorted(os.listdir(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned")))
+    for file in files[:3]:
+        shutil.copy(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned", file), samples_dir / file)
+    container = memo.MemoMatrix()
+    container.update_from_unaligned_samples(str(samples_dir), str(tmp_path / "state"))
+    assert container.memo_matrix.shape[0] == 3, "Expected 3 samples"
+
+    for file in files[3:]:
+        shutil.copy(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned", file), samples_dir / file)
+    os.remove(samples_dir / files[0])
+    executor = RecordingExecutor()
+    container.update_from_unaligned_samples(str(samples_dir), str(tmp_path / "state"), executor=executor)
+    assert sorted(executor.paths) == files[3:], "Expected only new files to be processed"
+
+    expected = memo.MemoMatrix()
+    expected.memo_from_unaligned_samples(str(samples_dir))
+    # rows in the order of a full run, words are in order of first appearance in the processed files
+    pd.testing.assert_frame_equal(container.memo_matrix.sort_index(axis=1), expected.memo_matrix.sort_index(axis=1))
+
+    changed = samples_dir / files[3]
+    os.utime(changed, ns=(changed.stat().st_atime_ns, changed.stat().st_mtime_ns + 10**9))
+    executor = RecordingExecutor()
+    container.update_from_unaligned_samples(str(samples_dir), str(tmp_path / "state"), executor=executor)
+    assert executor.paths == [files[3]], "Expected only the changed file to be processed"
+    pd.testing.assert_frame_equal(container.memo_matrix.sort_index(axis=1), expected.memo_matrix.sort_index(axis=1))
+
+    executor = RecordingExecutor()
+    container.update_from_unaligned_samples(str(samples_dir), str(tmp_path / "state"), executor=executor)
+    assert executor.paths == [], "Expected no file to be processed"
+    executor = RecordingExecutor()
+    container.update_from_unaligned_samples(str(samples_dir), str(tmp_path / "state"), executor=executor, n_decimals=3)
+    assert len(executor.paths) == 4, "Expected all files to be processed with new parameters"
+
+def test_memo_matrix_update_interrupted(tmp_path, monkeypatch):
+    samples_dir = os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned")
+    state_dir = tmp_path / "state"
+    container = memo.MemoMatrix()
+    container.update_from_unaligned_samples(samples_dir, str(state_dir))
+    assert sorted(os.listdir(state_dir)) == ['manifest.json', 'memo_matrix.npz'], "Expected no temporary file left"
+
+    def interrupted(source, destination):
+        if os.path.basename(destination) == 'manifest.json':
+            raise KeyboardInterrupt
+        os.rename(source, destination)
+    monkeypatch.setattr(os, 'replace', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        container.update_from_unaligned_samples(samples_dir, str(state_dir), n_decimals=3)
+    monkeypatch.undo()
+    with open(state_dir / "manifest.json", encoding='utf8') as handle:
+        assert json.load(handle)['parameters']['n_decimals'] == 2, "Expected the previous manifest to be intact"
+
+    # the n_decimals=3 matrix was written, but not its manifest: it must not be taken for the n_decimals=2 matrix
+    executor = RecordingExecutor()
+    container.update_from_unaligned_samples(samples_dir, str(state_dir), executor=executor)
+    assert len(executor.paths) == len(os.listdir(samples_dir)), "Expected all files to be processed again"
+    expected = memo.MemoMatrix()
+    expected.memo_from_unaligned_samples(samples_dir)
+    pd.testing.assert_frame_equal(container.memo_matrix, expected.memo_matrix)
+
+def test_filter_table_missing_values():
+    table = pd.DataFrame(
+        [[1, 0, np.nan, 0, 2], [0, 0, 3, np.nan, 2], [4, 0, 0, 0, 0], [5, 6, 0, np.nan, 0]],
+        index=['Blank_1', 'sample_1', 'sample_2', 'blank_2'], columns=list('abcde')
+        )
+    np.testing.assert_array_equal(memo.classes.occurences(table), [3, 1, 1, 0, 2])
+    np.testing.assert_array_equal(memo.classes.occurences(table, count_missing=True), [3, 1, 2, 2, 2])
+    np.testing.assert_array_equal(memo.classes.occurences(table, rows=[True, False, False, True], block_size=1), [2, 1, 0, 0, 1])
+
+    filtered = memo.classes.filter_table(table, use_samples_pattern=True, samples_pattern='blank', max_occurence=1)
+    expected = pd.DataFrame([[3, np.nan, 2], [0, 0, 0]], index=['sample_1', 'sample_2'], columns=list('cde'), dtype=float)
+    pd.testing.assert_frame_equal(filtered, expected)
+
+    filtered = memo.classes.filter_table(table, min_rel_occurence=0.25, max_rel_occurence=0.5)
+    expected = pd.DataFrame([[0, 0, 2], [0, 3, 2], [0, 0, 0], [6, 0, 0]], index=table.index, columns=list('bce'), dtype=float)
+    pd.testing.assert_frame_equal(filtered, expected)
+
+def test_filter_memory():
+    rng = np.random.default_rng(0)
+    values = rng.poisson(0.05, (400, 20000)).astype(float)
+    values[:20] = 1  # blank samples containing every word
+    index = [f"blank_{i}" for i in range(20)] + [f"sample_{i}" for i in range(380)]
+    container = memo.MemoMatrix()
+    container.memo_matrix = pd.DataFrame(values, index=index, columns=[f"peak@{i}" for i in range(20000)])
+    del values
+    container.memo_matrix.iloc[:20, :500] = 0  # words kept by the blank filter
+    input_size = container.memo_matrix.memory_usage().sum()
+
+    tracemalloc.start()
+    try:
+        filtered = container.filter(use_samples_pattern=True, samples_pattern='blank', max_occurence=0)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    output_size = filtered.memo_matrix.memory_usage().sum()
+    assert filtered.memo_matrix.shape[0] == 380 and filtered.memo_matrix.shape[1] <= 500
+    assert peak < output_size + input_size / 4, "Expected peak memory near the output size, without copying the input"
+    assert container.memo_matrix.shape == (400, 20000), "Expected the original matrix unchanged"
+
+def test_filter_inplace():
+    container = memo.MemoMatrix()
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+    expected = container.filter(use_samples_pattern=True, samples_pattern='blank', max_occurence=0)
+    assert container.filter(use_samples_pattern=True, samples_pattern='blank', max_occurence=0, inplace=True) is None
+    pd.testing.assert_frame_equal(container.memo_matrix, expected.memo_matrix)
+
+    table = memo.FeatureTable(os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv"), software="mzmine")
+    expected = table.filter(min_rel_occurence=0.1)
+    assert expected.path == table.path and expected.software == table.software
+    assert table.filter(min_rel_occurence=0.1, inplace=True) is None
+    pd.testing.assert_frame_equal(table.feature_table, expected.feature_table)
+
+def _memo(table, sparse = False):
+    container = memo.MemoMatrix(sparse=sparse)
+    container.memo_matrix = memo.sparse.from_dense(table) if sparse else table
+    return container
+
+@pytest.mark.parametrize('drop_not_in_common', [False, True])
+def test_merge_memos(drop_not_in_common):
+    tables = [
+        pd.DataFrame([[1., 0., 2.]], index=['s1'], columns=['peak@1', 'peak@2', 'loss@3']),
+        pd.DataFrame([[3., 4.], [0., 5.]], index=['s2', 's3'], columns=['peak@2', 'peak@1']),
+        pd.DataFrame([[6., 7., 8.]], index=['s4'], columns=['peak@4', 'peak@1', 'peak@2']),
+        ]
+    expected = pd.concat(tables)
+    expected = expected.dropna(axis='columns') if drop_not_in_common else expected.fillna(0)
+    merged = memo.merge_memos([_memo(table) for table in tables], drop_not_in_common=drop_not_in_common)
+    pd.testing.assert_frame_equal(merged.memo_matrix, expected)
+    columns = ['peak@1', 'peak@2'] if drop_not_in_common else ['peak@1', 'peak@2', 'loss@3', 'peak@4']
+    assert list(merged.memo_matrix.columns) == columns, "Expected words in order of first appearance"
+    assert list(merged.memo_matrix.index) == ['s1', 's2', 's3', 's4']
+    assert merged.memo_matrix.loc['s4', 'peak@1'] == 7
+
+    merged_sparse = memo.merge_memos([_memo(table, sparse=True) for table in tables], drop_not_in_common=drop_not_in_common)
+    assert isinstance(merged_sparse.memo_matrix, memo.sparse.SparseTable), "Expected a sparse merged matrix"
+    pd.testing.assert_frame_equal(merged_sparse.memo_matrix.to_dense(), expected)
+
+def test_merge_memos_exceptions():
+    with pytest.raises(ValueError):
+        memo.merge_memos([])
+    with pytest.raises(TypeError):
+        memo.merge_memos([memo.MemoMatrix(), pd.DataFrame()])
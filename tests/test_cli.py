@@ -0,0 +1,80 @@
+import json
+import os
+import pytest
+import memo_ms as memo
+from memo_ms import cli
+
+
+PATH_ROOT = os.path.dirname((__file__))
+PATH_TEST_RESOURCES = os.path.join(PATH_ROOT, 'test_data')
+
+
+@pytest.fixture
+def restore_memory_limit():
+    """Restore the address space limit lowered by --memory-limit in the pytest process"""
+    resource = pytest.importorskip("resource")
+    limits = resource.getrlimit(resource.RLIMIT_AS)
+    yield
+    resource.setrlimit(resource.RLIMIT_AS, limits)
+
+def test_parse_size():
+    assert cli.parse_size("512") == 512, "Expected bytes"
+    assert cli.parse_size("2K") == 2048, "Expected kibibytes"
+    assert cli.parse_size("1.5G") == 3 * 2**29, "Expected gibibytes"
+    with pytest.raises(Exception):
+        cli.parse_size("lots")
+
+def test_unaligned_filter_merge_export(tmp_path):
+    samples_dir = os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned")
+    assert cli.main(["unaligned", samples_dir, "-o", str(tmp_path / "unaligned.npz"), "--engine", "numpy"]) == 0
+    unaligned = memo.MemoMatrix()
+    unaligned.memo_from_unaligned_samples(samples_dir, engine='numpy')
+
+    assert cli.main([
+        "filter", str(tmp_path / "unaligned.npz"), "-o", str(tmp_path / "filtered.npz"),
+        "--samples-pattern", "blank", "--max-occurence", "0"
+        ]) == 0
+    filtered = unaligned.filter(use_samples_pattern=True, samples_pattern='blank', max_occurence=0)
+
+    assert cli.main([
+        "merge", str(tmp_path / "filtered.npz"), str(tmp_path / "unaligned.npz"), "-o", str(tmp_path / "merged.npz")
+        ]) == 0
+    assert cli.main(["export", str(tmp_path / "merged.npz"), "-o", str(tmp_path / "merged.csv")]) == 0
+    filtered.merge_memo(unaligned).export_matrix(tmp_path / "expected.csv")
+    assert (tmp_path / "merged.csv").read_text() == (tmp_path / "expected.csv").read_text(), \
+        "Expected same matrix as the python API"
+
+def test_unaligned_disk_dir(tmp_path):
+    samples_dir = os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned")
+    assert cli.main([
+        "unaligned", samples_dir, "-o", str(tmp_path / "disk.csv"), "--engine", "numpy",
+        "--disk-dir", str(tmp_path / "matrix"), "--shard-size", "2"
+        ]) == 0
+    assert cli.main(["unaligned", samples_dir, "-o", str(tmp_path / "memory.csv"), "--engine", "numpy"]) == 0
+    assert (tmp_path / "disk.csv").read_text() == (tmp_path / "memory.csv").read_text(), \
+        "Expected same matrix as built in memory"
+
+def test_aligned(tmp_path, restore_memory_limit):
+    output = tmp_path / "aligned.csv"
+    assert cli.main([
+        "aligned", os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv"),
+        os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf"), "-o", str(output), "--memory-limit", "64G"
+        ]) == 0
+    table = memo.FeatureTable(os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv"), software="mzmine")
+    spectra = memo.SpectraDocuments(os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf"))
+    expected = memo.MemoMatrix()
+    expected.memo_from_aligned_samples(table, spectra)
+    expected.export_matrix(tmp_path / "expected.csv")
+    assert output.read_text() == (tmp_path / "expected.csv").read_text(), "Expected same matrix as the python API"
+
+def test_profile(tmp_path):
+    samples_dir = os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned")
+    assert cli.main([
+        "unaligned", samples_dir, "-o", str(tmp_path / "unaligned.npz"), "--engine", "numpy",
+        "--profile", str(tmp_path / "profile.json")
+        ]) == 0
+    with open(tmp_path / "profile.json", encoding="utf8") as handle:
+        stages = {record["name"]: record for record in json.load(handle)}
+    assert stages["MemoMatrix.memo_from_unaligned_samples"]["counts"]["samples"] > 0, "Expected stage counts"
+    assert stages["count_sample_files"]["wall_time"] > 0, "Expected stage times"
+    assert not memo.instrumentation.enabled(), "Expected instrumentation disabled after the command"
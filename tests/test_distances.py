@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+import scipy.spatial.distance
+from memo_ms import distances
+from memo_ms import parallel
+from memo_ms import sparse
+
+
+@pytest.fixture
+def counts():
+    rng = np.random.default_rng(0)
+    matrix = scipy.sparse.random(
+        40, 300, density=0.1, random_state=1, data_rvs=lambda size: rng.integers(1, 6, size).astype(float)
+        ).toarray()
+    matrix[3] = matrix[5]
+    matrix[7] = 0
+    return matrix
+
+@pytest.mark.parametrize("metric", distances.METRICS)
+@pytest.mark.parametrize("transform", ["counts", "binary", "normalized"])
+def test_pdist_matches_scipy(counts, metric, transform):
+    if transform == "binary":
+        counts = (counts > 0).astype(float)
+    elif transform == "normalized":
+        counts = counts / counts.sum(axis=1, keepdims=True).clip(1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = scipy.spatial.distance.pdist(counts, metric)
+    dm = distances.pdist(counts, metric, block_size=16)
+    np.testing.assert_allclose(dm, expected, rtol=1e-12, atol=1e-12)
+    assert (dm[~np.isnan(dm)] >= 0).all(), "Expected non-negative distances"
+
+def test_pdist_identical_rows(counts):
+    dm = scipy.spatial.distance.squareform(distances.pdist(counts, 'braycurtis'))
+    assert dm[3, 5] == 0, "Expected exact zero distance between identical samples"
+    dm = scipy.spatial.distance.squareform(distances.pdist(counts, 'euclidean'))
+    assert dm[3, 5] == 0, "Expected exact zero distance between identical samples"
+
+@pytest.mark.parametrize('n_jobs, executor', [(2, None), (-2, None), (1, parallel.SerialExecutor())])
+def test_pdist_parallel(counts, n_jobs, executor):
+    table = sparse.from_dense(pd.DataFrame(counts))
+    np.testing.assert_array_equal(
+        distances.pdist(table, 'braycurtis', block_size=8, n_jobs=n_jobs, executor=executor),
+        distances.pdist(counts, 'braycurtis')
+        )
+
+def test_pdist_falls_back_to_scipy(counts):
+    scaled = counts - counts.mean(axis=0)
+    np.testing.assert_array_equal(
+        distances.pdist(scaled, 'braycurtis'), scipy.spatial.distance.pdist(scaled, 'braycurtis')
+        )
+    np.testing.assert_array_equal(
+        distances.pdist(counts, 'chebyshev'), scipy.spatial.distance.pdist(counts, 'chebyshev')
+        )
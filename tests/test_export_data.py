@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import memo_ms as memo
+from memo_ms import sparse
+
+
+PATH_ROOT = os.path.dirname((__file__))
+PATH_TEST_RESOURCES = os.path.join(PATH_ROOT, 'test_data')
+
+
+def assert_same_table(table, expected):
+    pd.testing.assert_frame_equal(table, expected, check_exact=True)
+    assert table.index.name == expected.index.name, "Expected same index name"
+    assert table.columns.name == expected.columns.name, "Expected same columns name"
+    assert table.columns.dtype == expected.columns.dtype, "Expected same columns dtype"
+
+@pytest.fixture
+def feature_table():
+    filename_table = os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv")
+    return memo.FeatureTable(filename_table, software="mzmine")
+
+@pytest.fixture
+def memo_matrix():
+    container = memo.MemoMatrix()
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+    return container
+
+@pytest.mark.parametrize("extension", ["parquet", "feather", "npz", "memmap"])
+def test_feature_table_round_trip(tmp_path, feature_table, extension):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / f"feature_table.{extension}"
+    feature_table.export_matrix(path)
+    loaded = memo.FeatureTable(path, software="matrix")
+    assert feature_table.feature_table.columns.dtype == np.int64, "Expected integer feature ids"
+    assert_same_table(loaded.feature_table, feature_table.feature_table)
+
+@pytest.mark.parametrize("extension", ["parquet", "feather", "npz", "memmap"])
+def test_memo_matrix_round_trip(tmp_path, memo_matrix, extension):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / f"memo_matrix.{extension}"
+    memo_matrix.memo_matrix = memo_matrix.memo_matrix.astype(np.float32)
+    memo_matrix.export_matrix(path)
+    loaded = memo.MemoMatrix()
+    loaded.memo_from_file(path)
+    assert_same_table(loaded.memo_matrix, memo_matrix.memo_matrix)
+
+def test_sparse_memo_matrix_round_trip(tmp_path):
+    container = memo.MemoMatrix(sparse=True)
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"), word_encoding='binned')
+    container.export_matrix(tmp_path / "memo_matrix.npz")
+    loaded = memo.MemoMatrix(sparse=True)
+    loaded.memo_from_file(tmp_path / "memo_matrix.npz")
+    assert isinstance(loaded.memo_matrix, sparse.SparseTable), "Expected a sparse matrix"
+    assert loaded.memo_matrix.n_decimals == 2, "Expected word encoding to be kept"
+    assert (loaded.memo_matrix.counts != container.memo_matrix.counts).nnz == 0, "Expected same counts"
+    assert_same_table(loaded.memo_matrix.to_dense(), container.memo_matrix.to_dense())
+
+def test_memmap_zero_copy(tmp_path):
+    container = memo.MemoMatrix(sparse=True)
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"), word_encoding='binned')
+    container.export_matrix(tmp_path / "memo_matrix", file_format="memmap")
+    loaded = memo.MemoMatrix(sparse=True)
+    loaded.memo_from_file(tmp_path / "memo_matrix")
+    assert isinstance(loaded.memo_matrix.counts.data, np.memmap), "Expected memory mapped counts"
+    assert not loaded.memo_matrix.counts.data.flags.writeable, "Expected read-only counts"
+    assert loaded.memo_matrix.n_decimals == 2, "Expected word encoding to be kept"
+    assert_same_table(loaded.memo_matrix.to_dense(), container.memo_matrix.to_dense())
+    filtered = loaded.filter(use_samples_pattern=True, samples_pattern='blank', max_occurence=0)
+    assert_same_table(
+        filtered.memo_matrix.to_dense(),
+        container.filter(use_samples_pattern=True, samples_pattern='blank', max_occurence=0).memo_matrix.to_dense()
+        )
+    np.testing.assert_allclose(memo.distances.pdist(loaded.memo_matrix), memo.distances.pdist(container.memo_matrix))
+
+def test_memmap_overwrite_open_matrix(tmp_path):
+    container = memo.MemoMatrix(sparse=True)
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+    container.export_matrix(tmp_path / "memo_matrix", file_format="memmap")
+    loaded = memo.MemoMatrix(sparse=True)
+    loaded.memo_from_file(tmp_path / "memo_matrix")
+    filtered = container.filter(use_samples_pattern=True, samples_pattern='blank', max_occurence=0)
+    filtered.export_matrix(tmp_path / "memo_matrix", file_format="memmap")
+    # the open matrix keeps reading the replaced files instead of truncated ones
+    assert_same_table(loaded.memo_matrix.to_dense(), container.memo_matrix.to_dense())
+    assert sorted(os.listdir(tmp_path / "memo_matrix")) == [
+        'columns.npy', 'data.bin', 'index.npy', 'indices.bin', 'indptr.bin', 'meta.json'
+        ], "Expected no temporary file left"
+    reloaded = memo.MemoMatrix(sparse=True)
+    reloaded.memo_from_file(tmp_path / "memo_matrix")
+    assert_same_table(reloaded.memo_matrix.to_dense(), filtered.memo_matrix.to_dense())
+
+    # a matrix opened from a directory can be written back to it
+    loaded.export_matrix(tmp_path / "memo_matrix", file_format="memmap")
+    reloaded.memo_from_file(tmp_path / "memo_matrix")
+    assert_same_table(reloaded.memo_matrix.to_dense(), container.memo_matrix.to_dense())
+
+def test_csv_round_trip(tmp_path, memo_matrix):
+    memo_matrix.export_matrix(tmp_path / "memo_matrix.csv")
+    loaded = memo.MemoMatrix()
+    loaded.memo_from_file(tmp_path / "memo_matrix.csv")
+    assert_same_table(loaded.memo_matrix, memo_matrix.memo_matrix)
+
+def test_unknown_file_format(tmp_path, memo_matrix):
+    with pytest.raises(ValueError):
+        memo_matrix.export_matrix(tmp_path / "memo_matrix.bin", file_format="hdf5")
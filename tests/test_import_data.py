@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import memo_ms as memo
+from memo_ms import import_data
+
+
+PATH_ROOT = os.path.dirname((__file__))
+PATH_TEST_RESOURCES = os.path.join(PATH_ROOT, 'test_data')
+
+
+@pytest.mark.parametrize('chunksize', [None, 1, 2])
+def test_mzmine_chunked(chunksize):
+    path = os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv")
+    expected = import_data.import_mzmine2_quant_table(path)
+    table = import_data.import_mzmine2_quant_table(path, dtype=np.float32, chunksize=chunksize)
+    assert (table.dtypes == np.float32).all(), "Expected float32 values"
+    pd.testing.assert_frame_equal(table, expected.astype(np.float32))
+    presence = import_data.import_mzmine2_quant_table(path, dtype=bool, chunksize=chunksize)
+    pd.testing.assert_frame_equal(presence, expected.notna() & (expected != 0))
+
+def test_memo_chunked():
+    path = os.path.join(PATH_TEST_RESOURCES, "test_table_clean.csv")
+    expected = import_data.import_memo_quant_table(path)
+    pd.testing.assert_frame_equal(import_data.import_memo_quant_table(path, chunksize=2), expected.astype(float))
+
+def test_xcms_chunked(tmp_path):
+    table = pd.DataFrame(
+        [[100.1, 5.2, 1, 0, np.nan], [200.2, 6.1, 0, 2.5, 3], [300.3, 7.4, np.nan, 4, 0]],
+        index=['FT001', 'FT002', 'FT003'], columns=['mzmed', 'rtmed', 'a.mzML', 'b.mzML', 'c.mzML']
+        )
+    table.to_csv(tmp_path / "xcms.tsv", sep='\t')
+    expected = import_data.import_xcms_quant_table(tmp_path / "xcms.tsv")
+    assert list(expected.columns) == [1, 2, 3] and list(expected.index) == ['a.mzML', 'b.mzML', 'c.mzML']
+    pd.testing.assert_frame_equal(import_data.import_xcms_quant_table(tmp_path / "xcms.tsv", chunksize=2), expected)
+
+def test_msdial_chunked(tmp_path):
+    lines = [
+        "\tMS2\tClass\tA\tA\tNA\n", "\t\tFile type\tSample\tSample\tAverage\n",
+        "Alignment ID\tMS/MS spectrum\tAverage Rt(min)\ts1\ts2\tAverage\n",
+        "0\t10:1 20:2\t1.5\t0\t12\t6\n", "1\t10:1\t2.5\t7\t0\t3.5\n", "2\t\t3.5\t1\t1\t1\n"
+        ]
+    (tmp_path / "msdial.tsv").write_text(''.join(lines))
+    expected = import_data.import_msdial_quant_table(tmp_path / "msdial.tsv")
+    table = import_data.import_msdial_quant_table(tmp_path / "msdial.tsv", dtype=np.float64, chunksize=2)
+    assert list(table.index) == list(expected.index) == ['Average Rt(min)', 's1', 's2', 'Average']
+    np.testing.assert_array_equal(table.to_numpy(), expected.to_numpy(dtype=float))
+    pd.testing.assert_index_equal(table.columns, expected.columns)
+    assert list(table.columns) == ['0', '1', '2'], "Expected the features ids as strings, as in the default import"
+    pd.testing.assert_frame_equal(table, expected.astype(float))
+
+def test_memo_matrix_from_presence():
+    filename_table = os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv")
+    spectra = memo.SpectraDocuments(os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf"), keep_spectra=False)
+    expected = memo.MemoMatrix()
+    expected.memo_from_aligned_samples(memo.FeatureTable(filename_table, software="mzmine"), spectra)
+    container = memo.MemoMatrix()
+    container.memo_from_aligned_samples(memo.FeatureTable(filename_table, software="mzmine", dtype=bool), spectra)
+    pd.testing.assert_frame_equal(container.memo_matrix, expected.memo_matrix)
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import pandas as pd
+import pytest
+from memo_ms import instrumentation
+from memo_ms.classes import FeatureTable, MemoMatrix, SpectraDocuments
+
+PATH_TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+PATH_SPECTRA = os.path.join(PATH_TEST_DATA, 'test_spectra.mgf')
+PATH_TABLE = os.path.join(PATH_TEST_DATA, 'test_table_mzmine.csv')
+
+
+def test_stage_disabled():
+    assert not instrumentation.enabled()
+    with instrumentation.stage('stage', items=1) as record:
+        record.count(items=2)
+    values = [1, 2]
+    assert instrumentation.timed(values, 'stage', count='items') is values
+    assert instrumentation.disable() is None
+
+def test_stage_records():
+    with instrumentation.profile() as report:
+        with instrumentation.stage('outer', items=1) as outer:
+            outer.count(items=2)
+            with instrumentation.stage('inner'):
+                sum(range(10**5))
+            values = list(instrumentation.timed(range(5), 'streamed', count='items', total=lambda item: item))
+    assert values == list(range(5))
+    assert [record.name for record in report.stages] == ['inner', 'streamed', 'outer']
+    inner, streamed, outer = report.stages
+    assert inner.parent == 'outer' and streamed.parent == 'outer' and outer.parent is None
+    assert outer.counts == {'items': 3}
+    assert streamed.counts == {'items': 5, 'total': 10}
+    assert outer.wall_time >= inner.wall_time > 0
+    assert outer.cpu_time >= 0
+    if instrumentation.resource is not None:
+        assert outer.peak_rss > 0 and outer.peak_rss_increase >= 0
+    assert not instrumentation.enabled()
+
+def test_timed_only_accounts_production():
+    def slow_consumer():
+        for _ in instrumentation.timed(range(3), 'streamed'):
+            sum(range(10**6))
+    with instrumentation.profile() as report:
+        with instrumentation.stage('total'):
+            slow_consumer()
+    streamed, total = report.stages
+    assert streamed.wall_time < total.wall_time / 10
+
+def test_stage_exception():
+    with instrumentation.profile() as report:
+        with pytest.raises(ValueError):
+            with instrumentation.stage('failing'):
+                raise ValueError
+        with instrumentation.stage('next'):
+            pass
+    assert [(record.name, record.parent) for record in report.stages] == [('failing', None), ('next', None)]
+
+@pytest.mark.parametrize('engine', ['matchms', 'numpy'])
+def test_pipeline_report(engine):
+    with instrumentation.profile() as report:
+        spectra = SpectraDocuments(PATH_SPECTRA, engine=engine, keep_spectra=False)
+        memo_matrix = MemoMatrix()
+        memo_matrix.memo_from_aligned_samples(FeatureTable(PATH_TABLE, software='mzmine'), spectra)
+        memo_matrix.filter(max_rel_occurence=0.9)
+    summary = report.summary()
+    parse = 'mgf.parse_mgf' if engine == 'numpy' else 'import_data.parse_mgf'
+    filtering = 'mgf.filter_spectra' if engine == 'numpy' else 'import_data.filter_spectra'
+    for name in [parse, filtering, 'import_data.spectra_words', 'SpectraDocuments.build_table', 'SpectraDocuments',
+                 'FeatureTable', 'sparse.flatten_documents', 'sparse.count_words', 'sparse.order_words',
+                 'MemoMatrix.to_dense', 'MemoMatrix.memo_from_aligned_samples', 'filter_table']:
+        assert name in summary.index
+    assert summary.loc[parse, 'spectra_in'] >= summary.loc[filtering, 'spectra_out']
+    assert summary.loc[filtering, 'spectra_out'] == summary.loc['SpectraDocuments', 'spectra'] == len(spectra.document)
+    assert summary.loc['SpectraDocuments', 'words'] == spectra.document['documents'].map(len).sum()
+    assert summary.loc['MemoMatrix.memo_from_aligned_samples', 'samples'] == memo_matrix.memo_matrix.shape[0]
+    assert summary.loc['MemoMatrix.memo_from_aligned_samples', 'words'] == memo_matrix.memo_matrix.shape[1]
+    assert summary.loc['filter_table', 'columns_in'] == memo_matrix.memo_matrix.shape[1]
+
+def test_report_json_and_logs(tmp_path, caplog):
+    with caplog.at_level(logging.INFO, logger='memo_ms.instrumentation'):
+        with instrumentation.profile(json_logs=True) as report:
+            with instrumentation.stage('stage', items=4):
+                pass
+    assert json.loads(caplog.records[0].getMessage())['counts'] == {'items': 4}
+    path = tmp_path / 'report.json'
+    report.to_json(path)
+    with open(path, encoding='utf8') as handle:
+        records = json.load(handle)
+    assert records[0]['name'] == 'stage' and records[0]['counts'] == {'items': 4}
+    frame = report.to_frame()
+    assert list(frame.columns) == ['name', 'parent', 'wall_time', 'cpu_time', 'peak_rss', 'peak_rss_increase', 'items']
+    assert isinstance(instrumentation.Report().to_frame(), pd.DataFrame)
@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+
+HEAVY_MODULES = ["plotly", "matplotlib", "skbio", "cimcb_lite", "spec2vec", "matchms"]
+
+
+def imported_modules(code):
+    script = f"import sys\n{code}\nprint(' '.join(sys.modules))"
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return {module.split('.')[0] for module in output.split()}
+
+def test_import_does_not_load_heavy_dependencies():
+    modules = imported_modules("import memo_ms")
+    assert modules.isdisjoint(HEAVY_MODULES), \
+        f"Expected {sorted(modules.intersection(HEAVY_MODULES))} to be imported on first use only"
+
+def test_lazy_modules_are_loaded_on_first_use():
+    modules = imported_modules("import memo_ms\nmemo_ms.visualization.plot_pcoa_2d")
+    assert {"plotly", "skbio"}.issubset(modules), "Expected visualization dependencies to be loaded"
@@ -0,0 +1,105 @@
+import os
+import numpy as np
+import pytest
+import memo_ms as memo
+
+
+PATH_ROOT = os.path.dirname((__file__))
+PATH_TEST_RESOURCES = os.path.join(PATH_ROOT, 'test_data')
+PATH_DATA = os.path.join(os.path.dirname(PATH_ROOT), 'data', 'qe_qtof_coanalysis')
+
+
+def test_iter_mgf():
+    filename = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+    spectra = list(memo.mgf.iter_mgf(filename))
+    assert len(spectra) == 3, "Expected 3 spectra"
+    metadata, mz, intensities = spectra[0]
+    assert metadata['scans'] == '1', "Expected different scan number"
+    assert metadata['pepmass'] == (338.342, None), "Expected different pepmass"
+    assert metadata['precursor_mz'] == 338.342, "Expected different precursor m/z"
+    assert metadata['charge'] == 1, "Expected different charge"
+    assert mz.shape == intensities.shape, "Expected one intensity per peak"
+    assert np.all(np.diff(mz) >= 0), "Expected peaks sorted by m/z"
+
+def filter_peaks(mz, intensities, precursor_mz, min_relative_intensity, max_relative_intensity,
+                 loss_mz_from, loss_mz_to, n_required):
+    """Reference implementation of the matchms filters for one spectrum: kept peaks and losses m/z, or None"""
+    if mz.size > 0:
+        max_intensity = intensities.max()
+        if max_intensity <= 0:
+            return None
+        normalized_intensities = intensities / max_intensity
+        mz = mz[(min_relative_intensity <= normalized_intensities) & (normalized_intensities <= max_relative_intensity)]
+    if mz.size < n_required:
+        return None
+    if precursor_mz:
+        losses_mz = (precursor_mz - mz)[::-1]
+        losses_mz = losses_mz[(losses_mz >= loss_mz_from) & (losses_mz <= loss_mz_to)]
+    else:
+        losses_mz = np.empty(0)
+    return mz, losses_mz
+
+def test_filter_batch():
+    mz = np.array([100.0, 150.0, 200.0])
+    intensities = np.array([0.5, 0.005, 2.0])
+    offsets = np.array([0, 3])
+    kept, peaks_mz, peaks_offsets, losses_mz, losses_offsets = memo.mgf.filter_batch(
+        mz, intensities, offsets, [250.0], 0.01, 1.0, 10, 200, 2
+        )
+    np.testing.assert_array_equal(kept, [True])
+    np.testing.assert_array_equal(peaks_mz, [100.0, 200.0])
+    np.testing.assert_array_equal(peaks_offsets, [0, 2])
+    np.testing.assert_array_equal(losses_mz, [50.0, 150.0])
+    np.testing.assert_array_equal(losses_offsets, [0, 2])
+    kept = memo.mgf.filter_batch(mz, intensities, offsets, [250.0], 0.01, 1.0, 10, 200, 3)[0]
+    np.testing.assert_array_equal(kept, [False], "Expected spectrum to be rejected")
+
+@pytest.mark.parametrize("n_required", [0, 3])
+def test_filter_batch_matches_filter_peaks(n_required):
+    rng = np.random.default_rng(0)
+    spectra = []
+    for i in range(60):
+        mz = np.sort(rng.uniform(50, 500, rng.integers(0, 12)))
+        intensities = rng.uniform(0, 100, mz.size) * (i % 7 != 0)  # some spectra without positive intensity
+        precursor_mz = [None, 0, 300.0, 450.5][i % 4]
+        spectra.append(({'precursor_mz': precursor_mz}, mz, intensities))
+    arguments = (0.05, 0.9, 10, 200, n_required)
+    for metadata, mz, intensities, offsets in memo.mgf.iter_batches(spectra, batch_size=25):
+        precursor_mz = [np.nan if spectrum['precursor_mz'] is None else spectrum['precursor_mz'] for spectrum in metadata]
+        kept, peaks_mz, peaks_offsets, losses_mz, losses_offsets = memo.mgf.filter_batch(mz, intensities, offsets, precursor_mz, *arguments)
+        expected = [
+            filter_peaks(mz[start:stop], intensities[start:stop], spectrum['precursor_mz'], *arguments)
+            for spectrum, start, stop in zip(metadata, offsets[:-1], offsets[1:])
+            ]
+        np.testing.assert_array_equal(kept, [peaks is not None for peaks in expected])
+        for i, (expected_peaks, expected_losses) in enumerate(peaks for peaks in expected if peaks is not None):
+            np.testing.assert_array_equal(peaks_mz[peaks_offsets[i]:peaks_offsets[i + 1]], expected_peaks)
+            np.testing.assert_array_equal(losses_mz[losses_offsets[i]:losses_offsets[i + 1]], expected_losses)
+
+@pytest.mark.parametrize("filename, kwargs", [
+    (os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf"), {}),
+    (os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf"), {"n_decimals": 3, "losses_to": 0}),
+    (os.path.join(PATH_DATA, "qtof_spectra_nogapF.mgf"), {"min_peaks_required": 5}),
+])
+def test_numpy_engine_matches_matchms(filename, kwargs):
+    spectra = memo.SpectraDocuments(filename, **kwargs)
+    spectra_numpy = memo.SpectraDocuments(filename, engine="numpy", **kwargs)
+    assert spectra_numpy.spectra is None, "Expected no spectra to be kept"
+    for column in ["scans", "precursor_mz", "documents"]:
+        assert spectra.document[column].to_list() == spectra_numpy.document[column].to_list(), \
+            f"Expected same {column} with numpy and matchms engines"
+
+def test_numpy_engine_matches_matchms_binned():
+    filename = os.path.join(PATH_DATA, "qtof_spectra_nogapF.mgf")
+    spectra = memo.SpectraDocuments(filename, min_peaks_required=5, word_encoding="binned")
+    spectra_numpy = memo.SpectraDocuments(filename, min_peaks_required=5, word_encoding="binned", engine="numpy")
+    assert len(spectra.document) == len(spectra_numpy.document), "Expected same spectra"
+    for documents, documents_numpy in zip(spectra.document["documents"], spectra_numpy.document["documents"]):
+        np.testing.assert_array_equal(documents, documents_numpy)
+
+def test_memo_matrix_from_unaligned_numpy_engine():
+    container = memo.MemoMatrix()
+    container.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"))
+    container_numpy = memo.MemoMatrix()
+    container_numpy.memo_from_unaligned_samples(os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned"), engine="numpy")
+    assert container.memo_matrix.equals(container_numpy.memo_matrix), "Expected same MEMO matrix with both engines"
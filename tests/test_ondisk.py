@@ -0,0 +1,113 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+import scipy.spatial.distance
+import memo_ms as memo
+from memo_ms import distances
+from memo_ms import ondisk
+from memo_ms import parallel
+from memo_ms import sparse
+
+
+PATH_ROOT = os.path.dirname((__file__))
+PATH_TEST_RESOURCES = os.path.join(PATH_ROOT, 'test_data')
+
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(0)
+    counts = scipy.sparse.random(
+        50, 200, density=0.1, random_state=1, data_rvs=lambda size: rng.integers(1, 6, size).astype(float)
+        ).toarray()
+    counts[7] = 0
+    index = pd.Index([f"blank_{i}" if i % 10 == 0 else f"sample_{i}" for i in range(50)], name='filename')
+    return sparse.SparseTable(counts, index, [f"peak@{i}" for i in range(200)])
+
+def test_disk_matrix(table, tmp_path):
+    matrix = ondisk.write(table, tmp_path / "matrix", block_size=7)
+    assert ondisk.is_disk_matrix(tmp_path / "matrix")
+    assert matrix.shape == table.shape and matrix.nnz == table.nnz
+    assert isinstance(matrix.data, np.memmap)
+    pd.testing.assert_frame_equal(matrix.to_dense(), table.to_dense())
+    pd.testing.assert_frame_equal(matrix.rows(10, 20).to_dense(), table.to_dense().iloc[10:20])
+    pd.testing.assert_frame_equal(matrix.take([30, 2, 7]).to_dense(), table.to_dense().iloc[[30, 2, 7]])
+    rows = np.arange(50) % 3 == 0
+    np.testing.assert_array_equal(matrix.occurences(rows=rows, block_size=8), table.occurences(rows=rows))
+    assert len(pickle.dumps(matrix)) < 1000, "Expected the memory maps not to be pickled"
+    pd.testing.assert_frame_equal(pickle.loads(pickle.dumps(matrix)).to_dense(), table.to_dense())
+
+    matrix.to_csv(tmp_path / "disk.csv", chunksize=8)
+    table.to_csv(tmp_path / "sparse.csv")
+    assert (tmp_path / "disk.csv").read_text() == (tmp_path / "sparse.csv").read_text()
+    container = memo.MemoMatrix()
+    container.memo_matrix = matrix
+    container.export_matrix(tmp_path / "disk.npz")
+    pd.testing.assert_frame_equal(sparse.load_npz(tmp_path / "disk.npz").to_dense(), table.to_dense())
+
+@pytest.mark.parametrize('to_disk', [False, True])
+@pytest.mark.parametrize('parameters', [
+    {'use_samples_pattern': True, 'samples_pattern': 'blank', 'max_occurence': 0},
+    {'use_samples_pattern': True, 'samples_pattern': 'blank'},
+    {'min_rel_occurence': 0.1, 'max_rel_occurence': 0.2}
+    ])
+def test_filter(table, tmp_path, parameters, to_disk):
+    container = memo.MemoMatrix()
+    container.memo_matrix = ondisk.write(table, tmp_path / "matrix")
+    disk_dir = tmp_path / "filtered" if to_disk else None
+    filtered = container.filter(disk_dir=disk_dir, **parameters).memo_matrix
+    assert isinstance(filtered, ondisk.DiskMatrix if to_disk else sparse.SparseTable)
+    expected = sparse.filter_table(table, **parameters)
+    pd.testing.assert_frame_equal(filtered.to_dense(), expected.to_dense())
+
+@pytest.mark.parametrize("metric", distances.METRICS)
+def test_distances(table, tmp_path, metric):
+    matrix = ondisk.write(table, tmp_path / "matrix")
+    dense = table.to_dense().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = scipy.spatial.distance.pdist(dense, metric)
+    np.testing.assert_allclose(distances.pdist(matrix, metric, block_size=16), expected, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(
+        distances.distances_from(matrix, [3, 40], metric), scipy.spatial.distance.squareform(expected)[[3, 40]],
+        rtol=1e-12, atol=1e-12
+        )
+
+@pytest.mark.parametrize('word_encoding', ['string', 'binned'])
+def test_memo_matrix_from_unaligned_on_disk(tmp_path, word_encoding):
+    path = os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned")
+    expected = memo.MemoMatrix(sparse=True)
+    expected.memo_from_unaligned_samples(path, word_encoding=word_encoding)
+    container = memo.MemoMatrix()
+    container.memo_from_unaligned_samples(path, word_encoding=word_encoding, disk_dir=tmp_path / "matrix", shard_size=2)
+    assert isinstance(container.memo_matrix, ondisk.DiskMatrix)
+    assert not os.path.exists(tmp_path / "matrix" / "shards"), "Expected the shards to be removed"
+    pd.testing.assert_frame_equal(container.memo_matrix.to_dense(), expected.memo_matrix.to_dense())
+    pd.testing.assert_frame_equal(ondisk.DiskMatrix(tmp_path / "matrix").to_dense(), expected.memo_matrix.to_dense())
+
+def test_merge_memos(table, tmp_path):
+    on_disk = memo.MemoMatrix(sparse=True)
+    on_disk.memo_matrix = ondisk.write(table, tmp_path / "matrix")
+    in_memory = memo.MemoMatrix(sparse=True)
+    in_memory.memo_matrix = sparse.from_dense(table.to_dense().rename(index=lambda sample: f"other_{sample}"))
+    merged = memo.merge_memos([on_disk, in_memory])
+    assert isinstance(merged.memo_matrix, sparse.SparseTable)
+    expected = pd.concat([table.to_dense(), in_memory.memo_matrix.to_dense()])
+    pd.testing.assert_frame_equal(merged.memo_matrix.to_dense(), expected)
+
+def test_memo_matrix_from_unaligned_on_disk_single_pool(tmp_path, monkeypatch):
+    pools = []
+    class CountingPool(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(parallel, 'ProcessPoolExecutor', CountingPool)
+    path = os.path.join(PATH_TEST_RESOURCES, "test_mgf_unaligned")
+    container = memo.MemoMatrix()
+    container.memo_from_unaligned_samples(path, engine='numpy', disk_dir=tmp_path / "matrix", shard_size=2, n_jobs=2)
+    assert len(pools) == 1, "Expected one process pool for all the shards"
+    expected = memo.MemoMatrix(sparse=True)
+    expected.memo_from_unaligned_samples(path, engine='numpy')
+    pd.testing.assert_frame_equal(container.memo_matrix.to_dense(), expected.memo_matrix.to_dense())
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import scipy.spatial
+import scipy.spatial.distance
+from skbio.stats.ordination import pcoa
+from memo_ms import distances
+from memo_ms import ordination
+
+
+def simulated_counts(n_samples):
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 4, n_samples)
+    profiles = rng.gamma(0.3, 5, size=(4, 500)) * (rng.random((4, 500)) < 0.2)
+    return rng.poisson(profiles[groups] * rng.uniform(0.5, 2, (n_samples, 1))).astype(float)
+
+@pytest.fixture
+def dm():
+    return distances.pdist(simulated_counts(80), 'euclidean')
+
+def assert_same_axes(samples, expected):
+    # eigenvectors are defined up to their sign
+    signs = np.sign((samples * expected).sum(axis=0))
+    np.testing.assert_allclose(samples * signs, expected, atol=1e-6)
+
+@pytest.mark.parametrize("method", ["eigsh", "randomized"])
+def test_pcoa_matches_skbio(dm, method):
+    expected = pcoa(dm)
+    results = ordination.pcoa(dm, n_components=3, method=method)
+    assert results.samples.shape == (80, 3), "Expected only the requested axes"
+    assert results.samples.columns.to_list() == ["PC1", "PC2", "PC3"], "Expected skbio axis labels"
+    assert_same_axes(results.samples.values, expected.samples.values[:, :3])
+    np.testing.assert_allclose(results.eigvals.values, expected.eigvals.values[:3])
+    np.testing.assert_allclose(results.proportion_explained.values, expected.proportion_explained.values[:3])
+
+def test_pcoa_eigh_is_skbio(dm):
+    results = ordination.pcoa(dm, n_components=2)
+    np.testing.assert_array_equal(results.samples.values, pcoa(dm).samples.values[:, :2])
+
+def test_landmark_pcoa(dm):
+    square = scipy.spatial.distance.squareform(dm)
+    expected = ordination.pcoa(dm, n_components=3, method='eigsh')
+    landmarks = np.arange(80)
+    results = ordination.landmark_pcoa(square[landmarks], landmarks, n_components=3)
+    assert_same_axes(results.samples.values, expected.samples.values)
+    np.testing.assert_allclose(results.proportion_explained.values, expected.proportion_explained.values)
+
+    landmarks = np.arange(0, 80, 2)
+    results = ordination.landmark_pcoa(square[landmarks], landmarks, n_components=3)
+    _, _, disparity = scipy.spatial.procrustes(results.samples.values, expected.samples.values)
+    assert disparity < 0.05, "Expected landmark coordinates close to the exact ones"
+
+@pytest.mark.parametrize("method", ["eigsh", "randomized", "landmark"])
+def test_proportion_explained_with_negative_eigenvalues(method):
+    dm = distances.pdist(simulated_counts(300), 'braycurtis')
+    expected = pcoa(dm).proportion_explained.values[:3]
+    if method == 'landmark':
+        square = scipy.spatial.distance.squareform(dm)
+        results = ordination.landmark_pcoa(square, np.arange(300), n_components=3)
+    else:
+        results = ordination.pcoa(dm, n_components=3, method=method)
+    # the sum of the negative eigenvalues is estimated by eigsh and randomized
+    np.testing.assert_allclose(results.proportion_explained.values, expected, rtol=1e-3)
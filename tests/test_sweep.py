@@ -0,0 +1,43 @@
+import os
+import pandas as pd
+import pytest
+import memo_ms as memo
+from memo_ms import parallel
+
+
+PATH_ROOT = os.path.dirname((__file__))
+PATH_TEST_RESOURCES = os.path.join(PATH_ROOT, 'test_data')
+PATH_SPECTRA = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+GRID = {'n_decimals': [1, 2], 'min_relative_intensity': [0.01, 0.1], 'losses_to': [100, 200]}
+
+
+@pytest.mark.parametrize('n_jobs, executor', [(1, None), (2, None), (1, parallel.SerialExecutor())])
+def test_parameter_sweep_documents(n_jobs, executor):
+    results = memo.parameter_sweep(PATH_SPECTRA, GRID, n_jobs=n_jobs, executor=executor)
+    assert list(results) == [
+        (n_decimals, min_relative_intensity, losses_to)
+        for n_decimals in GRID['n_decimals'] for min_relative_intensity in GRID['min_relative_intensity']
+        for losses_to in GRID['losses_to']
+        ]
+    for (n_decimals, min_relative_intensity, losses_to), spectra in results.items():
+        expected = memo.SpectraDocuments(
+            PATH_SPECTRA, n_decimals=n_decimals, min_relative_intensity=min_relative_intensity,
+            losses_to=losses_to, engine='numpy'
+            )
+        assert spectra.peak_store is None and spectra.engine == 'numpy'
+        pd.testing.assert_frame_equal(spectra.document, expected.document)
+
+def test_parameter_sweep_memo_matrices():
+    table = memo.FeatureTable(os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv"), software="mzmine")
+    grid = {'n_decimals': [1, 2], 'word_encoding': ['string', 'binned']}
+    results = memo.parameter_sweep(PATH_SPECTRA, grid, feature_table=table, n_jobs=2)
+    assert set(results) == {(1, 'string'), (1, 'binned'), (2, 'string'), (2, 'binned')}
+    for (n_decimals, word_encoding), memo_matrix in results.items():
+        spectra = memo.SpectraDocuments(PATH_SPECTRA, n_decimals=n_decimals, word_encoding=word_encoding, engine='numpy')
+        expected = memo.MemoMatrix(sparse=True)
+        expected.memo_from_aligned_samples(table, spectra)
+        pd.testing.assert_frame_equal(memo_matrix.memo_matrix.to_dense(), expected.memo_matrix.to_dense())
+
+def test_parameter_sweep_unknown_parameter():
+    with pytest.raises(ValueError):
+        memo.parameter_sweep(PATH_SPECTRA, {'engine': ['numpy']})
@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+import scipy as sp
+from matplotlib.figure import Figure
+from scipy.cluster.hierarchy import linkage
+from memo_ms import sparse
+from memo_ms import visualization
+
+
+@pytest.fixture
+def analysis():
+    rng = np.random.default_rng(42)
+    matrix = pd.DataFrame(
+        rng.integers(0, 5, size=(6, 20)).astype(float),
+        index=[f"sample_{i}" for i in range(6)], columns=[f"peak@{i}.00" for i in range(20)]
+        )
+    df_metadata = pd.DataFrame({
+        'filename': ["sample_5", "sample_1", "sample_3", "sample_0", "sample_2", "unknown"],
+        'group': ["a", "b", "a", "b", "a", "b"]
+        })
+    return visualization.PreparedAnalysis(matrix, df_metadata, 'filename')
+
+def test_prepared_analysis_matches_metadata(analysis):
+    assert analysis.matrix.index.to_list() == ["sample_5", "sample_1", "sample_3", "sample_0", "sample_2"], \
+        "Expected samples in metadata order"
+    assert analysis.df_metadata.shape == (5, 2), "Expected samples missing from matrix to be removed"
+
+def test_prepared_analysis_memoizes_results(analysis):
+    distances = analysis.distances('braycurtis', norm=True)
+    expected = sp.spatial.distance.pdist(analysis.matrix.div(analysis.matrix.sum(axis=1), axis=0), 'braycurtis')
+    np.testing.assert_allclose(distances, expected, rtol=1e-12)
+    assert analysis.distances('braycurtis', norm=True) is distances, "Expected memoized distances"
+    assert analysis.pcoa('braycurtis', norm=True) is analysis.pcoa('braycurtis', norm=True), "Expected memoized PCoA"
+    np.testing.assert_allclose(analysis.linkage('ward', 'euclidean'), linkage(analysis.matrix, 'ward', 'euclidean'), rtol=1e-12)
+    assert visualization.prepare(analysis, None, None) is analysis, "Expected the analysis to be reused"
+
+def test_prepared_analysis_sparse_matrix(analysis):
+    table = sparse.from_dense(analysis.matrix)
+    sparse_analysis = visualization.PreparedAnalysis(table, analysis.df_metadata, 'filename')
+    assert sparse_analysis.matrix.index.equals(analysis.matrix.index), "Expected samples in metadata order"
+    np.testing.assert_allclose(
+        sparse_analysis.distances('braycurtis', norm=True), analysis.distances('braycurtis', norm=True), rtol=1e-12
+        )
+    np.testing.assert_allclose(
+        sparse_analysis.preprocessed(norm=True, scaling=True), analysis.preprocessed(norm=True, scaling=True)
+        )
+
+def test_prepared_analysis_ward_requires_euclidean(analysis):
+    with pytest.raises(ValueError):
+        analysis.linkage('ward', 'braycurtis')
+
+@pytest.mark.parametrize("method", ["eigsh", "randomized", "landmark"])
+def test_prepared_analysis_approximate_pcoa(analysis, method):
+    results = analysis.pcoa('braycurtis', method=method, n_components=2, n_landmarks=4)
+    assert results.samples.shape == (5, 2), "Expected only the requested PCs"
+    assert analysis.pcoa('braycurtis', method=method, n_components=2, n_landmarks=4) is results, \
+        "Expected memoized PCoA"
+    with pytest.raises(ValueError):
+        analysis.pcoa('braycurtis', method='svd')
+
+@pytest.mark.parametrize("plot", ["plot_pcoa_2d", "plot_pcoa_3d", "plot_heatmap"])
+def test_plotly_figures_are_returned_and_written(tmp_path, analysis, plot):
+    path = tmp_path / "figure.html"
+    fig = getattr(visualization, plot)(analysis, None, None, 'group', output_path=path)
+    assert isinstance(fig, go.Figure), "Expected the figure to be returned"
+    assert path.stat().st_size > 0, "Expected the figure to be written"
+
+@pytest.mark.parametrize("linkage_method", ["ward", "centroid", "median"])
+def test_heatmap_rejects_non_euclidean_linkage(analysis, linkage_method):
+    with pytest.raises(ValueError, match="linkage_metric"):
+        visualization.plot_heatmap(
+            analysis, None, None, 'group', linkage_method=linkage_method, linkage_metric='braycurtis', show=False
+            )
+    fig = visualization.plot_heatmap(
+        analysis, None, None, 'group', linkage_method='average', linkage_metric='braycurtis', show=False
+        )
+    assert isinstance(fig, go.Figure), "Expected non euclidean metrics to be accepted by the other methods"
+
+def test_hca_figure_is_returned_and_written(tmp_path, analysis):
+    path = tmp_path / "hca.svg"
+    fig = visualization.plot_hca(analysis, None, None, 'group', output_path=path)
+    assert isinstance(fig, Figure), "Expected the figure to be returned"
+    assert path.read_text().startswith("<?xml"), "Expected a svg figure"
+
+def test_pcoa_hover_decimation(analysis):
+    fig = visualization.plot_pcoa_2d(analysis, None, None, 'group', show=False, max_hover_samples=2)
+    names = [name for trace in fig.data for name in trace.hovertext]
+    assert sum(name != '' for name in names) == 2, "Expected hover names of 2 samples only"
+
+def test_render_batch(tmp_path, analysis):
+    matrices = {'first': analysis.matrix, 'second': analysis.matrix.iloc[:4]}
+    paths = visualization.render_batch(
+        matrices, analysis.df_metadata, 'filename', 'group', tmp_path / "plots",
+        plot_kwargs={'pcoa_2d': {'pcoa_method': 'eigsh'}}
+        )
+    assert sorted(paths) == ['first', 'second'], "Expected plots for each matrix"
+    for files in paths.values():
+        assert [os.path.basename(path).split('_', 1)[1] for path in files] == ['pcoa_2d.html', 'hca.svg', 'heatmap.html']
+        assert all(os.path.exists(path) for path in files), "Expected plots to be written"
+    assert (tmp_path / "plots" / "plotly.min.js").exists(), "Expected plotly.js to be shared by the html files"
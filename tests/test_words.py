@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pandas as pd
+import memo_ms as memo
+
+
+PATH_ROOT = os.path.dirname((__file__))
+PATH_TEST_RESOURCES = os.path.join(PATH_ROOT, 'test_data')
+
+
+def test_encode_decode():
+    peaks_mz = np.array([71.0494, 100.005, 445.1139])
+    losses_mz = np.array([18.0106])
+    word_ids = memo.words.encode(peaks_mz, losses_mz, 2)
+    assert word_ids.dtype == np.int64, "Expected integer word ids"
+    assert memo.words.decode(word_ids, 2) == ["peak@71.05", "peak@100.00", "peak@445.11", "loss@18.01"], \
+        "Expected different words"
+
+def test_bin_mz_matches_string_words():
+    mz = np.random.default_rng(42).uniform(50, 1000, 10000).round(3)
+    for n_decimals in [1, 2, 3]:
+        expected = [f"peak@{x:.{n_decimals}f}" for x in mz]
+        assert memo.words.decode(memo.words.encode(mz, None, n_decimals), n_decimals) == expected, \
+            "Expected same words as string formatting"
+
+def test_spectra_documents_binned():
+    filename = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+    spectra = memo.SpectraDocuments(filename)
+    for engine in ["matchms", "numpy"]:
+        spectra_binned = memo.SpectraDocuments(filename, engine=engine, word_encoding="binned")
+        decoded = [memo.words.decode(doc, 2) for doc in spectra_binned.document.documents]
+        assert decoded == spectra.document.documents.to_list(), "Expected same words once decoded"
+
+def test_memo_matrix_binned():
+    filename_table = os.path.join(PATH_TEST_RESOURCES, "test_table_mzmine.csv")
+    filename_spectra = os.path.join(PATH_TEST_RESOURCES, "test_spectra.mgf")
+    table = memo.FeatureTable(filename_table, software="mzmine")
+    container = memo.MemoMatrix()
+    container.memo_from_aligned_samples(table, memo.SpectraDocuments(filename_spectra))
+    container_binned = memo.MemoMatrix(sparse=True)
+    container_binned.memo_from_aligned_samples(table, memo.SpectraDocuments(filename_spectra, word_encoding="binned"))
+    assert container_binned.memo_matrix.columns.dtype == np.int64, "Expected word ids as columns"
+    pd.testing.assert_frame_equal(container_binned.memo_matrix.to_dense(), container.memo_matrix)